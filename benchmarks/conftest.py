@@ -0,0 +1,59 @@
+""" 基准测试夹具.
+基于SQLite内存库, 预置 `ROWS` 条数据, 各基准测试共享同一应用.
+"""
+import logging
+import random
+
+import pytest
+from benchmarks.models import Book
+from benchmarks.models import BookResource
+from lesoon_common import LesoonFlask
+
+from lesoon_restful import Api
+
+# 预置数据量
+ROWS = 10000
+
+
+class Config:
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+
+@pytest.fixture(scope='session')
+def app():
+    app = LesoonFlask(__name__, config=Config)
+    app.logger.setLevel(logging.CRITICAL)
+    Api(app).add_resource(BookResource)
+
+    ctx = app.app_context()
+    ctx.push()
+    yield app
+    ctx.pop()
+
+
+@pytest.fixture(scope='session')
+def db(app: LesoonFlask):
+    _db = app.db  # noqa
+    _db.create_all()
+
+    rnd = random.Random(0)
+    _db.session.bulk_insert_mappings(Book, [{
+        'id': i,
+        'title': f'book-{i}',
+        'year_published': rnd.randint(1900, 2021),
+        'rating': rnd.randint(0, 5),
+        'author_id': rnd.randint(1, ROWS // 10)
+    } for i in range(1, ROWS + 1)])
+    _db.session.commit()
+    yield _db
+
+    _db.session.remove()
+    _db.drop_all()
+
+
+@pytest.fixture
+def client(app: LesoonFlask, db):
+    with app.test_client() as client:
+        yield client
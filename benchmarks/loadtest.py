@@ -0,0 +1,353 @@
+""" 压测工具.
+以多线程WSGI服务启动示例应用, 按流量配比并发回放请求,
+输出吞吐量、p50/p95/p99延迟及单请求SQL查询次数.
+
+用法:
+    python -m benchmarks.loadtest --app sqlalchemy --profile read-heavy
+    python -m benchmarks.loadtest --app mongo --mix list=5,read=4,write=1
+
+注意:
+    mongo示例使用mongomock代替MongoDB, 仅用于比较框架自身开销;
+    mongomock不支持命令监听, mongo示例不统计查询次数.
+"""
+import argparse
+import atexit
+import contextlib
+import importlib.util
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+import typing as t
+import uuid
+from collections import defaultdict
+from http.client import HTTPConnection
+from pathlib import Path
+from urllib.parse import urlencode
+
+from werkzeug.serving import make_server
+
+from lesoon_restful.utils.instrument import collect_queries
+from lesoon_restful.utils.instrument import QUERY_COUNT_HEADER
+
+EXAMPLES_DIR = Path(__file__).resolve().parent.parent / 'examples'
+
+# 流量配比: 请求类型 -> 权重
+Mix = t.Dict[str, int]
+
+# 预设流量配比
+PROFILES: t.Dict[str, Mix] = {
+    'read-heavy': {
+        'list': 60,
+        'read': 35,
+        'write': 5
+    },
+    'mixed': {
+        'list': 40,
+        'read': 30,
+        'write': 30
+    },
+    'write-heavy': {
+        'list': 10,
+        'read': 10,
+        'write': 80
+    },
+}
+
+
+class Target:
+    """
+    压测目标应用.
+
+    Attributes:
+        app: Flask应用
+        prefix: 资源路由前缀
+        ids: 预置数据主键
+        count_queries: 是否统计SQL查询次数
+
+    """
+
+    def __init__(self, app, prefix: str, ids: t.List[t.Any],
+                 count_queries: bool):
+        self.app = app
+        self.prefix = prefix
+        self.ids = ids
+        self.count_queries = count_queries
+
+
+def _load_example(name: str):
+    spec = importlib.util.spec_from_file_location(f'examples.{name}',
+                                                  EXAMPLES_DIR / f'{name}.py')
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _book(rnd: random.Random) -> dict:
+    return {
+        'title': f'book-{uuid.uuid4().hex}',
+        'year_published': rnd.randint(1900, 2021),
+        'rating': rnd.randint(0, 5)
+    }
+
+
+def _remove_file(path: str):
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(path)
+
+
+def setup_sqlalchemy(rows: int, database_uri: str = None) -> Target:
+    """ 启动sqlalchemy示例, 默认使用临时SQLite文件库."""
+    if database_uri is None:
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        # 进程退出时删除临时库文件
+        atexit.register(_remove_file, path)
+        database_uri = f'sqlite:///{path}'
+
+    module = _load_example('sqlalchemy_simple')
+    app, db = module.app, module.db
+    app.config.update(SQLALCHEMY_DATABASE_URI=database_uri,
+                      SQLALCHEMY_ECHO=False)
+
+    rnd = random.Random(0)
+    with app.app_context():
+        db.create_all()
+        db.session.bulk_insert_mappings(module.Book,
+                                        [_book(rnd) for _ in range(rows)])
+        db.session.commit()
+        ids = [id_ for id_, in db.session.query(module.Book.id)]
+    return Target(app, module.BookResource.route_prefix, ids, True)
+
+
+def setup_mongo(rows: int) -> Target:
+    """ 启动mongo示例, 以mongomock代替MongoDB."""
+    import mongoengine
+    import mongomock
+
+    module = _load_example('mongo_simple')
+    mongoengine.disconnect()
+    mongoengine.connect('lesoon_loadtest',
+                        host='mongodb://localhost',
+                        mongo_client_class=mongomock.MongoClient)
+
+    rnd = random.Random(0)
+    collection = module.Book._get_collection()  # noqa
+    collection.insert_many([_book(rnd) for _ in range(rows)])
+    ids = [str(id_) for id_ in module.Book.objects.scalar('id')]
+    return Target(module.app, module.BookResource.route_prefix, ids, False)
+
+
+def query_count_middleware(wsgi_app: t.Callable) -> t.Callable:
+    """ 统计每个请求执行的SQL语句数, 通过响应头返回."""
+
+    def middleware(environ, start_response):
+        with collect_queries() as stats:
+
+            def _start_response(status, headers, exc_info=None):
+                headers.append((QUERY_COUNT_HEADER, str(stats.count)))
+                return start_response(status, headers, exc_info)
+
+            return wsgi_app(environ, _start_response)
+
+    return middleware
+
+
+class Recorder:
+    """ 请求结果记录, 按请求类型分组."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies: t.Dict[str, t.List[float]] = defaultdict(list)
+        self.queries: t.Dict[str, t.List[int]] = defaultdict(list)
+        self.errors: t.Dict[str, int] = defaultdict(int)
+
+    def record(self, kind: str, latency: float, status: int,
+               queries: t.Optional[int]):
+        with self._lock:
+            self.latencies[kind].append(latency)
+            if queries is not None:
+                self.queries[kind].append(queries)
+            if status >= 400:
+                self.errors[kind] += 1
+
+
+def percentile(values: t.List[float], p: float) -> float:
+    """ 最近秩法计算百分位数, values需已排序."""
+    if not values:
+        return 0.0
+    index = max(0, min(len(values) - 1, round(p / 100 * len(values)) - 1))
+    return values[index]
+
+
+class Worker(threading.Thread):
+    """ 压测线程, 按权重随机选择请求类型并发送."""
+
+    def __init__(self, target: Target, host: str, port: int, mix: Mix,
+                 deadline: float, recorder: Recorder, seed: int):
+        super().__init__(daemon=True)
+        self.target = target
+        self.host = host
+        self.port = port
+        self.kinds = list(mix)
+        self.weights = list(mix.values())
+        self.deadline = deadline
+        self.recorder = recorder
+        self.rnd = random.Random(seed)
+
+    def _request(self, kind: str) -> t.Tuple[str, str, t.Optional[bytes]]:
+        prefix = self.target.prefix
+        if kind == 'list':
+            rating = self.rnd.randint(0, 5)
+            query = urlencode({
+                'where': json.dumps({'rating': {
+                    '$gte': rating
+                }}),
+                'sort': json.dumps({'year_published': True})
+            })
+            return 'GET', f'{prefix}?{query}', None
+        if kind == 'read':
+            return 'GET', f'{prefix}/{self.rnd.choice(self.target.ids)}', None
+        if kind == 'write':
+            books = [_book(self.rnd) for _ in range(10)]
+            return 'POST', f'{prefix}/batch', json.dumps(books).encode()
+        raise ValueError(f'未知请求类型: {kind}')
+
+    def run(self):
+        while time.perf_counter() < self.deadline:
+            kind = self.rnd.choices(self.kinds, self.weights)[0]
+            method, url, body = self._request(kind)
+            headers = {'Content-Type': 'application/json'} if body else {}
+
+            conn = HTTPConnection(self.host, self.port)
+            started = time.perf_counter()
+            conn.request(method, url, body=body, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            latency = time.perf_counter() - started
+            conn.close()
+
+            count = response.getheader(QUERY_COUNT_HEADER)
+            self.recorder.record(kind, latency, response.status,
+                                 int(count) if count is not None else None)
+
+
+def run(target: Target,
+        mix: Mix,
+        concurrency: int = 8,
+        duration: float = 10.0) -> dict:
+    """
+    执行压测.
+
+    Args:
+        target: 压测目标应用
+        mix: 流量配比, e.g: {'list': 60, 'read': 35, 'write': 5}
+        concurrency: 并发线程数
+        duration: 持续时间(秒)
+
+    Returns:
+        按请求类型及汇总(total)的统计结果
+
+    """
+    wsgi_app = target.app.wsgi_app
+    if target.count_queries:
+        target.app.wsgi_app = query_count_middleware(wsgi_app)
+
+    # 屏蔽访问日志
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, target.app, threaded=True)
+    server_thread = threading.Thread(target=server.serve_forever, daemon=True)
+    server_thread.start()
+
+    recorder = Recorder()
+    started = time.perf_counter()
+    workers = [
+        Worker(target, server.host, server.port, mix, started + duration,
+               recorder, seed) for seed in range(concurrency)
+    ]
+    try:
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        server.shutdown()
+        target.app.wsgi_app = wsgi_app
+
+    def summarize(latencies: t.List[float], queries: t.List[int],
+                  errors: int) -> dict:
+        latencies = sorted(latencies)
+        stats = {
+            'requests': len(latencies),
+            'errors': errors,
+            'rps': round(len(latencies) / elapsed, 1)
+        }
+        for p in (50, 95, 99):
+            stats[f'p{p}_ms'] = round(percentile(latencies, p) * 1000, 2)
+        stats['queries'] = round(sum(queries) /
+                                 len(queries), 2) if queries else None
+        return stats
+
+    report = {
+        kind: summarize(recorder.latencies[kind], recorder.queries[kind],
+                        recorder.errors[kind])
+        for kind in sorted(recorder.latencies)
+    }
+    report['total'] = summarize(
+        [v for values in recorder.latencies.values() for v in values],
+        [v for values in recorder.queries.values() for v in values],
+        sum(recorder.errors.values()))
+    return report
+
+
+def format_report(report: dict) -> str:
+    columns = ('requests', 'errors', 'rps', 'p50_ms', 'p95_ms', 'p99_ms',
+               'queries')
+    lines = ['{:<8}'.format('kind') + ''.join(f'{c:>10}' for c in columns)]
+    for kind, stats in report.items():
+        values = ('-' if stats[c] is None else stats[c] for c in columns)
+        lines.append(f'{kind:<8}' + ''.join(f'{v:>10}' for v in values))
+    return '\n'.join(lines)
+
+
+def parse_mix(value: str) -> Mix:
+    """ 解析流量配比, e.g: "list=6,read=3,write=1"."""
+    mix = {}
+    for item in value.split(','):
+        kind, _, weight = item.partition('=')
+        mix[kind.strip()] = int(weight)
+    return mix
+
+
+def main(argv: t.List[str] = None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--app',
+                        choices=('sqlalchemy', 'mongo'),
+                        default='sqlalchemy')
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='mixed')
+    parser.add_argument('--mix', type=parse_mix, help='自定义流量配比, 覆盖--profile')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--rows', type=int, default=1000, help='预置数据量')
+    parser.add_argument('--database-uri', help='sqlalchemy示例数据库连接串')
+    parser.add_argument('--json', action='store_true', help='以JSON格式输出')
+    args = parser.parse_args(argv)
+
+    if args.app == 'sqlalchemy':
+        target = setup_sqlalchemy(args.rows, args.database_uri)
+    else:
+        target = setup_mongo(args.rows)
+
+    report = run(target,
+                 mix=args.mix or PROFILES[args.profile],
+                 concurrency=args.concurrency,
+                 duration=args.duration)
+    print(json.dumps(report, indent=2) if args.json else format_report(report))
+
+
+if __name__ == '__main__':
+    main()
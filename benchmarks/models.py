@@ -0,0 +1,28 @@
+from lesoon_common.extensions import db
+from marshmallow_sqlalchemy.schema import SQLAlchemyAutoSchema
+
+from lesoon_restful import ModelResource
+
+
+class Book(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    title = db.Column(db.String(), nullable=False)
+    year_published = db.Column(db.Integer)
+    rating = db.Column(db.Integer, default=5)
+    author_id = db.Column(db.Integer)
+
+
+class BookSchema(SQLAlchemyAutoSchema):
+
+    class Meta(SQLAlchemyAutoSchema.Meta):
+        model = Book
+        load_instance = True
+        sqla_session = db.session
+
+
+class BookResource(ModelResource):
+
+    class Meta:
+        name = 'book'
+        model = Book
+        schema = BookSchema
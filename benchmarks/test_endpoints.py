@@ -0,0 +1,68 @@
+""" 端点基准测试, 经由Flask测试客户端完成完整请求."""
+import itertools
+import json
+
+from benchmarks.conftest import ROWS
+from benchmarks.models import Book
+
+
+def test_list(benchmark, client):
+    response = benchmark(client.get, '/book/')
+    assert response.status_code == 200
+
+
+def test_list_filtered(benchmark, client):
+    query_string = {
+        'where': json.dumps({'rating': {
+            '$gte': 1
+        }}),
+        'sort': json.dumps({'year_published': True})
+    }
+    response = benchmark(client.get, '/book/', query_string=query_string)
+    assert response.status_code == 200
+
+
+def test_read(benchmark, client):
+    response = benchmark(client.get, f'/book/{ROWS // 2}/')
+    assert response.status_code == 200
+
+
+def test_create(benchmark, client):
+    response = benchmark(client.post,
+                         '/book/',
+                         json={
+                             'title': 'benchmark',
+                             'year_published': 2021,
+                             'rating': 3
+                         })
+    assert response.status_code == 200
+
+
+def test_update(benchmark, client):
+    ratings = itertools.cycle(range(6))
+
+    def update():
+        return client.put('/book/',
+                          json={
+                              'id': ROWS // 2,
+                              'rating': next(ratings)
+                          })
+
+    response = benchmark(update)
+    assert response.status_code == 200
+
+
+def test_delete(benchmark, client, db):
+    ids = itertools.count(ROWS * 10)
+
+    def setup():
+        id_ = next(ids)
+        db.session.add(Book(id=id_, title='benchmark'))
+        db.session.commit()
+        return (f'/book/{id_}/',), {}
+
+    response = benchmark.pedantic(client.delete,
+                                  setup=setup,
+                                  rounds=200,
+                                  warmup_rounds=10)
+    assert response.status_code == 200
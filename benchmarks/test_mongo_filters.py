@@ -0,0 +1,77 @@
+""" MongoEngine过滤条件编译基准测试: 关键字参数解析与原生查询文档对比."""
+import mongoengine
+import mongomock
+import pytest
+from marshmallow import fields
+from marshmallow import Schema
+
+from lesoon_restful.dbengine.mongoengine.filters import compile_raw_query
+from lesoon_restful.dbengine.mongoengine.service import MongoEngineService
+
+
+class MongoBook(mongoengine.Document):
+    title = mongoengine.StringField()
+    year_published = mongoengine.IntField()
+    rating = mongoengine.IntField()
+
+
+class MongoBookSchema(Schema):
+    id = fields.String()
+    title = fields.String()
+    year_published = fields.Integer()
+    rating = fields.Integer()
+
+
+class MongoBookService(MongoEngineService):
+
+    class Meta:
+        model = MongoBook
+        schema = MongoBookSchema
+
+
+WHERE = {
+    'title': {
+        '$startswith': 'book',
+        '$ne': 'book-0'
+    },
+    'rating': {
+        '$gte': 1,
+        '$lte': 4
+    },
+    'year_published': {
+        '$in': [2000, 2001, 2002]
+    }
+}
+
+
+@pytest.fixture(scope='module')
+def service():
+    mongoengine.connect('lesoon_benchmark',
+                        host='mongodb://localhost',
+                        mongo_client_class=mongomock.MongoClient)
+    yield MongoBookService()
+    mongoengine.disconnect()
+
+
+@pytest.fixture(scope='module')
+def conditions(service):
+    return tuple(service._convert_filters(WHERE))
+
+
+def test_compile_keywords(benchmark, service, conditions):
+
+    def compile_():
+        expression = service._and_expression(
+            [condition() for condition in conditions])
+        return service._query_filter(MongoBook.objects, expression)._query
+
+    assert benchmark(compile_)
+
+
+def test_compile_raw(benchmark, service, conditions):
+
+    def compile_():
+        raw = compile_raw_query(conditions, MongoBook)
+        return MongoBook.objects(__raw__=raw)._query
+
+    assert benchmark(compile_)
@@ -0,0 +1,32 @@
+""" 请求参数解析基准测试."""
+import pytest
+from webargs import fields
+
+from lesoon_restful.parser import WebArgParser
+
+
+class FullParser(WebArgParser):
+    FAST_PARSE = False
+
+
+def make_delete(parser: WebArgParser):
+    # 与 `Resource.delete` 的参数声明一致
+    @parser.use_args({'ids': fields.DelimitedList(fields.Raw())},
+                     location='query',
+                     as_kwargs=True)
+    @parser.use_args({'ids': fields.List(fields.Raw())},
+                     location='list_json',
+                     as_kwargs=True)
+    def delete(ids=None):
+        return ids
+
+    return delete
+
+
+@pytest.mark.parametrize('parser',
+                         [WebArgParser(), FullParser()],
+                         ids=['fast', 'full'])
+def test_parse_delete_args(benchmark, app, parser):
+    delete = make_delete(parser)
+    with app.test_request_context('/book', method='DELETE', json=[1, 2, 3]):
+        assert benchmark(delete) == [1, 2, 3]
@@ -0,0 +1,67 @@
+""" 请求链路各阶段基准测试."""
+import json
+
+import pytest
+from benchmarks.conftest import ROWS
+from benchmarks.models import Book
+from benchmarks.models import BookResource
+from benchmarks.models import BookSchema
+
+from lesoon_restful.filters import convert_filters
+from lesoon_restful.utils.filters import legitimize_where
+
+WHERE = {'rating_gte': 1, 'rating_lte': 4, 'year_published': 2000}
+
+
+def test_legitimize_where(benchmark):
+    result = benchmark(legitimize_where, WHERE)
+    assert set(result) == {'rating', 'year_published'}
+
+
+def test_convert_filters(benchmark, db):
+    field_filters = BookResource.service.filters['rating']
+    value = {'$gte': 1, '$lte': 4}
+    result = benchmark(convert_filters, value, field_filters)
+    assert len(result) == 2
+
+
+def test_parse_request_by_query(benchmark, app, db):
+    service = BookResource.service
+    query_string = {
+        'where': json.dumps({'rating': {
+            '$gte': 1
+        }}),
+        'sort': json.dumps({'rating': True})
+    }
+
+    def parse():
+        with app.test_request_context('/book', query_string=query_string):
+            return service.parse_request_by_query(query=service._page_query())
+
+    page_param = benchmark(parse)
+    assert page_param.where and page_param.sort
+
+
+@pytest.mark.parametrize('size', [20, 100, 1000])
+def test_schema_dump(benchmark, db, size):
+    schema = BookSchema(many=True)
+    items = Book.query.limit(size).all()
+    result = benchmark(schema.dump, items)
+    assert len(result) == size
+
+
+def test_query_paginate(benchmark, db):
+    service = BookResource.service
+    query = service._page_query().filter(Book.rating >= 1)
+    pagination = benchmark(service._query_get_paginated_items,
+                           query,
+                           page=10,
+                           page_size=20,
+                           if_page=True)
+    assert pagination.total < ROWS
+
+
+def test_view_factory(benchmark):
+    route = BookResource.routes['instances']
+    view = benchmark(route.view_factory, 'book_instances', BookResource)
+    assert view.__resource__ is BookResource
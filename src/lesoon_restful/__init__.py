@@ -2,6 +2,7 @@ from webargs import fields as web_fields
 
 from .api import Api
 from .dbengine.alchemy import AlchemyWhere
+from .dbengine.alchemy import AsyncSQLAlchemyService
 from .dbengine.alchemy import SaasAlchemyService
 from .dbengine.alchemy import SQLAlchemyService
 from .dbengine.mongoengine import MongoEngineService
@@ -11,6 +12,7 @@ from .parser import ca_use_args
 from .parser import ca_use_kwargs
 from .parser import use_args
 from .parser import use_kwargs
+from .resource import AsyncModelResource
 from .resource import Include
 from .resource import IncludeMany
 from .resource import ModelResource
@@ -1,17 +1,34 @@
+import inspect
 import typing as t
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from functools import wraps
 
 from flask import Blueprint
+from flask import current_app
 from flask import Flask
 from flask import request
+from lesoon_common.response import Response as ResultResponse
+from werkzeug.test import EnvironBuilder
 from werkzeug.wrappers import Response
 
 from .resource import ModelResource
 from .resource import Resource
+from lesoon_restful.exceptions import InvalidJSON
+from lesoon_restful.exceptions import InvalidParam
+from lesoon_restful.route import is_coroutine_view
 from lesoon_restful.route import Route
 from lesoon_restful.service import Service
 from lesoon_restful.utils.base import unpack
+from lesoon_restful.utils.index_advisor import register_api
+from lesoon_restful.utils.instrument import install_cache_stats
+from lesoon_restful.utils.instrument import instrument_view
+from lesoon_restful.utils.metrics import install as install_metrics
+from lesoon_restful.utils.metrics import metrics_view
+from lesoon_restful.utils.metrics import MetricsRegistry
+from lesoon_restful.utils.profiler import profile_view
+from lesoon_restful.utils.profiler import StackProfiler
+from lesoon_restful.utils.slow_query import get_slow_query_log
 
 
 class Api:
@@ -23,19 +40,52 @@ class Api:
         decorators: 装饰器列表
         prefix: API前缀
         default_service: 默认的service类, 未提供则为:class:`dbengine.alchemy.SQLAlchemyService`
+        batch_rule: 批量请求路由, 未提供则不注册批量请求接口
+        batch_max_workers: 批量请求并发线程数
+        batch_max_requests: 单次批量请求的最大子请求数
+        metrics_rule: Prometheus指标路由, 未提供则不统计路由指标
+        profiler: 调用栈采样分析器, 提供时需同时提供profile_rule
+        profile_rule: 采样分析结果路由
+        slow_query_rule: 慢查询记录路由, 慢查询阈值见 `QueryService.Meta.slow_query_threshold`
+        cache_stats: 是否统计SQL编译缓存命中, 见 `SQLAlchemyService.statement_cache_stats`
 
     """
+    # 子请求转发时忽略的请求头
+    BATCH_EXCLUDE_HEADERS = ('content-length', 'content-type')
 
     def __init__(self,
                  app: t.Union[Flask, Blueprint] = None,
                  decorators: t.List[t.Callable] = None,
                  prefix: str = None,
-                 default_service: t.Type[Service] = None):
+                 default_service: t.Type[Service] = None,
+                 batch_rule: str = None,
+                 batch_max_workers: int = 8,
+                 batch_max_requests: int = 50,
+                 metrics_rule: str = None,
+                 profiler: StackProfiler = None,
+                 profile_rule: str = None,
+                 slow_query_rule: str = None,
+                 cache_stats: bool = False):
         self.app = app
         self.blueprint = None
         self.prefix = prefix or ''
         self.decorators = decorators or []
         self.default_service = default_service
+        self.batch_rule = batch_rule
+        self.batch_max_workers = batch_max_workers
+        self.batch_max_requests = batch_max_requests
+        self._batch_executor: t.Optional[ThreadPoolExecutor] = None
+        self.metrics_rule = metrics_rule
+        self.metrics: t.Optional[MetricsRegistry] = None
+        if metrics_rule:
+            self.metrics = MetricsRegistry()
+            install_metrics()
+        self.profiler = profiler
+        self.profile_rule = profile_rule
+        self.slow_query_rule = slow_query_rule
+        self.cache_stats = cache_stats
+        if cache_stats:
+            install_cache_stats()
 
         self.resources: t.Dict[str, t.Type[Resource]] = {}
         self.views: t.List[tuple] = []
@@ -69,8 +119,39 @@ class Api:
     def _init_app(self, app: Flask):
         for route, resource, view_func, endpoint, methods in self.views:
             rule = route.rule_factory(resource)
-            self._register_view(app, rule, route.skip_api_decorators, view_func,
-                                endpoint, methods)
+            self._register_view(app,
+                                rule,
+                                route.skip_api_decorators,
+                                view_func,
+                                endpoint,
+                                methods,
+                                query_budget=self._query_budget(
+                                    route, resource))
+        if self.batch_rule:
+            self._register_view(app, ''.join((self.prefix, self.batch_rule)),
+                                False, self.batch, '_batch', ['POST'])
+        if self.metrics_rule:
+            self._register_view(app,
+                                ''.join((self.prefix, self.metrics_rule)),
+                                False,
+                                self.metrics_view,
+                                '_metrics', ['GET'],
+                                measure=False)
+        if self.profiler is not None and self.profile_rule:
+            self._register_view(app,
+                                ''.join((self.prefix, self.profile_rule)),
+                                False,
+                                self.profile_view,
+                                '_profile', ['GET'],
+                                measure=False)
+        if self.slow_query_rule:
+            self._register_view(app,
+                                ''.join((self.prefix, self.slow_query_rule)),
+                                False,
+                                self.slow_query_view,
+                                '_slow_queries', ['GET'],
+                                measure=False)
+        register_api(app, self)
         self._init_swag(app)
 
     def _init_swag(self, app: Flask):
@@ -81,9 +162,24 @@ class Api:
             } for rs in self.resources.values()]
             app.swag.template['tags'] = tags  # type: ignore
 
-    def _register_view(self, app, rule: str, skip_decorators: bool,
-                       view_func: t.Callable, endpoint: str,
-                       methods: t.List[str]):
+    @staticmethod
+    def _query_budget(route: Route,
+                      resource: t.Type[Resource]) -> t.Optional[int]:
+        """ 获取`resource.meta.query_budget`中定义的路由查询次数预算."""
+        budget = resource.meta.get('query_budget')
+        if isinstance(budget, dict):
+            return budget.get(route.relation)
+        return budget
+
+    def _register_view(self,
+                       app,
+                       rule: str,
+                       skip_decorators: bool,
+                       view_func: t.Callable,
+                       endpoint: str,
+                       methods: t.List[str],
+                       query_budget: int = None,
+                       measure: bool = True):
         """
         将视图函数与路由绑定
 
@@ -94,35 +190,75 @@ class Api:
             view_func: 视图函数
             endpoint: 端点
             methods: http方法
+            query_budget: 查询次数预算
+            measure: 是否统计路由指标及采样分析
 
         """
 
         if self.blueprint:
             endpoint = f'{self.blueprint.name}.{endpoint}'
 
+        is_async = is_coroutine_view(view_func)
         view_func = self.output(view_func)
+        view_func = instrument_view(view_func, endpoint, budget=query_budget)
 
         if not skip_decorators:
             for decorator in self.decorators:
                 view_func = decorator(view_func)
 
+        if measure and self.profiler is not None:
+            view_func = profile_view(view_func, endpoint, self.profiler,
+                                     is_async)
+
+        if measure and self.metrics is not None:
+            view_func = metrics_view(view_func, endpoint, self.metrics,
+                                     is_async)
+
+        if is_async and not inspect.iscoroutinefunction(view_func):
+            # 同步装饰器包裹后Flask无法识别async视图, 此处统一转换为协程函数
+            view_func = self._ensure_async(view_func)
+
         app.add_url_rule(rule,
                          view_func=view_func,
                          endpoint=endpoint,
                          methods=methods)
 
-    def output(self, view: t.Callable):
+    @staticmethod
+    def _ensure_async(view: t.Callable) -> t.Callable:
 
         @wraps(view)
-        def wrapper(*args, **kwargs):
+        async def wrapper(*args, **kwargs):
             resp = view(*args, **kwargs)
+            if inspect.isawaitable(resp):
+                resp = await resp
+            return resp
+
+        return wrapper
+
+    @staticmethod
+    def _make_response(resp):
+        if isinstance(resp, Response):
+            return resp
+
+        data, code, headers = unpack(resp)
+        headers['Content-Type'] = 'application/json'
+        return data, code, headers
 
-            if isinstance(resp, Response):
-                return resp
+    def output(self, view: t.Callable):
+        if is_coroutine_view(view):
+
+            @wraps(view)
+            async def async_wrapper(*args, **kwargs):
+                resp = view(*args, **kwargs)
+                if inspect.isawaitable(resp):
+                    resp = await resp
+                return self._make_response(resp)
+
+            return async_wrapper
 
-            data, code, headers = unpack(resp)
-            headers['Content-Type'] = 'application/json'
-            return data, code, headers
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            return self._make_response(view(*args, **kwargs))
 
         return wrapper
 
@@ -141,8 +277,14 @@ class Api:
             view_func = decorator(view_func)
 
         if self.app and not self.blueprint:
-            self._register_view(self.app, rule, route.skip_api_decorators,
-                                view_func, endpoint, methods)
+            self._register_view(self.app,
+                                rule,
+                                route.skip_api_decorators,
+                                view_func,
+                                endpoint,
+                                methods,
+                                query_budget=self._query_budget(
+                                    route, resource))
         else:
             self.views.append((route, resource, view_func, endpoint, methods))
 
@@ -177,3 +319,132 @@ class Api:
             self.add_route(route, resource, decorator=route_decorator)
 
         self.resources[resource.meta.name] = resource
+
+    @property
+    def batch_executor(self) -> ThreadPoolExecutor:
+        if self._batch_executor is None:
+            self._batch_executor = ThreadPoolExecutor(
+                max_workers=self.batch_max_workers,
+                thread_name_prefix='lesoon-restful-batch')
+        return self._batch_executor
+
+    def _sub_request_environ(self, app: Flask, sub_request: dict) -> dict:
+        """
+        构造子请求的WSGI environ.
+
+        Args:
+            app: a :class:`Flask` instance
+            sub_request: 子请求定义, e.g:
+                {"resource": "book", "relation": "instances", "params": {...}}
+                {"resource": "book", "relation": "instance", "id": 1}
+                {"resource": "book", "relation": "create_entrance", "json": {...}}
+
+        """
+        if not isinstance(sub_request, dict):
+            raise InvalidParam(msg='子请求格式不合法')
+
+        name, relation = sub_request.get('resource'), sub_request.get(
+            'relation')
+        resource = self.resources.get(name)
+        route = resource.routes.get(relation) if resource else None
+        if route is None:
+            raise InvalidParam(msg=f'资源路由不存在: {name}.{relation}')
+
+        endpoint = '_'.join((resource.meta.name, route.relation))
+        if self.blueprint:
+            endpoint = f'{self.blueprint.name}.{endpoint}'
+
+        values = {}
+        if 'id' in sub_request:
+            values['id'] = sub_request['id']
+        path = app.create_url_adapter(request).build(endpoint,
+                                                     values,
+                                                     method=route.method)
+
+        headers = [(k, v)
+                   for k, v in request.headers
+                   if k.lower() not in self.BATCH_EXCLUDE_HEADERS]
+        builder = EnvironBuilder(path=path[len(request.script_root):],
+                                 base_url=request.url_root,
+                                 method=route.method,
+                                 headers=headers,
+                                 query_string=sub_request.get('params'),
+                                 json=sub_request.get('json'))
+        try:
+            return builder.get_environ()
+        finally:
+            builder.close()
+
+    @staticmethod
+    def _dispatch_sub_request(app: Flask, environ: dict) -> dict:
+        """
+        在独立的请求上下文中执行子请求.
+        每个线程拥有独立的应用上下文, 因此Flask-SQLAlchemy会话互相隔离,
+        上下文结束时会话随之关闭.
+        """
+        ctx = app.request_context(environ)
+        error = None
+        try:
+            ctx.push()
+            try:
+                response = app.full_dispatch_request()
+            except Exception as e:
+                error = e
+                response = app.handle_exception(e)
+        finally:
+            ctx.pop(error)
+
+        body = response.get_json(silent=True) if response.is_json else None
+        if body is None:
+            # 视图返回字符串时Content-Type同样为json, 此时按文本返回
+            body = response.get_data(as_text=True)
+        return {'status': response.status_code, 'body': body}
+
+    def batch(self):
+        """
+        批量请求.
+        请求体为子请求列表, 各子请求经过完整的请求处理流程(含Api装饰器),
+        在线程池中并发执行, 结果按请求顺序返回.
+        """
+        sub_requests = request.get_json(silent=True)
+        if not isinstance(sub_requests, list):
+            raise InvalidJSON(msg='批量请求体必须为列表')
+        if len(sub_requests) > self.batch_max_requests:
+            raise InvalidParam(msg=f'单次批量请求数不能超过{self.batch_max_requests}')
+
+        app = current_app._get_current_object()  # noqa
+        environs = [
+            self._sub_request_environ(app, sub_request)
+            for sub_request in sub_requests
+        ]
+        results = list(
+            self.batch_executor.map(
+                lambda environ: self._dispatch_sub_request(app, environ),
+                environs))
+        return ResultResponse.success(result=results)
+
+    def metrics_view(self):
+        """ Prometheus指标."""
+        return Response(self.metrics.render(),
+                        mimetype='text/plain; version=0.0.4')
+
+    def profile_view(self):
+        """
+        采样分析结果.
+        默认返回折叠栈文本, `format=top` 时返回端点的热点帧.
+        """
+        endpoint = request.args.get('endpoint')
+        if request.args.get('format') == 'top':
+            if not endpoint:
+                raise InvalidParam(msg='format=top时endpoint不能为空')
+            return ResultResponse.success(
+                result=self.profiler.top_frames(endpoint))
+        return Response(self.profiler.collapsed(endpoint),
+                        mimetype='text/plain')
+
+    def slow_query_view(self):
+        """ 最近的慢查询及其执行计划, 可按 `model` 过滤, `limit` 限制条数."""
+        limit = request.args.get('limit', type=int)
+        model = request.args.get('model')
+        return ResultResponse.success(
+            result=get_slow_query_log().recent(limit=limit, model=model))
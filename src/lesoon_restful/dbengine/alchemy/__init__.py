@@ -1,3 +1,4 @@
+from .async_service import AsyncSQLAlchemyService
 from .filters import Where as AlchemyWhere
 from .service import SQLAlchemyService
 from .wrappers import CommonServiceMixin
@@ -0,0 +1,309 @@
+""" SQLAlchemy异步服务模块.
+基于SQLAlchemy1.4 `AsyncSession`, 配合Flask2.0 async视图使用.
+"""
+import asyncio
+import contextlib
+import contextvars
+import typing as t
+
+from flask import current_app
+from lesoon_common.dataclass.req import PageParam
+from lesoon_common.model.alchemy.base import Model
+from lesoon_common.wrappers.alchemy import Pagination
+from sqlalchemy import delete
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.future import select
+from sqlalchemy.pool import NullPool
+from sqlalchemy.sql.expression import func
+from sqlalchemy.sql.selectable import Select
+
+from lesoon_restful.dbengine.alchemy.service import SQLAlchemyService
+from lesoon_restful.exceptions import ItemNotFound
+from lesoon_restful.filters import Condition
+
+# 当前协程上下文中的会话
+_session_var: contextvars.ContextVar = contextvars.ContextVar(
+    'lesoon_restful_async_session')
+
+
+class AsyncSQLAlchemyService(SQLAlchemyService):
+    """
+    SQLAlchemy异步服务类.
+    接口与 :class:`SQLAlchemyService` 一致, 所有数据库操作均为协程.
+
+    配置项:
+        SQLALCHEMY_ASYNC_DATABASE_URI: 异步驱动连接串, e.g: `mysql+aiomysql://...`
+        SQLALCHEMY_ASYNC_ENGINE_OPTIONS: `create_async_engine` 参数,
+            默认使用 `NullPool`. Flask async视图每个请求运行在独立的事件循环中,
+            连接无法跨事件循环复用; 在ASGI等常驻事件循环环境下可配置连接池.
+
+    注意:
+        会话通过 :meth:`session_scope` 按操作开启, 同一协程上下文中嵌套调用复用同一会话.
+        返回的模型实例在提交后不会过期, 但无法再进行惰性加载.
+    """
+    ENGINE_EXTENSION_KEY = 'lesoon_restful_async_engine'
+
+    @classmethod
+    def _get_engine(cls) -> AsyncEngine:
+        engine = current_app.extensions.get(cls.ENGINE_EXTENSION_KEY)
+        if engine is None:
+            options = current_app.config.get('SQLALCHEMY_ASYNC_ENGINE_OPTIONS',
+                                             {'poolclass': NullPool})
+            engine = create_async_engine(
+                current_app.config['SQLALCHEMY_ASYNC_DATABASE_URI'], **options)
+            current_app.extensions[cls.ENGINE_EXTENSION_KEY] = engine
+        return engine
+
+    @contextlib.asynccontextmanager
+    async def session_scope(self) -> t.AsyncIterator[AsyncSession]:
+        """
+        开启会话作用域.
+        作用域结束时关闭会话, 未提交的事务将被回滚.
+        """
+        session = _session_var.get(None)
+        if session is not None:
+            yield session
+            return
+
+        async with AsyncSession(self._get_engine(),
+                                expire_on_commit=False) as session:
+            token = _session_var.set(session)
+            try:
+                yield session
+            finally:
+                _session_var.reset(token)
+
+    @property
+    def session(self) -> AsyncSession:
+        session = _session_var.get(None)
+        if session is None:
+            raise RuntimeError('异步会话未开启, 请在session_scope()中调用')
+        return session
+
+    def _query(self) -> Select:
+        query = select(self.model)
+        try:
+            query_options = self.meta.query_options
+        except KeyError:
+            return query
+        return query.options(*query_options)
+
+    def _read_query(self) -> Select:
+        """ 只读操作的query, 附加关系预加载."""
+        # 异步会话不支持惰性加载, 嵌套字段依赖预加载
+        query = self._query()
+        options = self._eager_load_options()
+        return query.options(*options) if options else query
+
+    def _page_query(self) -> Select:
+        # 异步会话暂不支持只读副本路由
+        return self._read_query()
+
+    def _query_filter(self, query: Select, expression) -> Select:
+        if not isinstance(expression, list):
+            expression = [expression]
+        return query.where(*expression)
+
+    def statement(self,
+                  query: Select = None,
+                  where: t.Tuple[Condition, ...] = None,
+                  sort: t.Tuple[t.Any, str, bool] = None) -> Select:
+        """
+        构造查询语句(不执行).
+
+        Args:
+            query: 基础查询语句, 默认为 `select(model)`
+            where: 过滤条件
+            sort: 排序条件
+
+        """
+        query = self._page_query() if query is None else query
+
+        if where:
+            expressions = [condition() for condition in where]
+            query = self._query_filter(query, self._and_expression(expressions))
+
+        if sort:
+            query = self._query_order_by(query, sort)
+        return query
+
+    async def instances(self, query=None, where=None, sort=None):
+        async with self.session_scope() as session:
+            result = await session.execute(self.statement(query, where, sort))
+            return result.scalars().all()
+
+    async def _query_get_paginated_items(self, query: Select, page: int,
+                                         page_size: int,
+                                         if_page: bool) -> Pagination:
+        async with self.session_scope() as session:
+            if not if_page:
+                items = (await session.execute(query)).scalars().all()
+                return Pagination(query=None,
+                                  page=page,
+                                  per_page=page_size,
+                                  total=len(items),
+                                  items=items)
+
+            count_query = select(func.count()).select_from(
+                query.order_by(None).subquery())
+            page_query = query.limit(page_size).offset((page - 1) * page_size)
+
+            async def count(session_: AsyncSession) -> int:
+                return (await session_.execute(count_query)).scalar()
+
+            async def fetch() -> list:
+                return (await session.execute(page_query)).scalars().all()
+
+            if self.meta.get('concurrent_count'):
+                # 单个会话不支持并发执行, count查询使用独立会话
+                async with AsyncSession(self._get_engine()) as count_session:
+                    total, items = await asyncio.gather(count(count_session),
+                                                        fetch())
+            else:
+                total = await count(session)
+                items = await fetch()
+            return Pagination(query=None,
+                              page=page,
+                              per_page=page_size,
+                              total=total,
+                              items=items)
+
+    async def paginated_instances(self, page_param: PageParam = None):
+        query = self._page_query()
+        page_param = self.parse_request_by_query(query=query,
+                                                 page_param=page_param)
+        statement = self.statement(query=query,
+                                   where=page_param.where,
+                                   sort=page_param.sort)
+        return await self._query_get_paginated_items(
+            statement,
+            page=page_param.page,
+            page_size=page_param.page_size,
+            if_page=page_param.if_page)
+
+    async def first(self, where=None, sort=None):
+        async with self.session_scope() as session:
+            result = await session.execute(
+                self.statement(where=where, sort=sort).limit(1))
+            res = result.scalars().first()
+        if res is None:
+            raise ItemNotFound()
+        return res
+
+    async def read(self, id_):
+        async with self.session_scope() as session:
+            result = await session.execute(
+                self._query_filter(self._read_query(), self.id_column == id_))
+            return result.scalars().first()
+
+    async def read_or_raise(self, id_):
+        res = await self.read(id_)
+        if not res:
+            raise ItemNotFound()
+        return res
+
+    async def create(self, properties: t.Union[dict, t.List[dict]]):
+        async with self.session_scope():
+            # 以transient方式加载, 避免schema通过同步会话按主键查询
+            if isinstance(properties, dict):
+                item = self.schema.load(properties, transient=True)
+                return await self.create_one(item=item)
+            else:
+                items = self.schema.load(properties, many=True, transient=True)
+                return await self.create_many(items=items)
+
+    async def create_one(self, item: Model, commit: bool = True):
+        async with self.session_scope():
+            self.before_create(items=item)
+            self.session.add(item)
+            await self.commit_or_flush(commit)
+            self.after_create(items=item)
+            return item
+
+    async def create_many(self, items: t.List[Model], commit: bool = True):
+        async with self.session_scope():
+            self.before_create(items=items)
+            self.session.add_all(items)
+            await self.commit_or_flush(commit)
+            self.after_create(items=items)
+            return items
+
+    async def update(self, properties: t.Union[dict, t.List[dict]]):
+        async with self.session_scope():
+            if isinstance(properties, dict):
+                item = await self.read_or_raise(
+                    properties.get(self.id_attribute))
+                return await self.update_one(item=item, changes=properties)
+            else:
+                items = [
+                    await self.read_or_raise(p.get(self.id_attribute))
+                    for p in properties
+                ]
+                return await self.update_many(items=items, changes=properties)
+
+    async def update_one(self, item: Model, changes: dict, commit: bool = True):
+        async with self.session_scope():
+            self.before_update(items=item, changes=changes)
+            item = self._load_changes(item, changes)
+            await self.commit_or_flush(commit)
+            self.after_update(items=item, changes=changes)
+            return item
+
+    async def update_many(self,
+                          items: t.List[Model],
+                          changes: t.List[dict],
+                          commit: bool = True):
+        async with self.session_scope():
+            self.before_update(items=items, changes=changes)
+            items = [
+                self._load_changes(item, change)
+                for item, change in zip(items, changes)
+            ]
+            await self.commit_or_flush(commit)
+            self.after_update(items=items, changes=changes)
+            return items
+
+    def _load_changes(self, item: Model, changes: dict) -> Model:
+        # schema绑定的是同步会话, 加载后将实例合并入当前异步会话
+        item = self.schema.load(changes,
+                                partial=True,
+                                instance=item,
+                                transient=True)
+        self.session.add(item)
+        return item
+
+    async def delete(self, ids: t.Union[t.Any, t.List[t.Any]]):
+        if not isinstance(ids, list):
+            await self.delete_one(ids)
+        else:
+            await self.delete_many(ids)
+
+    async def delete_one(self, id_: t.Any, commit: bool = True):
+        async with self.session_scope():
+            await self.read_or_raise(id_)
+            await self.delete_many([id_], commit=commit)
+
+    async def delete_many(self, ids: t.List[t.Any], commit: bool = True):
+        async with self.session_scope():
+            self.before_delete(ids=ids)
+            await self.session.execute(
+                delete(self.model).where(self.id_column.in_(ids)))
+            await self.commit_or_flush(commit)
+            self.after_delete(ids=ids)
+
+    async def commit(self):
+        await self.commit_or_flush(commit=True)
+
+    async def commit_or_flush(self, commit: bool):
+        session = self.session
+        try:
+            if commit:
+                await session.commit()
+            else:
+                await session.flush()
+        except SQLAlchemyError:
+            await session.rollback()
+            raise
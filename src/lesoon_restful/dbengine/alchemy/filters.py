@@ -20,6 +20,15 @@ Ilike = 'ilike'
 PrefixLike = 'prefixLike'
 SuffixLike = 'suffixLike'
 
+# LIKE转义字符, 与SQLAlchemy `autoescape` 一致
+LIKE_ESCAPE = '/'
+
+
+def escape_like(value: str) -> str:
+    """ 转义LIKE通配符."""
+    return value.replace(LIKE_ESCAPE, LIKE_ESCAPE * 2).replace(
+        '%', LIKE_ESCAPE + '%').replace('_', LIKE_ESCAPE + '_')
+
 
 class BaseFilter(filters.BaseFilter):
     DELIMITED_FILTER_NAMES = (filters.In, NotIn)
@@ -30,7 +39,8 @@ class InFilter(BaseFilter):
     def op(self, column, value):
         if isinstance(value, str):
             value = value.split(',')
-        return column.in_(value) if len(value) else False
+        # 空列表同样使用expanding IN, 保持语句结构稳定以命中编译缓存
+        return column.in_(value)
 
 
 class NotInFilter(BaseFilter):
@@ -50,37 +60,37 @@ class ContainsFilter(BaseFilter):
 class StringContainsFilter(BaseFilter):
 
     def op(self, column, value):
-        return column.like('%' + value.replace('%', '\\%') + '%')
+        return column.contains(value, autoescape=True)
 
 
 class StringIContainsFilter(BaseFilter):
 
     def op(self, column, value):
-        return column.ilike('%' + value.replace('%', '\\%') + '%')
+        return column.ilike('%' + escape_like(value) + '%', escape=LIKE_ESCAPE)
 
 
 class StartsWithFilter(BaseFilter):
 
     def op(self, column, value):
-        return column.startswith(value.replace('%', '\\%'))
+        return column.startswith(value, autoescape=True)
 
 
 class IStartsWithFilter(BaseFilter):
 
     def op(self, column, value):
-        return column.ilike(value.replace('%', '\\%') + '%')
+        return column.ilike(escape_like(value) + '%', escape=LIKE_ESCAPE)
 
 
 class EndsWithFilter(BaseFilter):
 
     def op(self, column, value):
-        return column.endswith(value.replace('%', '\\%'))
+        return column.endswith(value, autoescape=True)
 
 
 class IEndsWithFilter(BaseFilter):
 
     def op(self, column, value):
-        return column.ilike('%' + value.replace('%', '\\%'))
+        return column.ilike('%' + escape_like(value), escape=LIKE_ESCAPE)
 
 
 class DateBetweenFilter(BaseFilter):
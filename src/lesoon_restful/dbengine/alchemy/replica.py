@@ -0,0 +1,141 @@
+""" 只读副本路由模块.
+只读请求中的查询按轮询路由至只读副本, 写操作及写入后的读取使用主库.
+
+配置项:
+    SQLALCHEMY_REPLICA_BINDS: 只读副本的bind key列表, 需在 `SQLALCHEMY_BINDS` 中定义
+    SQLALCHEMY_REPLICA_STICKY_SECONDS: 写入后该客户端读取主库的时长(秒), 默认0不启用.
+        通过响应cookie记录截止时间, 保证客户端写后读取到自己的写入.
+"""
+import itertools
+import threading
+import time
+import typing as t
+
+from flask import after_this_request
+from flask import current_app
+from flask import Flask
+from flask import g
+from flask import has_request_context
+from flask import request
+from flask_sqlalchemy import get_state
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+# 存放于app.extensions中的副本路由
+EXTENSION_KEY = 'lesoon_restful_replicas'
+# 写入后读取主库的截止时间戳
+STICKY_COOKIE = 'lesoon_primary_until'
+# 可读取副本的请求方法
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# 会话中是否有过写入
+_WROTE_KEY = 'lesoon_restful_wrote'
+# g中存放的副本会话
+_SESSION_KEY = '_lesoon_restful_replica_session'
+# g中标记本次请求已设置写后读取cookie
+_STICKY_KEY = '_lesoon_restful_sticky'
+
+_lock = threading.Lock()
+
+
+class ReplicaRouter:
+    """
+    只读副本路由.
+    每个应用上下文按轮询选择一个副本开启会话, 上下文结束时关闭.
+
+    Attributes:
+        engines: 副本引擎列表
+        sticky_seconds: 写入后该客户端读取主库的时长(秒)
+
+    """
+
+    def __init__(self, engines: t.List[Engine], sticky_seconds: float = 0):
+        self.engines = engines
+        self.sticky_seconds = sticky_seconds
+        self._engines = itertools.cycle(engines)
+        self._lock = threading.Lock()
+
+    def next_engine(self) -> Engine:
+        with self._lock:
+            return next(self._engines)
+
+    def session(self) -> Session:
+        """ 当前应用上下文的副本会话."""
+        session = g.get(_SESSION_KEY)
+        if session is None:
+            session = Session(bind=self.next_engine())
+            setattr(g, _SESSION_KEY, session)
+        return session
+
+    def remove(self, exc: BaseException = None):
+        session = g.pop(_SESSION_KEY, None)
+        if session is not None:
+            session.close()
+
+
+def get_replica_router(app: Flask = None) -> t.Optional[ReplicaRouter]:
+    """ 获取app的副本路由, 未配置 `SQLALCHEMY_REPLICA_BINDS` 时返回None."""
+    app = app or current_app
+    if EXTENSION_KEY in app.extensions:
+        return app.extensions[EXTENSION_KEY]
+
+    with _lock:
+        if EXTENSION_KEY not in app.extensions:
+            router = None
+            binds = app.config.get('SQLALCHEMY_REPLICA_BINDS')
+            if binds:
+                db = get_state(app).db
+                router = ReplicaRouter(
+                    [db.get_engine(app, bind=bind) for bind in binds],
+                    app.config.get('SQLALCHEMY_REPLICA_STICKY_SECONDS', 0))
+                # 可能在首个请求之后才初始化, 不经setupmethod检查
+                app.teardown_appcontext_funcs.append(router.remove)
+            app.extensions[EXTENSION_KEY] = router
+    return app.extensions[EXTENSION_KEY]
+
+
+def use_primary(session: Session) -> bool:
+    """
+    是否应读取主库.
+    非请求上下文、非只读请求、主库会话有未提交或已发生的写入、
+    处于写后读取主库时段时均读取主库.
+    """
+    if not has_request_context() or request.method not in SAFE_METHODS:
+        return True
+    if (session.info.get(_WROTE_KEY) or session.new or session.dirty or
+            session.deleted):
+        return True
+    until = request.cookies.get(STICKY_COOKIE, type=float)
+    return until is not None and until > time.time()
+
+
+def _after_flush(session: Session, flush_context):
+    session.info[_WROTE_KEY] = True
+
+
+def _after_commit(session: Session):
+    if not session.info.get(_WROTE_KEY) or not has_request_context():
+        return
+    router = get_replica_router()
+    if router is None or not router.sticky_seconds or g.get(_STICKY_KEY):
+        return
+
+    setattr(g, _STICKY_KEY, True)
+    until = time.time() + router.sticky_seconds
+
+    @after_this_request
+    def set_sticky_cookie(response):
+        response.set_cookie(STICKY_COOKIE,
+                            str(until),
+                            max_age=router.sticky_seconds,
+                            httponly=True)
+        return response
+
+
+def install():
+    """ 注册全局会话事件以记录写入, 多次调用只注册一次."""
+    events = (('after_flush', _after_flush), ('after_commit', _after_commit))
+    for name, fn in events:
+        if not event.contains(Session, name, fn):
+            event.listen(Session, name, fn)
@@ -1,6 +1,10 @@
+import contextlib
+import threading
 import typing as t
+from concurrent.futures import ThreadPoolExecutor
 
 from flask import current_app
+from flask import has_request_context
 from flask_sqlalchemy import get_state
 from lesoon_common.dataclass.req import PageParam
 from lesoon_common.globals import request as current_request
@@ -10,25 +14,62 @@ from lesoon_common.model.alchemy.schema import SqlaModelConverter
 from lesoon_common.utils.str import camelcase
 from lesoon_common.wrappers import LesoonQuery
 from lesoon_common.wrappers.alchemy import Pagination
+from sqlalchemy import select
+from sqlalchemy.engine import Engine
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import InstrumentedAttribute
+from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import Session
 from sqlalchemy.orm.base import class_mapper
+from sqlalchemy.pool import SingletonThreadPool
+from sqlalchemy.pool import StaticPool
 from sqlalchemy.sql.elements import BinaryExpression
 from sqlalchemy.sql.expression import and_
+from sqlalchemy.sql.expression import func
 from sqlalchemy.sql.expression import or_
 from sqlalchemy.sql.schema import Column
+from sqlalchemy.sql.schema import UniqueConstraint
+from werkzeug.utils import cached_property
 
 from lesoon_restful.dbengine.alchemy.filters import FILTER_NAMES
 from lesoon_restful.dbengine.alchemy.filters import FILTERS_BY_FIELD
+from lesoon_restful.dbengine.alchemy.replica import get_replica_router
+from lesoon_restful.dbengine.alchemy.replica import install as install_replica_routing
+from lesoon_restful.dbengine.alchemy.replica import use_primary
 from lesoon_restful.dbengine.alchemy.utils import parse_columns
 from lesoon_restful.dbengine.alchemy.utils import parse_query_related_models
+from lesoon_restful.dbengine.alchemy.utils import parse_relation_path
+from lesoon_restful.dbengine.alchemy.utils import parse_schema_relations
 from lesoon_restful.filters import BaseFilter
 from lesoon_restful.filters import Condition
 from lesoon_restful.filters import convert_filters
 from lesoon_restful.filters import filters_for_field
 from lesoon_restful.resource import ModelResource
 from lesoon_restful.service import QueryService
+from lesoon_restful.utils.base import AttributeDict
 from lesoon_restful.utils.filters import legitimize_sort
 from lesoon_restful.utils.filters import legitimize_where
+from lesoon_restful.utils.instrument import statement_cache_stats
+from lesoon_restful.utils.instrument import StatementCacheStats
+
+# session.info中记录的工作单元嵌套层数, 及作用域结束时是否提交
+UOW_DEPTH_KEY = 'lesoon_restful_uow_depth'
+UOW_COMMIT_KEY = 'lesoon_restful_uow_commit'
+
+# 并发count查询线程池, 首次使用时创建, 所有服务共享
+_count_executor: t.Optional[ThreadPoolExecutor] = None
+_count_executor_lock = threading.Lock()
+
+
+def get_count_executor() -> ThreadPoolExecutor:
+    global _count_executor
+    if _count_executor is None:
+        with _count_executor_lock:
+            if _count_executor is None:
+                _count_executor = ThreadPoolExecutor(
+                    thread_name_prefix='lesoon-restful-count')
+    return _count_executor
 
 
 class SQLAlchemyService(QueryService):
@@ -41,6 +82,26 @@ class SQLAlchemyService(QueryService):
     # model字段映射类
     model_converter: ModelConverter = SqlaModelConverter()
 
+    # 预加载策略
+    EAGER_LOADERS = {'selectin': selectinload, 'joined': joinedload}
+
+    class Meta:
+        # 分页时count查询与分页查询是否并发执行.
+        # count查询使用独立连接, 不可见当前会话中未提交的变更.
+        concurrent_count: bool = False
+        # 根据schema嵌套字段预加载关系的策略(selectin/joined), 默认不预加载.
+        # 启用后GET请求参数`include=books,books.tags`可指定本次预加载的关系.
+        eager_load: t.Optional[str] = None
+        # 是否始终读取主库. 配置只读副本(SQLALCHEMY_REPLICA_BINDS)时,
+        # 只读请求中的instances/paginated_instances/read/first默认路由至副本.
+        read_primary: bool = False
+
+    def __init__(self,
+                 meta: AttributeDict = None,
+                 resource: t.Type[ModelResource] = None):
+        super().__init__(meta=meta, resource=resource)
+        install_replica_routing()
+
     def _init_model(self):
         super()._init_model()
         mapper = class_mapper(self.meta.model)
@@ -128,6 +189,42 @@ class SQLAlchemyService(QueryService):
             return expressions[0]
         return and_(*expressions)
 
+    @cached_property
+    def _schema_relations(self) -> t.List[t.Tuple[InstrumentedAttribute, ...]]:
+        if not self.schema:
+            return []
+        return parse_schema_relations(self.schema, self.model)
+
+    def _eager_load_options(self) -> list:
+        """
+        生成关系预加载选项, 避免序列化时逐行惰性加载(N+1查询).
+        仅用于只读查询, 且只在GET请求中读取 `include` 参数.
+        """
+        strategy = self.meta.get('eager_load')
+        if not strategy:
+            return []
+
+        include = None
+        if has_request_context() and current_request.method == 'GET':
+            include = current_request.args.get('include')
+        if include is None:
+            paths = self._schema_relations
+        else:
+            paths = [
+                parse_relation_path(path, self.model)
+                for path in include.split(',')
+                if path
+            ]
+
+        loader = self.EAGER_LOADERS[strategy]
+        options = []
+        for path in paths:
+            option = loader(path[0])
+            for attr in path[1:]:
+                option = getattr(option, loader.__name__)(attr)
+            options.append(option)
+        return options
+
     def _query(self) -> LesoonQuery:
         query: LesoonQuery = self.model.query
         try:
@@ -136,6 +233,28 @@ class SQLAlchemyService(QueryService):
             return query
         return query.options(*query_options)
 
+    def _read_query(self) -> LesoonQuery:
+        """ 只读操作的query, 附加关系预加载, 满足条件时绑定至只读副本会话."""
+        query = self._query()
+        options = self._eager_load_options()
+        if options:
+            query = query.options(*options)
+        if self.meta.get('read_primary') or use_primary(query.session):
+            return query
+        # 使用独立bind的模型不做路由
+        if class_mapper(self.model).local_table.info.get('bind_key'):
+            return query
+        router = get_replica_router()
+        if router is None:
+            return query
+        return query.with_session(router.session())
+
+    def _page_query(self) -> LesoonQuery:
+        return self._read_query()
+
+    def read(self, id_) -> Model:
+        return self._query_filter_by_id(self._read_query(), id_)
+
     def _query_filter(
         self, query: LesoonQuery, expression: t.Union[BinaryExpression,
                                                       t.List[BinaryExpression]]
@@ -163,8 +282,68 @@ class SQLAlchemyService(QueryService):
     def _query_get_first(self, query: LesoonQuery) -> Model:
         return query.first()
 
+    def _count_engine(self, query: LesoonQuery) -> t.Optional[Engine]:
+        """ 获取可用于并发count查询的引擎, 连接池不支持多连接时返回None."""
+        engine = query.session.get_bind(mapper=class_mapper(self.model)).engine
+        # 单连接池(如sqlite内存库)下其他线程无法获得独立连接
+        if isinstance(engine.pool, (StaticPool, SingletonThreadPool)):
+            return None
+        return engine
+
+    def statement_cache_stats(self) -> StatementCacheStats:
+        """
+        模型绑定引擎的编译语句缓存统计, 命中率偏低说明查询语句结构不稳定.
+        需通过 `Api(cache_stats=True)` 或 :func:`install_cache_stats` 开启统计.
+        """
+        query = self._query()
+        return statement_cache_stats(
+            query.session.get_bind(mapper=class_mapper(self.model)).engine)
+
+    def _explain(self, query: LesoonQuery,
+                 page_param: PageParam) -> t.Tuple[str, t.List[dict]]:
+        """ 以EXPLAIN(sqlite为EXPLAIN QUERY PLAN)获取当前页查询的执行计划."""
+        if page_param.if_page and page_param.page > 0 and page_param.page_size > 0:
+            query = query.limit(page_param.page_size).offset(
+                (page_param.page - 1) * page_param.page_size)
+
+        mapper = class_mapper(self.model)
+        dialect = query.session.get_bind(mapper=mapper).dialect
+        statement = query.statement.compile(dialect=dialect)
+        # 执行计划需内联参数值, 记录的语句保留参数占位符
+        literal = query.statement.compile(
+            dialect=dialect, compile_kwargs={'literal_binds': True})
+        prefix = 'EXPLAIN QUERY PLAN' if dialect.name == 'sqlite' else 'EXPLAIN'
+        result = query.session.connection(
+            mapper=mapper).exec_driver_sql(f'{prefix} {literal}')
+        return str(statement), [dict(row._mapping) for row in result]  # noqa
+
+    def _query_get_paginated_items_concurrently(self, query: LesoonQuery,
+                                                page: int, page_size: int,
+                                                engine: Engine) -> Pagination:
+        count_statement = select(func.count()).select_from(
+            query.order_by(None).subquery())
+
+        def count():
+            with engine.connect() as conn:
+                return conn.execute(count_statement).scalar()
+
+        future = get_count_executor().submit(count)
+        try:
+            items = query.limit(page_size).offset((page - 1) * page_size).all()
+        except Exception:
+            future.cancel()
+            raise
+        return Pagination(query, page, page_size, future.result(), items)
+
     def _query_get_paginated_items(self, query: LesoonQuery, page: int,
                                    page_size: int, if_page: bool) -> Pagination:
+        if (if_page and self.meta.get('concurrent_count') and
+                isinstance(query, LesoonQuery) and page > 0 and page_size > 0):
+            engine = self._count_engine(query)
+            if engine is not None:
+                return self._query_get_paginated_items_concurrently(
+                    query, page=page, page_size=page_size, engine=engine)
+
         if isinstance(query, LesoonQuery):
             return query.paginate(page=page,
                                   per_page=page_size,
@@ -201,29 +380,73 @@ class SQLAlchemyService(QueryService):
         instances = self.instances(query=query,
                                    where=page_param.where,
                                    sort=page_param.sort)
-        return self._query_get_paginated_items(instances,
-                                               page=page_param.page,
-                                               page_size=page_param.page_size,
-                                               if_page=page_param.if_page)
+        return self._paginate(instances, page_param)
 
     @property
     def session(self):
         return self._get_session()
 
+    def indexes(self) -> t.List[t.Tuple[str, ...]]:
+        mapper = class_mapper(self.model)
+        attributes = {
+            column.name: key for key, column in mapper.columns.items()
+        }
+        table = mapper.local_table
+        column_groups = [table.primary_key.columns]
+        column_groups.extend(index.columns for index in table.indexes)
+        column_groups.extend(constraint.columns
+                             for constraint in table.constraints
+                             if isinstance(constraint, UniqueConstraint))
+        return [
+            tuple(
+                attributes.get(column.name, column.name)
+                for column in columns)
+            for columns in column_groups
+            if len(columns)
+        ]
+
     def set_resource_name(self, resource: t.Type[ModelResource]):
         # 未定义resource:name则默认为小写表名
         if not hasattr(resource.Meta, 'name'):
             resource.meta['name'] = camelcase(self.model.__tablename__.lower())
 
+    @contextlib.contextmanager
+    def unit_of_work(self, commit: bool = False) -> t.Iterator[Session]:
+        """
+        工作单元.
+        作用域内的提交请求(包括 :meth:`commit`)延迟至最外层作用域结束时合并为一次提交,
+        commit为False且无提交请求时仅flush. flush照常执行, after_create/after_update
+        等钩子可见主键等数据库生成的值. 作用域内抛出异常时不做处理.
+
+        Args:
+            commit: 作用域结束时是否提交
+
+        """
+        session = self.session
+        info = session.info
+        depth = info.get(UOW_DEPTH_KEY, 0)
+        info[UOW_DEPTH_KEY] = depth + 1
+        try:
+            yield session
+        except BaseException:
+            if not depth:
+                info.pop(UOW_COMMIT_KEY, None)
+            raise
+        finally:
+            info[UOW_DEPTH_KEY] = depth
+
+        if commit:
+            info[UOW_COMMIT_KEY] = True
+        if not depth:
+            self.commit_or_flush(info.pop(UOW_COMMIT_KEY, False))
+
     def create_one(self, item: Model, commit: bool = True):
-        item = super().create_one(item)
-        self.commit_or_flush(commit)
-        return item
+        with self.unit_of_work(commit=commit):
+            return super().create_one(item)
 
     def create_many(self, items: t.List[Model], commit: bool = True):
-        items = super().create_many(items)
-        self.commit_or_flush(commit)
-        return items
+        with self.unit_of_work(commit=commit):
+            return super().create_many(items)
 
     def _create_one(self, item: Model) -> Model:
         self.session.add(item)
@@ -236,17 +459,15 @@ class SQLAlchemyService(QueryService):
         return items
 
     def update_one(self, item: Model, changes: dict, commit: bool = True):
-        item = super().update_one(item, changes)
-        self.commit_or_flush(commit)
-        return item
+        with self.unit_of_work(commit=commit):
+            return super().update_one(item, changes)
 
     def update_many(self,
                     items: t.List[Model],
                     changes: t.List[dict],
                     commit: bool = True):
-        items = super().update_many(items, changes)
-        self.commit_or_flush(commit)
-        return items
+        with self.unit_of_work(commit=commit):
+            return super().update_many(items, changes)
 
     def _update_one(self, item: Model, changes: dict) -> Model:
         item = self.schema.load(changes, partial=True, instance=item)  # noqa
@@ -255,24 +476,24 @@ class SQLAlchemyService(QueryService):
 
     def _update_many(self, items: t.List[Model],
                      changes: t.List[dict]) -> t.List[Model]:
-        updated_items = []
-        for item, change in zip(items, changes):
-            updated_items.append(self._update_one(item, change))
-
+        # 逐条加载变更后合并为一次flush
+        updated_items = [
+            self.schema.load(change, partial=True, instance=item)  # noqa
+            for item, change in zip(items, changes)
+        ]
         self.commit_or_flush(False)
         return updated_items
 
     def delete_one(self, id_: int, commit: bool = True):
-        super().delete_one(id_)
-        self.commit_or_flush(commit)
+        with self.unit_of_work(commit=commit):
+            super().delete_one(id_)
 
     def delete_many(self, ids: t.List[int], commit: bool = True):
-        super().delete_many(ids)
-        self.commit_or_flush(commit)
+        with self.unit_of_work(commit=commit):
+            super().delete_many(ids)
 
     def _delete_one(self, id_: int):
         self._delete_many(ids=[id_])
-        self.commit_or_flush(False)
 
     def _delete_many(self, ids: t.List[int]):
         self._query_filter(self.query, self.id_column.in_(ids)).delete()
@@ -283,6 +504,10 @@ class SQLAlchemyService(QueryService):
 
     def commit_or_flush(self, commit: bool):
         session = self.session
+        if commit and session.info.get(UOW_DEPTH_KEY):
+            # 工作单元内提交延迟至作用域结束时执行
+            session.info[UOW_COMMIT_KEY] = True
+            commit = False
         try:
             if commit:
                 session.commit()
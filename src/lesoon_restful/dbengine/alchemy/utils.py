@@ -3,9 +3,13 @@
 """
 import typing as t
 
+import marshmallow as ma
 from flask_sqlalchemy import Model
 from lesoon_common import LesoonQuery
 from lesoon_common.utils.str import udlcase
+from marshmallow import fields as ma_fields
+from marshmallow_sqlalchemy.fields import Related
+from sqlalchemy.orm import class_mapper
 from sqlalchemy.orm import InstrumentedAttribute
 from sqlalchemy.orm.util import _ORMJoin
 from sqlalchemy.sql import expression as SqlaExp
@@ -17,6 +21,7 @@ from sqlalchemy.sql.selectable import Select
 from sqlalchemy.sql.selectable import Subquery
 
 from lesoon_restful.exceptions import FilterInvalid
+from lesoon_restful.exceptions import InvalidParam
 
 SqlaExp = SqlaExp.BinaryExpression
 SqlaExpList = t.List[SqlaExp]
@@ -121,7 +126,8 @@ def parse_valid_model_attribute(
     return attr
 
 
-def parse_query_related_models(query: LesoonQuery) -> t.List[TableType]:
+def parse_query_related_models(
+        query: t.Union[LesoonQuery, Select]) -> t.List[TableType]:
     """获取Query对象查询涉及的所有表"""
     related_models: t.List[TableType] = list()
 
@@ -148,6 +154,81 @@ def parse_query_related_models(query: LesoonQuery) -> t.List[TableType]:
             else:
                 raise TypeError(f'type:{_from} = {type(_from)}')
 
-    recur_related_models(_froms=query.statement.froms,
-                         _related_models=related_models)
+    # 兼容2.0风格的select语句
+    statement = query if isinstance(query, Select) else query.statement
+    recur_related_models(_froms=statement.froms, _related_models=related_models)
     return related_models
+
+
+def _nested_schema(field: ma_fields.Field) -> t.Optional[ma.Schema]:
+    """ 获取嵌套字段对应的schema, 非嵌套字段返回None."""
+    if isinstance(field, ma_fields.List):
+        return _nested_schema(field.inner)
+    if isinstance(field, ma_fields.Nested):
+        # Pluck为Nested子类
+        return field.schema
+    return None
+
+
+def _is_relation_field(field: ma_fields.Field) -> bool:
+    if isinstance(field, ma_fields.List):
+        return _is_relation_field(field.inner)
+    return isinstance(field, (ma_fields.Nested, Related))
+
+
+def parse_schema_relations(
+        schema: ma.Schema,
+        model: t.Type[Model],
+        max_depth: int = 3) -> t.List[t.Tuple[InstrumentedAttribute, ...]]:
+    """
+    解析schema中嵌套字段(Nested/Pluck/Related)对应的模型关系路径.
+
+    Args:
+        schema: marshmallow schema实例
+        model: sqlalchemy.Model
+        max_depth: 最大嵌套层级
+
+    Returns:
+        paths: [(Author.books,), (Author.books, Book.tags), ...]
+    """
+    paths: t.List[t.Tuple[InstrumentedAttribute, ...]] = []
+
+    def walk(schema_: ma.Schema, model_: t.Type[Model],
+             prefix: t.Tuple[InstrumentedAttribute, ...]):
+        relationships = class_mapper(model_).relationships
+        for name, field in schema_.dump_fields.items():
+            attribute = field.attribute or name
+            if not _is_relation_field(field) or attribute not in relationships:
+                continue
+            path = prefix + (getattr(model_, attribute),)
+            paths.append(path)
+
+            nested = _nested_schema(field)
+            if nested is not None and len(path) < max_depth:
+                walk(nested, relationships[attribute].mapper.class_, path)
+
+    walk(schema, model, ())
+    return paths
+
+
+def parse_relation_path(
+        path: str, model: t.Type[Model]) -> t.Tuple[InstrumentedAttribute, ...]:
+    """
+    解析以`.`分隔的关系路径.
+
+    Args:
+        path: 关系路径 e.g: "books.tags"
+        model: sqlalchemy.Model
+
+    Returns:
+        (Author.books, Book.tags)
+    """
+    attrs = []
+    for name in path.split('.'):
+        relationships = class_mapper(model).relationships
+        name = udlcase(name)
+        if name not in relationships:
+            raise InvalidParam(msg=f'关系不存在: {path}')
+        attrs.append(getattr(model, name))
+        model = relationships[name].mapper.class_
+    return tuple(attrs)
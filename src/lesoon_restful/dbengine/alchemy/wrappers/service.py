@@ -24,22 +24,22 @@ class UnionServiceMixin:
                       update_rows: t.List[dict],
                       delete_rows: t.List[int],
                       commit: bool = True):
-        """新增，更新，删除的联合操作."""
-        if insert_rows:
-            self.create_many(items=self.schema.load(insert_rows, many=True),
-                             commit=False)
-        if update_rows:
-            self.update_many(items=[
-                self.read_or_raise(r.get(self.id_attribute))
-                for r in update_rows
-            ],
-                             changes=update_rows,
-                             commit=False)
-        if delete_rows:
-            self.delete_many(ids=delete_rows, commit=False)
-
-        if insert_rows or update_rows or delete_rows:
-            self.commit_or_flush(commit)
+        """新增，更新，删除的联合操作, 在同一工作单元内仅提交一次."""
+        if not (insert_rows or update_rows or delete_rows):
+            return
+
+        with self.unit_of_work(commit=commit):
+            if insert_rows:
+                self.create_many(items=self.schema.load(insert_rows, many=True),
+                                 commit=False)
+            if update_rows:
+                items = [
+                    self.read_or_raise(r.get(self.id_attribute))
+                    for r in update_rows
+                ]
+                self.update_many(items=items, changes=update_rows, commit=False)
+            if delete_rows:
+                self.delete_many(ids=delete_rows, commit=False)
 
 
 class ComplexServiceMixin:
@@ -83,9 +83,8 @@ class ComplexServiceMixin:
             else:
                 objs.append(obj)
 
-        self.create_many(objs, commit=False)
+        self.create_many(objs)
         parsed_result.obj_list = objs
-        self.commit()
 
     @t.no_type_check
     def import_data(self, param: ImportParam):
@@ -0,0 +1,372 @@
+""" 列式内存服务模块.
+每个schema字段以NumPy数组存储,过滤与排序以向量化方式执行.
+注意: 依赖numpy, 需通过 `pip install lesoon-restful[columnar]` 安装.
+"""
+import os
+import pickle
+import shutil
+import tempfile
+import typing as t
+
+import numpy as np
+from marshmallow import fields as ma_fields
+
+from lesoon_restful import filters
+from lesoon_restful.dbengine.memory.service import MemoryService
+from lesoon_restful.dbengine.memory.service import Pagination
+from lesoon_restful.dbengine.memory.service import SNAPSHOT_PROTOCOL
+from lesoon_restful.filters import Condition
+
+# 字段类型与数组类型映射, 未匹配的字段使用object数组
+DTYPES_BY_FIELD = (
+    (ma_fields.Boolean, np.bool_),
+    (ma_fields.Integer, np.int64),
+    (ma_fields.Float, np.float64),
+)
+
+# 列式快照元数据文件名
+SNAPSHOT_META = 'meta.pickle'
+
+
+class ColumnarRows:
+    """
+    列式查询结果.
+    仅持有命中的行号数组及查询时的列数组, 切片或迭代时才构造dict.
+
+    Attributes:
+        service: 所属的 :class:`ColumnarMemoryService`
+        rows: 行号数组
+        columns: 查询时的列数组, 整理行号后仍按原行号读取
+
+    """
+
+    def __init__(self, service: 'ColumnarMemoryService', rows: np.ndarray,
+                 columns: t.Dict[str, np.ndarray]):
+        self.service = service
+        self.rows = rows
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        return iter(self.service._materialize(self.rows, self.columns))
+
+    def __getitem__(self, index: t.Union[int, slice]):
+        if isinstance(index, slice):
+            return self.service._materialize(self.rows[index], self.columns)
+        return self.service._materialize(self.rows[[index]], self.columns)[0]
+
+    def first(self):
+        return self[0] if len(self.rows) else None
+
+    def paginate(self, page: int, per_page: int, if_page: bool) -> Pagination:
+        return Pagination.from_list(self, page, per_page, if_page)
+
+
+class ColumnarMemoryService(MemoryService):
+    """
+    列式内存服务类.
+    适用于读多写少的大数据量缓存场景,
+    eq/ne/lt/lte/gt/gte/in/nin/between/startswith 过滤以向量化掩码计算,
+    其余过滤器逐元素回退至 :meth:`BaseFilter.op`.
+    注意:
+        未声明在schema中的字段不会被存储;缺失的字段值以None存储.
+    """
+    # 初始容量
+    INITIAL_CAPACITY = 1024
+
+    def _init_storage(self):
+        self._size = 0
+        self._capacity = self.INITIAL_CAPACITY
+        self._rows: t.Dict[t.Any, int] = {}
+        self._alive = np.zeros(self._capacity, dtype=np.bool_)
+        self._columns: t.Dict[str, np.ndarray] = {}
+        for name, field in self.schema.fields.items():
+            self._columns[name] = np.zeros(self._capacity,
+                                           dtype=self._dtype_for_field(field))
+        if self.id_attribute not in self._columns:
+            self._columns[self.id_attribute] = np.zeros(self._capacity,
+                                                        dtype=object)
+
+    @staticmethod
+    def _dtype_for_field(field: ma_fields.Field):
+        for field_cls, dtype in DTYPES_BY_FIELD:
+            if isinstance(field, field_cls):
+                return dtype
+        return object
+
+    @property
+    def items(self) -> t.Dict[t.Any, dict]:  # type:ignore
+        rows = np.flatnonzero(self._alive[:self._size])
+        return {
+            item[self.id_attribute]: item for item in self._materialize(rows)
+        }
+
+    def indexes(self):
+        # 列式存储以向量化扫描过滤, 不建立二级索引
+        return None
+
+    def _grow(self):
+        self._capacity = max(self._capacity * 2, self.INITIAL_CAPACITY)
+        self._alive = np.resize(self._alive, self._capacity)
+        self._alive[self._size:] = False
+        for name, column in self._columns.items():
+            self._columns[name] = np.resize(column, self._capacity)
+
+    def _compact(self):
+        """
+        清理已删除的行.
+        生成新的列数组而非原地移动, 已返回的查询结果仍持有旧数组, 行号不会失效.
+        """
+        rows = np.flatnonzero(self._alive[:self._size])
+        for name, column in self._columns.items():
+            compacted = np.zeros(self._capacity, dtype=column.dtype)
+            compacted[:len(rows)] = column[rows]
+            self._columns[name] = compacted
+        self._size = len(rows)
+        self._alive = np.zeros(self._capacity, dtype=np.bool_)
+        self._alive[:self._size] = True
+        ids = self._columns[self.id_attribute][:self._size].tolist()
+        self._rows = {id_: row for row, id_ in enumerate(ids)}
+
+    def _set_value(self, name: str, row: int, value: t.Any):
+        column = self._columns[name]
+        if value is None and column.dtype != object:
+            column = self._columns[name] = column.astype(object)
+        try:
+            column[row] = value
+        except (TypeError, ValueError):
+            # 类型不匹配时回退至object数组
+            column = self._columns[name] = column.astype(object)
+            column[row] = value
+
+    def _set_row(self, row: int, item: dict):
+        for name in self._columns:
+            self._set_value(name, row, item.get(name))
+
+    def _materialize(self,
+                     rows: np.ndarray,
+                     columns: t.Dict[str, np.ndarray] = None) -> t.List[dict]:
+        with self._read_lock():
+            columns = columns or self._columns
+            names = list(columns)
+            values = [columns[name][rows].tolist() for name in names]
+        return [dict(zip(names, row_values)) for row_values in zip(*values)]
+
+    def _column(self, name: str) -> np.ndarray:
+        return self._columns[name][:self._size]
+
+    def _mask(self, condition: Condition) -> np.ndarray:
+        """ 计算单个过滤条件的布尔掩码."""
+        filter_, value = condition.filter, condition.value
+        column = self._column(condition.column)
+        try:
+            if isinstance(filter_, filters.EqualFilter):
+                return np.asarray(column == value, dtype=np.bool_)
+            if isinstance(filter_, filters.NotEqualFilter):
+                return np.asarray(column != value, dtype=np.bool_)
+            if isinstance(filter_, filters.InFilter):
+                return np.isin(column, np.asarray(value, dtype=column.dtype))
+            if isinstance(filter_, filters.NotInFilter):
+                return ~np.isin(column, np.asarray(value, dtype=column.dtype))
+            if isinstance(filter_, filters.LessThanFilter):
+                return np.asarray(column < value, dtype=np.bool_)
+            if isinstance(filter_, filters.LessThanEqualFilter):
+                return np.asarray(column <= value, dtype=np.bool_)
+            if isinstance(filter_, filters.GreaterThanFilter):
+                return np.asarray(column > value, dtype=np.bool_)
+            if isinstance(filter_, filters.GreaterThanEqualFilter):
+                return np.asarray(column >= value, dtype=np.bool_)
+            if isinstance(filter_, filters.DateBetweenFilter):
+                return np.asarray((column >= value[0]) & (column <= value[1]),
+                                  dtype=np.bool_)
+        except (TypeError, ValueError):
+            # object数组中存在None等无法比较的值
+            pass
+
+        if isinstance(filter_, filters.StartsWithFilter):
+            return np.fromiter(
+                (isinstance(v, str) and v.startswith(value) for v in column),
+                dtype=np.bool_,
+                count=len(column))
+        # 其余过滤器逐元素判断, None值视为不匹配
+        return np.fromiter(
+            (v is not None and bool(filter_.op(v, value)) for v in column),
+            dtype=np.bool_,
+            count=len(column))
+
+    def _sort_key(self, name: str, rows: np.ndarray,
+                  reverse: bool) -> np.ndarray:
+        column = self._columns[name][rows]
+        if column.dtype == object:
+            # 转换为排名后排序, None视为最小值
+            values = column.tolist()
+            ordered = sorted({v for v in values if v is not None})
+            ranks = {v: rank for rank, v in enumerate(ordered, 1)}
+            column = np.fromiter((ranks.get(v, 0) for v in values),
+                                 dtype=np.int64,
+                                 count=len(values))
+        elif column.dtype == np.bool_:
+            column = column.astype(np.int64)
+        return -column if reverse else column
+
+    def _sort_rows(self, rows: np.ndarray, sort) -> np.ndarray:
+        keys = [
+            self._sort_key(key, rows, reverse)
+            for _, key, reverse in reversed(sort)
+        ]
+        return rows[np.lexsort(keys)]
+
+    def instances(self, query=None, where=None, sort=None) -> ColumnarRows:
+        with self._read_lock():
+            mask = self._alive[:self._size].copy()
+            for condition in where or ():
+                mask &= self._mask(condition)
+            rows = np.flatnonzero(mask)
+
+            if sort and len(rows):
+                rows = self._sort_rows(rows, sort)
+            columns = dict(self._columns)
+        return ColumnarRows(self, rows, columns)
+
+    def read(self, id_):
+        with self._read_lock():
+            row = self._rows.get(id_)
+            if row is None:
+                return None
+            return self._materialize(np.array([row]))[0]
+
+    def _create_one(self, item: dict):
+        with self._write_lock():
+            item_id = self._assign_id(item)
+            row = self._rows.get(item_id)
+            if row is None:
+                if self._size == self._capacity:
+                    self._grow()
+                row = self._size
+                self._size += 1
+                self._rows[item_id] = row
+                self._alive[row] = True
+            self._set_row(row, item)
+        return item
+
+    def _create_many(self, items: t.List[dict]):
+        # 列式存储按行写入, 不使用父类的字典存储及批量索引
+        with self._write_lock():
+            for item in items:
+                self._create_one(item)
+        return items
+
+    def _update_one(self, item: dict, changes: dict):
+        with self._write_lock():
+            row = self._rows[item[self.id_attribute]]
+            item.update(changes)
+            self._set_row(row, item)
+        return item
+
+    def _delete_one(self, id_: t.Any):
+        with self._write_lock():
+            row = self._rows.pop(id_, None)
+            if row is None:
+                return
+            self._alive[row] = False
+            if len(self._rows) < self._size // 2:
+                self._compact()
+
+    def save_snapshot(self, path: str):
+        """
+        保存列式快照.
+        快照为目录: 数值列保存为 `.npy` 文件以供内存映射加载,
+        object列与元数据保存在 `meta.pickle` 中.
+        每次保存写入唯一的版本目录, `path` 为指向当前版本的符号链接,
+        以原子替换链接的方式发布新版本, 替换后删除上一版本.
+
+        Args:
+            path: 快照路径
+
+        """
+        directory, name = os.path.split(os.path.abspath(path))
+        version_path = tempfile.mkdtemp(prefix=f'{name}.', dir=directory)
+        try:
+            self._write_snapshot(version_path)
+            previous = self._publish_snapshot(path, version_path)
+        except BaseException:
+            shutil.rmtree(version_path, ignore_errors=True)
+            raise
+        if previous is not None:
+            shutil.rmtree(previous, ignore_errors=True)
+
+    def _write_snapshot(self, version_path: str):
+        object_columns = {}
+        with self._read_lock():
+            rows = np.flatnonzero(self._alive[:self._size])
+            for name, column in self._columns.items():
+                column = column[rows]
+                if column.dtype == object:
+                    object_columns[name] = column
+                else:
+                    np.save(os.path.join(version_path, f'{name}.npy'), column)
+
+            state = {
+                'id_sequence': self.id_sequence,
+                'object_columns': object_columns
+            }
+        with open(os.path.join(version_path, SNAPSHOT_META), 'wb') as f:
+            pickle.dump(state, f, protocol=SNAPSHOT_PROTOCOL)
+
+    @staticmethod
+    def _publish_snapshot(path: str, version_path: str) -> t.Optional[str]:
+        """ 将 `path` 链接替换为指向新版本目录, 返回上一版本目录."""
+        link_path = f'{version_path}.link'
+        os.symlink(os.path.basename(version_path), link_path)
+        try:
+            if os.path.islink(path):
+                previous = os.path.realpath(path)
+            elif os.path.isdir(path):
+                # 旧格式的快照目录无法被链接原子替换, 先移开
+                previous = f'{version_path}.legacy'
+                os.replace(path, previous)
+            else:
+                previous = None
+            os.replace(link_path, path)
+        except BaseException:
+            os.unlink(link_path)
+            raise
+        return previous
+
+    def load_snapshot(self, path: str):
+        """
+        加载列式快照.
+        数值列以写时复制(copy-on-write)方式内存映射, 无需读入内存即可服务,
+        在fork前加载时多个worker进程共享同一份物理内存.
+
+        Args:
+            path: 快照路径
+
+        """
+        # 先解析链接, 各文件均从同一版本目录读取
+        path = os.path.realpath(path)
+        with open(os.path.join(path, SNAPSHOT_META), 'rb') as f:
+            state = pickle.load(f)
+
+        columns = state['object_columns']
+        for name in list(self._columns):
+            if name in columns:
+                continue
+            file = os.path.join(path, f'{name}.npy')
+            if os.path.exists(file):
+                columns[name] = np.load(file, mmap_mode='c')
+
+        size = len(columns[self.id_attribute])
+        with self._write_lock():
+            for name in list(self._columns):
+                # 快照中不存在的字段补None
+                self._columns[name] = columns.get(
+                    name, np.full(size, None, dtype=object))
+
+            self.id_sequence = state['id_sequence']
+            self._size = self._capacity = size
+            self._alive = np.ones(size, dtype=np.bool_)
+            ids = self._columns[self.id_attribute].tolist()
+            self._rows = {id_: row for row, id_ in enumerate(ids)}
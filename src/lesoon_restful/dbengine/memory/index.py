@@ -0,0 +1,156 @@
+""" 内存服务索引模块.
+为 :class:`MemoryService` 提供二级索引,避免过滤时全量扫描.
+"""
+import bisect
+import operator
+import typing as t
+from collections import defaultdict
+
+from lesoon_restful import filters
+
+
+class BaseIndex:
+    """
+    索引基类.
+
+    Attributes:
+        attribute: 索引字段名
+
+    """
+
+    def __init__(self, attribute: str):
+        self.attribute = attribute
+
+    def add(self, id_: t.Any, value: t.Any):
+        raise NotImplementedError()
+
+    def add_many(self, pairs: t.Iterable[t.Tuple[t.Any, t.Any]]):
+        """ 批量添加 (id, 值) 对."""
+        for id_, value in pairs:
+            self.add(id_, value)
+
+    def remove(self, id_: t.Any, value: t.Any):
+        raise NotImplementedError()
+
+    def lookup(self, filter_: filters.BaseFilter,
+               value: t.Any) -> t.Optional[t.Set[t.Any]]:
+        """
+        根据过滤器查找匹配的id集合.
+
+        Args:
+            filter_: 过滤器实例
+            value: 过滤值
+
+        Returns:
+            匹配的id集合, 索引无法处理该过滤器时返回None
+
+        """
+        raise NotImplementedError()
+
+    def clear(self):
+        raise NotImplementedError()
+
+
+class HashIndex(BaseIndex):
+    """
+    哈希索引.
+    支持 eq/in 过滤.
+    """
+
+    def __init__(self, attribute: str):
+        super().__init__(attribute)
+        self._map: t.Dict[t.Any, t.Set[t.Any]] = defaultdict(set)
+
+    def add(self, id_, value):
+        self._map[value].add(id_)
+
+    def remove(self, id_, value):
+        ids = self._map.get(value)
+        if ids is None:
+            return
+        ids.discard(id_)
+        if not ids:
+            del self._map[value]
+
+    def lookup(self, filter_, value):
+        if isinstance(filter_, filters.EqualFilter):
+            return set(self._map.get(value, ()))
+        if isinstance(filter_, filters.InFilter):
+            ids: t.Set[t.Any] = set()
+            for v in value:
+                ids.update(self._map.get(v, ()))
+            return ids
+        return None
+
+    def clear(self):
+        self._map.clear()
+
+
+class SortedIndex(BaseIndex):
+    """
+    有序索引.
+    通过二分查找支持 eq/lt/lte/gt/gte/between 过滤.
+    注意: 值为None的记录不进入索引, 此时eq None的过滤将回退为全量扫描.
+    """
+
+    def __init__(self, attribute: str):
+        super().__init__(attribute)
+        self._keys: t.List[t.Any] = []
+        self._ids: t.List[t.Any] = []
+
+    def add(self, id_, value):
+        if value is None:
+            return
+        pos = bisect.bisect_right(self._keys, value)
+        self._keys.insert(pos, value)
+        self._ids.insert(pos, id_)
+
+    def add_many(self, pairs):
+        # 合并后整体排序一次, 避免逐条插入 O(n^2); 排序稳定, 等值按添加顺序
+        pairs = [(id_, value) for id_, value in pairs if value is not None]
+        if not pairs:
+            return
+        merged = list(zip(self._ids, self._keys))
+        merged.extend(pairs)
+        merged.sort(key=operator.itemgetter(1))
+        self._ids = [id_ for id_, _ in merged]
+        self._keys = [value for _, value in merged]
+
+    def remove(self, id_, value):
+        if value is None:
+            return
+        lo = bisect.bisect_left(self._keys, value)
+        hi = bisect.bisect_right(self._keys, value)
+        for pos in range(lo, hi):
+            if self._ids[pos] == id_:
+                del self._keys[pos]
+                del self._ids[pos]
+                return
+
+    def _range(self, lo: int, hi: int) -> t.Set[t.Any]:
+        return set(self._ids[lo:hi])
+
+    def lookup(self, filter_, value):
+        keys = self._keys
+        if isinstance(filter_, filters.EqualFilter):
+            if value is None:
+                return None
+            return self._range(bisect.bisect_left(keys, value),
+                               bisect.bisect_right(keys, value))
+        if isinstance(filter_, filters.LessThanFilter):
+            return self._range(0, bisect.bisect_left(keys, value))
+        if isinstance(filter_, filters.LessThanEqualFilter):
+            return self._range(0, bisect.bisect_right(keys, value))
+        if isinstance(filter_, filters.GreaterThanFilter):
+            return self._range(bisect.bisect_right(keys, value), len(keys))
+        if isinstance(filter_, filters.GreaterThanEqualFilter):
+            return self._range(bisect.bisect_left(keys, value), len(keys))
+        if isinstance(filter_, filters.DateBetweenFilter):
+            before, after = value
+            return self._range(bisect.bisect_left(keys, before),
+                               bisect.bisect_right(keys, after))
+        return None
+
+    def clear(self):
+        self._keys.clear()
+        self._ids.clear()
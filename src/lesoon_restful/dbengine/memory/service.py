@@ -1,11 +1,29 @@
+import contextlib
+import functools
+import heapq
+import itertools
+import os
+import pickle
+import tempfile
 import typing as t
+from collections import defaultdict
 
 from lesoon_common.dataclass.req import PageParam
 from marshmallow.utils import get_value
 
+from lesoon_restful.dbengine.memory.index import BaseIndex
+from lesoon_restful.dbengine.memory.index import HashIndex
+from lesoon_restful.dbengine.memory.index import SortedIndex
+from lesoon_restful.dbengine.memory.utils import filter_items
+from lesoon_restful.dbengine.memory.utils import sort_items
+from lesoon_restful.dbengine.memory.utils import sort_key
 from lesoon_restful.exceptions import ItemNotFound
-from lesoon_restful.filters import BaseFilter
+from lesoon_restful.filters import Condition
 from lesoon_restful.service import QueryService
+from lesoon_restful.utils.lock import RWLock
+
+# 快照序列化协议
+SNAPSHOT_PROTOCOL = 5
 
 
 class Pagination:
@@ -18,12 +36,89 @@ class Pagination:
 
     @classmethod
     def from_list(cls, items, page, per_page, if_page):
+        total = len(items)
         if if_page:
             start = per_page * (page - 1)
             items = items[start:start + per_page]
+        return Pagination(items, page, per_page, total)
+
+
+class MemoryQuery:
+    """
+    内存查询对象.
+    求值时才查找数据集, 过滤以生成器惰性执行, 分页排序时通过堆选取前k条,
+    避免物化与全量排序整个结果集.
+
+    Attributes:
+        lookup: 求值时调用, 返回 (候选数据集, 待过滤条件)
+        sort: 排序条件
+        lock: 求值期间持有的锁
+
+    """
+
+    def __init__(self,
+                 lookup: t.Callable[[], t.Tuple[t.Iterable[dict],
+                                                t.Sequence[Condition]]],
+                 sort: t.Sequence[tuple] = None,
+                 lock: t.Callable[[], t.ContextManager] = None):
+        self.lookup = lookup
+        self.sort = sort
+        self.lock = lock or contextlib.nullcontext
+
+    def _iter_items(self) -> t.Iterator[dict]:
+        items, conditions = self.lookup()
+        if not conditions:
+            return iter(items)
+        return filter_items(items, conditions)
+
+    def _all(self) -> t.List[dict]:
+        if self.sort:
+            return sort_items(self._iter_items(), self.sort)
+        return list(self._iter_items())
+
+    def __iter__(self):
+        with self.lock():
+            return iter(self._all())
+
+    def first(self):
+        with self.lock():
+            if not self.sort:
+                return next(self._iter_items(), None)
+            key, reverse = sort_key(self.sort)
+            select = heapq.nlargest if reverse else heapq.nsmallest
+            items = select(1, self._iter_items(), key=key)
+        return items[0] if items else None
+
+    def paginate(self, page: int, per_page: int, if_page: bool) -> Pagination:
+        with self.lock():
+            if not if_page:
+                items = self._all()
+                return Pagination(items, page, per_page, len(items))
+            return self._paginate(page, per_page)
+
+    def _paginate(self, page: int, per_page: int) -> Pagination:
+        start = per_page * (page - 1)
+        total = 0
+
+        def counted(items):
+            nonlocal total
+            for item in items:
+                total += 1
+                yield item
+
+        if self.sort:
+            # 仅选取前 page * per_page 条, 时间复杂度 O(n log k)
+            key, reverse = sort_key(self.sort)
+            select = heapq.nlargest if reverse else heapq.nsmallest
+            top = select(start + per_page, counted(self._iter_items()), key=key)
+            items = top[start:]
         else:
-            items = items
-        return Pagination(items, page, per_page, len(items))
+            iterator = counted(self._iter_items())
+            items = list(itertools.islice(iterator, start, start + per_page))
+            # 消费剩余数据以统计总数
+            for _ in iterator:
+                pass
+        return Pagination(items, page, per_page, total)
 
 
 class MemoryService(QueryService):  # noqa
@@ -31,87 +126,256 @@ class MemoryService(QueryService):  # noqa
     内存服务类.
     注意:
         此服务类只用于debug以及单元测试.
+        可通过 `Meta.hash_indexes`/`Meta.sorted_indexes` 声明二级索引,
+        过滤时优先命中索引,未命中的条件再逐条判断.
+        多线程环境下需声明 `Meta.thread_safe = True`, 此时读写操作由读写锁保护,
+        查询在求值时于读锁内完成过滤与分页, 更新以写时复制替换记录.
     """
 
+    class Meta:
+        # 哈希索引字段, 用于 eq/in 过滤
+        hash_indexes: t.Tuple[str, ...] = ()
+        # 有序索引字段, 用于 eq/lt/lte/gt/gte/between 过滤
+        sorted_indexes: t.Tuple[str, ...] = ()
+        # 快照路径, 存在时初始化自动加载
+        snapshot_path: str = None
+        # 是否线程安全
+        thread_safe: bool = False
+
     def __init__(self, meta=None, resource=None):
         super().__init__(meta, resource)
         self.id_sequence = 0
+        self.thread_safe = bool(self.meta.get('thread_safe'))
+        self._lock = RWLock() if self.thread_safe else None
+        self._init_storage()
+
+        snapshot_path = self.meta.get('snapshot_path')
+        if snapshot_path and os.path.exists(snapshot_path):
+            self.load_snapshot(snapshot_path)
+
+    def _init_storage(self):
+        """ 初始化存储结构."""
         self.items = {}
+        self._indexes: t.Dict[str, t.List[BaseIndex]] = defaultdict(list)
+        # 记录写入顺序, 索引命中的结果与全量扫描保持相同顺序
+        self._positions: t.Dict[t.Any, int] = {}
+        self._position_sequence = itertools.count()
+        self._init_indexes()
+
+    def _read_lock(self) -> t.ContextManager:
+        if self._lock is None:
+            return contextlib.nullcontext()
+        return self._lock.read_lock()
+
+    def _write_lock(self) -> t.ContextManager:
+        if self._lock is None:
+            return contextlib.nullcontext()
+        return self._lock.write_lock()
+
+    def _init_indexes(self):
+        """ 初始化二级索引."""
+        for attribute in self.meta.get('hash_indexes') or ():
+            self._indexes[attribute].append(HashIndex(attribute))
+        for attribute in self.meta.get('sorted_indexes') or ():
+            self._indexes[attribute].append(SortedIndex(attribute))
+
+    def indexes(self) -> t.List[t.Tuple[str, ...]]:
+        """ 已声明的二级索引, 均为单字段索引."""
+        return [(attribute,) for attribute in self._indexes]
+
+    def _index_item(self, id_, item: dict):
+        for attribute, indexes in self._indexes.items():
+            value = get_value(item, attribute, None)
+            for index in indexes:
+                index.add(id_, value)
+
+    def _index_items(self, items: t.Dict[t.Any, dict]):
+        """ 批量建立索引, 用于批量写入及加载快照."""
+        for attribute, indexes in self._indexes.items():
+            pairs = [(id_, get_value(item, attribute, None))
+                     for id_, item in items.items()]
+            for index in indexes:
+                index.add_many(pairs)
+
+    def _store_item(self, id_, item: dict):
+        self.items[id_] = item
+        if id_ not in self._positions:
+            self._positions[id_] = next(self._position_sequence)
+
+    def _unindex_item(self, id_, item: dict):
+        for attribute, indexes in self._indexes.items():
+            value = get_value(item, attribute, None)
+            for index in indexes:
+                index.remove(id_, value)
+
+    def _lookup_indexes(self, condition: Condition) -> t.Optional[t.Set]:
+        """ 通过索引查找满足条件的id集合, 无可用索引时返回None."""
+        for index in self._indexes.get(condition.filter.attribute, ()):
+            ids = index.lookup(condition.filter, condition.value)
+            if ids is not None:
+                return ids
+        return None
 
     def _new_item_id(self):
         self.id_sequence += 1
         return self.id_sequence
 
-    @staticmethod
-    def _filter_items(items, conditions):
-        for item in items:
-            if all(
-                    condition(get_value(item, condition.column))
-                    for condition in conditions):
-                yield item
+    def _lookup_items(
+        self, conditions: t.Sequence[Condition]
+    ) -> t.Tuple[t.Iterable[dict], t.List[Condition]]:
+        """
+        通过索引缩小候选数据集.
 
-    @staticmethod
-    def _sort_items(items, sort):
-        for field, key, reverse in reversed(sort):
-            items = sorted(items,
-                           key=lambda item: get_value(key, item, None),
-                           reverse=reverse)
-        return items
+        Returns:
+            (候选数据集, 未命中索引的过滤条件)
 
-    def _query_get_paginated_items(self, items, page, page_size, if_page):
-        return Pagination.from_list(items, page, page_size, if_page)
+        """
+        candidates = None
+        remaining = []
+        for condition in conditions:
+            ids = self._lookup_indexes(condition)
+            if ids is None:
+                remaining.append(condition)
+            elif candidates is None:
+                candidates = ids
+            else:
+                candidates &= ids
 
-    def instances(self, query=None, where=None, sort=None):
-        items = self.items.values()
+        if candidates is None:
+            # 直接迭代字典视图, 不复制数据集:
+            # 线程安全模式下求值期间持有读锁, 否则不支持并发写入,
+            # 求值过程中字典均不会被修改
+            return self.items.values(), remaining
+        ids = sorted(candidates, key=self._positions.__getitem__)
+        return [self.items[id_] for id_ in ids], remaining
 
-        if where is not None:
-            items = list(self._filter_items(items, where))
-        if sort is not None:
-            items = self._sort_items(items, sort)
+    def _query_get_paginated_items(self, query, page, page_size, if_page):
+        return query.paginate(page=page, per_page=page_size, if_page=if_page)
 
-        return items
+    def instances(self, query=None, where=None, sort=None) -> MemoryQuery:
+        # 索引查找与过滤、分页均在求值时执行, 线程安全模式下于读锁内完成, 仅复制结果
+        return MemoryQuery(functools.partial(self._lookup_items, where or ()),
+                           sort=sort,
+                           lock=self._read_lock)
 
     def first(self, where=None, sort=None):
-        try:
-            return next(self.instances(where, sort))
-        except StopIteration:
+        res = self.instances(where=where, sort=sort).first()
+        if res is None:
             raise ItemNotFound()
+        return res
+
+    def _assign_id(self, item: dict):
+        """ 分配记录id, 需在写锁内调用."""
+        if self.id_attribute not in item:
+            item[self.id_attribute] = self._new_item_id()
+        elif isinstance(item[self.id_attribute], int):
+            # 避免序列回退导致id重复分配
+            self.id_sequence = max(self.id_sequence, item[self.id_attribute])
+        return item[self.id_attribute]
+
+    def _unindex_existing(self, id_):
+        """ 显式id已存在时, 移除被覆盖记录的索引, 需在写锁内调用."""
+        item = self.items.get(id_)
+        if item is not None:
+            self._unindex_item(id_, item)
 
     def _create_one(self, item: dict):
-        item_id = self._new_item_id()
-        if not self.id_attribute in item:
-            item[self.id_attribute] = item_id
-        else:
-            self.id_sequence = item[self.id_attribute]
-        self.items[item_id] = item
+        with self._write_lock():
+            item_id = self._assign_id(item)
+            self._unindex_existing(item_id)
+            self._store_item(item_id, item)
+            self._index_item(item_id, item)
         return item
 
     def _create_many(self, items: t.List[dict]):
-        new_items = []
-        for item in items:
-            new_items.append(self._create_one(item=item))
-        return new_items
+        with self._write_lock():
+            new_items = {}
+            for item in items:
+                item_id = self._assign_id(item)
+                self._unindex_existing(item_id)
+                self._store_item(item_id, item)
+                new_items[item_id] = item
+            self._index_items(new_items)
+        return items
 
     def _update_one(self, item: dict, changes: dict):
-        item.update(changes)
         item_id = item[self.id_attribute]
+        with self._write_lock():
+            # 读取后记录可能已被并发删除, 不能以旧记录写回
+            if item_id not in self.items:
+                raise ItemNotFound()
+            item = self.items[item_id]
+            self._unindex_item(item_id, item)
+            if self.thread_safe:
+                # 写时复制, 读者持有的旧记录保持不变
+                item = {**item, **changes}
+            else:
+                item.update(changes)
 
-        self.items[item_id] = item
+            self._store_item(item_id, item)
+            self._index_item(item_id, item)
         return item
 
     def _update_many(self, items: t.List[dict], changes: t.List[dict]):
         updated_items = []
-        for item, change in zip(items, changes):
-            updated_items.append(self._update_one(item, changes=change))
+        with self._write_lock():
+            for item, change in zip(items, changes):
+                updated_items.append(self._update_one(item, changes=change))
 
         return updated_items
 
     def _delete_one(self, id_: int):
-        del self.items[id_]
+        with self._write_lock():
+            item = self.items.pop(id_, None)
+            if item is not None:
+                self._positions.pop(id_, None)
+                self._unindex_item(id_, item)
 
     def _delete_many(self, ids: t.List[int]):
-        for id_ in ids:
-            self._delete_one(id_)
+        with self._write_lock():
+            for id_ in ids:
+                self._delete_one(id_)
 
     def read(self, id_):
-        return self.items.get(id_)
+        with self._read_lock():
+            return self.items.get(id_)
+
+    def save_snapshot(self, path: str):
+        """
+        保存快照.
+        先写入唯一的临时文件再替换, 保证快照文件完整, 并发保存互不干扰.
+
+        Args:
+            path: 快照文件路径
+
+        """
+        directory, name = os.path.split(path)
+        fd, tmp_path = tempfile.mkstemp(prefix=f'{name}.',
+                                        suffix='.tmp',
+                                        dir=directory or '.')
+        try:
+            with self._read_lock(), os.fdopen(fd, 'wb') as f:
+                state = {'id_sequence': self.id_sequence, 'items': self.items}
+                pickle.dump(state, f, protocol=SNAPSHOT_PROTOCOL)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def load_snapshot(self, path: str):
+        """
+        加载快照, 并重建二级索引.
+
+        Args:
+            path: 快照文件路径
+
+        """
+        with open(path, 'rb') as f:
+            state = pickle.load(f)
+
+        with self._write_lock():
+            self._init_storage()
+            self.id_sequence = state['id_sequence']
+            for id_, item in state['items'].items():
+                self._store_item(id_, item)
+            self._index_items(self.items)
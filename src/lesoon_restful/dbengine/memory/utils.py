@@ -0,0 +1,94 @@
+import typing as t
+
+from marshmallow.utils import get_value
+
+from lesoon_restful.filters import Condition
+
+
+class SortKey:
+    """
+    多字段排序键.
+    各字段可独立指定升降序, None视为最小值.
+
+    Attributes:
+        values: 排序字段值
+        reverses: 各字段是否降序
+
+    """
+    __slots__ = ('values', 'reverses')
+
+    def __init__(self, values: tuple, reverses: t.Tuple[bool, ...]):
+        self.values = values
+        self.reverses = reverses
+
+    def __eq__(self, other: object) -> bool:
+        # heapq会以元组 (key, order, item) 比较, 需定义相等以保证稳定性
+        return isinstance(other, SortKey) and self.values == other.values
+
+    def __lt__(self, other: 'SortKey') -> bool:
+        for a, b, reverse in zip(self.values, other.values, self.reverses):
+            if a == b:
+                continue
+            if a is None:
+                return not reverse
+            if b is None:
+                return reverse
+            return a > b if reverse else a < b
+        return False
+
+
+def sort_key(sort: t.Sequence[tuple]) -> t.Tuple[t.Callable, bool]:
+    """
+    生成多字段排序键函数.
+
+    Args:
+        sort: 排序条件 ((field, attribute, reverse), ...)
+
+    Returns:
+        (key, reverse) 可直接用于 `sorted`/`heapq`
+
+    """
+    keys = tuple(key for _, key, _ in sort)
+    reverses = tuple(reverse for _, _, reverse in sort)
+
+    if len(set(reverses)) == 1:
+        # 排序方向一致时使用元组作为排序键,比较在C层完成
+        # (v is not None, v) 保证None视为最小值且不参与比较
+        def key(item):
+            return tuple((v is not None, v)
+                         for v in (get_value(item, k, None) for k in keys))
+
+        return key, reverses[0]
+
+    def cmp_key(item):
+        return SortKey(tuple(get_value(item, k, None) for k in keys), reverses)
+
+    return cmp_key, False
+
+
+def filter_items(items: t.Iterable[t.Any],
+                 conditions: t.Sequence[Condition]) -> t.Iterator[t.Any]:
+    """ 惰性过滤满足全部条件的数据."""
+    for item in items:
+        if all(
+                condition.filter.op(get_value(item, condition.column),
+                                    condition.value)
+                for condition in conditions):
+            yield item
+
+
+def sort_items(items: t.Iterable[t.Any],
+               sort: t.Sequence[tuple]) -> t.List[t.Any]:
+    """
+    单次多字段排序.
+
+    Args:
+        items: 数据集
+        sort: 排序条件 ((field, attribute, reverse), ...)
+
+    Returns:
+        排序后的列表
+
+    """
+    key, reverse = sort_key(sort)
+    return sorted(items, key=key, reverse=reverse)
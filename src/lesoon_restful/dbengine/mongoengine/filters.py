@@ -1,52 +1,83 @@
+import typing as t
+
 from marshmallow import fields as ma_fields
+from mongoengine import Document
+from mongoengine.base import BaseField
 
 from lesoon_restful import filters
+from lesoon_restful.filters import Condition
+
+# 列表类查询值需逐项转换的操作
+LIST_QUERY_OPS = ('in', 'nin')
 
 
 class EqualFilter(filters.EqualFilter):
 
+    OPERATOR = '$eq'
+
     def op(self, column, value):
         return {column: value}
 
 
 class NotEqualFilter(filters.NotEqualFilter):
 
+    OPERATOR = '$ne'
+    QUERY_OP = 'ne'
+
     def op(self, column, value):
         return {f'{column}__ne': value}
 
 
 class LessThanFilter(filters.LessThanFilter):
 
+    OPERATOR = '$lt'
+    QUERY_OP = 'lt'
+
     def op(self, column, value):
         return {f'{column}__lt': value}
 
 
 class LessThanEqualFilter(filters.LessThanEqualFilter):
 
+    OPERATOR = '$lte'
+    QUERY_OP = 'lte'
+
     def op(self, column, value):
         return {f'{column}__lte': value}
 
 
 class GreaterThanFilter(filters.GreaterThanFilter):
 
+    OPERATOR = '$gt'
+    QUERY_OP = 'gt'
+
     def op(self, column, value):
         return {f'{column}__gt': value}
 
 
 class GreaterThanEqualFilter(filters.GreaterThanEqualFilter):
 
+    OPERATOR = '$gte'
+    QUERY_OP = 'gte'
+
     def op(self, column, value):
         return {f'{column}__gte': value}
 
 
 class InFilter(filters.InFilter):
 
+    OPERATOR = '$in'
+    QUERY_OP = 'in'
+
     def op(self, column, value):
         return {f'{column}__in': value}
 
 
 class NotInFilter(filters.NotInFilter):
 
+    OPERATOR = '$nin'
+    QUERY_OP = 'nin'
+
     def op(self, column, value):
         return {f'{column}__nin': value}
 
@@ -59,36 +90,54 @@ class ContainsFilter(filters.ContainsFilter):
 
 class StringContainsFilter(filters.StringContainsFilter):
 
+    OPERATOR = '$regex'
+    QUERY_OP = 'contains'
+
     def op(self, column, value):
         return {f'{column}__contains': value}
 
 
 class StringIContainsFilter(filters.StringIContainsFilter):
 
+    OPERATOR = '$regex'
+    QUERY_OP = 'icontains'
+
     def op(self, column, value):
         return {f'{column}__icontains': value}
 
 
 class StartsWithFilter(filters.StartsWithFilter):
 
+    OPERATOR = '$regex'
+    QUERY_OP = 'startswith'
+
     def op(self, column, value):
         return {f'{column}__startswith': value}
 
 
 class IStartsWithFilter(filters.IStartsWithFilter):
 
+    OPERATOR = '$regex'
+    QUERY_OP = 'istartswith'
+
     def op(self, column, value):
         return {f'{column}__istartswith': value}
 
 
 class EndsWithFilter(filters.EndsWithFilter):
 
+    OPERATOR = '$regex'
+    QUERY_OP = 'endswith'
+
     def op(self, column, value):
         return {f'{column}__endswith': value}
 
 
 class IEndsWithFilter(filters.IEndsWithFilter):
 
+    OPERATOR = '$regex'
+    QUERY_OP = 'iendswith'
+
     def op(self, column, value):
         return {f'{column}__iendswith': value}
 
@@ -99,23 +148,24 @@ NumberFilters = (LessThanFilter, LessThanEqualFilter, GreaterThanFilter,
 StringFilters = (StringContainsFilter, StringIContainsFilter, StartsWithFilter,
                  IStartsWithFilter, EndsWithFilter, IEndsWithFilter)
 
-FILTER_NAMES = ((EqualFilter, None), (EqualFilter, filters.Equal),
-                (NotEqualFilter,
-                 filters.NotEqual), (LessThanFilter,
-                                     filters.LessThan), (LessThanEqualFilter,
-                                                         filters.LessThanEqual),
-                (GreaterThanFilter,
-                 filters.GreaterThanEqual), (GreaterThanEqualFilter,
-                                             filters.GreaterThanEqual),
-                (InFilter, filters.In), (NotInFilter, filters.NotIn),
-                (ContainsFilter, filters.Contains), (StringContainsFilter,
-                                                     filters.Contains),
-                (StringIContainsFilter,
-                 filters.IContains), (StartsWithFilter, filters.StartsWith),
-                (IStartsWithFilter,
-                 filters.IStartsWith), (EndsWithFilter,
-                                        filters.EndsWith), (IEndsWithFilter,
-                                                            filters.IEndsWith))
+FILTER_NAMES = (
+    (EqualFilter, None),
+    (EqualFilter, filters.Equal),
+    (NotEqualFilter, filters.NotEqual),
+    (LessThanFilter, filters.LessThan),
+    (LessThanEqualFilter, filters.LessThanEqual),
+    (GreaterThanFilter, filters.GreaterThan),
+    (GreaterThanEqualFilter, filters.GreaterThanEqual),
+    (InFilter, filters.In),
+    (NotInFilter, filters.NotIn),
+    (ContainsFilter, filters.Contains),
+    (StringContainsFilter, filters.Contains),
+    (StringIContainsFilter, filters.IContains),
+    (StartsWithFilter, filters.StartsWith),
+    (IStartsWithFilter, filters.IStartsWith),
+    (EndsWithFilter, filters.EndsWith),
+    (IEndsWithFilter, filters.IEndsWith),
+)
 
 FILTERS_BY_FIELD = (
     (ma_fields.Boolean, CommonFilters),
@@ -125,3 +175,45 @@ FILTERS_BY_FIELD = (
     (ma_fields.String, CommonFilters + StringFilters),  # noqa
     (ma_fields.List, (ContainsFilter,)),
 )
+
+
+def _prepare_value(field: BaseField, op: t.Optional[str], value: t.Any):
+    if op in LIST_QUERY_OPS:
+        return [field.prepare_query_value(op, v) for v in value]
+    return field.prepare_query_value(op, value)
+
+
+def compile_raw_query(conditions: t.Iterable[Condition],
+                      model: t.Type[Document]) -> t.Optional[dict]:
+    """
+    将过滤条件编译为MongoDB原生查询文档, 跳过mongoengine关键字参数解析.
+    同一字段的多个条件合并为同一操作符文档, 操作符重复时以$and追加.
+
+    Args:
+        conditions: 过滤条件
+        model: 文档模型
+
+    Returns:
+        原生查询文档, 存在无法编译的条件(如嵌套字段、列表包含)时返回None
+
+    """
+    query: t.Dict[str, t.Any] = {}
+    duplicated = []
+    for condition in conditions:
+        filter_ = condition.filter
+        operator = getattr(filter_, 'OPERATOR', None)
+        field = model._fields.get(condition.column)  # noqa
+        if operator is None or field is None:
+            return None
+
+        value = _prepare_value(field, getattr(filter_, 'QUERY_OP', None),
+                               condition.value)
+        operators = query.setdefault(field.db_field, {})
+        if operator in operators:
+            duplicated.append({field.db_field: {operator: value}})
+        else:
+            operators[operator] = value
+
+    if duplicated:
+        query['$and'] = duplicated
+    return query
@@ -1,14 +1,29 @@
+import functools
+import json
+import operator
 import typing as t
 
+from bson import json_util
 from flask_mongoengine import BaseQuerySet
 from flask_mongoengine import Document
+from lesoon_common.dataclass.req import PageParam
 from lesoon_common.utils.str import camelcase
+from lesoon_common.wrappers.alchemy import Pagination
+from mongoengine.queryset.visitor import Q
+from mongoengine.queryset.visitor import QNode
+from pymongo import UpdateOne
+from werkzeug.utils import cached_property
 
+from lesoon_restful.dbengine.mongoengine.filters import compile_raw_query
 from lesoon_restful.dbengine.mongoengine.filters import FILTER_NAMES
 from lesoon_restful.dbengine.mongoengine.filters import FILTERS_BY_FIELD
+from lesoon_restful.exceptions import ItemNotFound
 from lesoon_restful.resource import ModelResource
 from lesoon_restful.service import QueryService
 
+# 过滤表达式: 关键字参数字典或Q组合
+Expression = t.Union[dict, QNode]
+
 
 class MongoEngineService(QueryService):
     """
@@ -18,15 +33,24 @@ class MongoEngineService(QueryService):
     FILTER_NAMES = FILTER_NAMES
     FILTERS_BY_FIELD = FILTERS_BY_FIELD
 
+    class Meta:
+        # 批量更新时bulk_write是否有序执行, 无序执行时单条失败不影响其余更新
+        bulk_write_ordered: bool = True
+        # 分页时是否使用$facet聚合管道, 单次请求同时返回当前页数据与总数.
+        # 聚合结果不做引用字段的select_related解引用.
+        facet_paginate: bool = False
+        # 列表分页是否返回按schema字段投影的pymongo原始文档, 跳过Document实例化.
+        # 原始文档以属性名为键交由schema序列化, 依赖文档实例的字段(如fields.Method)不可用.
+        as_pymongo: bool = False
+
     def _init_model(self):
         super()._init_model()
         self.id_column = self.model._fields[self.id_attribute]  # noqa
 
-    def _and_expression(self, expressions: t.List[dict]):
-        and_expression: t.Dict[str, str] = {}
-        for expression in expressions:
-            and_expression.update(**expression)
-        return and_expression
+    def _and_expression(self, expressions: t.List[dict]) -> QNode:
+        # 以Q组合合并, 同一字段的多个条件不会相互覆盖
+        return functools.reduce(operator.and_,
+                                (Q(**expression) for expression in expressions))
 
     def _or_expression(self, expressions):
         # TODO:暂未实现
@@ -35,9 +59,20 @@ class MongoEngineService(QueryService):
     def _query(self):
         return self.model.objects
 
-    def _query_filter(self, query: BaseQuerySet, expression: dict):
+    def _query_filter(self, query: BaseQuerySet, expression: Expression):
+        if isinstance(expression, QNode):
+            return query(expression)
         return query(**expression)
 
+    def instances(self, query=None, where=None, sort=None):
+        if where:
+            raw = compile_raw_query(where, self.model)
+            if raw is not None:
+                query = self._page_query() if query is None else query
+                query = self._query_filter(query, {'__raw__': raw})
+                where = None
+        return super().instances(query=query, where=where, sort=sort)
+
     def _query_get_first(self, query: BaseQuerySet):
         return query.first()
 
@@ -56,8 +91,130 @@ class MongoEngineService(QueryService):
 
     def _query_get_paginated_items(self, query: BaseQuerySet, page: int,
                                    page_size: int, if_page: bool):
+        pageable = if_page and page > 0 and page_size > 0
+        if pageable and self.meta.get('facet_paginate'):
+            return self._query_get_paginated_items_by_facet(
+                query, page, page_size)
+        if self.meta.get('as_pymongo') and (pageable or not if_page):
+            return self._query_get_paginated_raw_items(query, page, page_size,
+                                                       if_page)
         return query.paginate(page=page, per_page=page_size, if_page=if_page)
 
+    def _explain(self, query: BaseQuerySet,
+                 page_param: PageParam) -> t.Tuple[dict, dict]:
+        """ 以explain获取当前页查询的执行计划."""
+        query = query.clone()
+        if page_param.if_page and page_param.page > 0 and page_param.page_size > 0:
+            query = query.skip((page_param.page - 1) *
+                               page_param.page_size).limit(page_param.page_size)
+
+        statement = {
+            'filter': query._query,  # noqa
+            'sort':
+                query._ordering  # noqa
+        }
+        # 执行计划中的bson类型转换为可JSON序列化的值
+        return (json.loads(json_util.dumps(statement)),
+                json.loads(json_util.dumps(query.explain())))
+
+    @cached_property
+    def _raw_fields(self) -> t.List[t.Tuple[str, str]]:
+        """ schema序列化字段对应的(数据库字段名, 属性名)."""
+        model_fields = self.model._fields  # noqa
+        raw_fields = []
+        for name, field in self.schema.dump_fields.items():
+            attribute = field.attribute or name
+            model_field = model_fields.get(attribute)
+            if model_field is not None:
+                raw_fields.append((model_field.db_field, attribute))
+        return raw_fields
+
+    def _projection(self) -> t.Dict[str, int]:
+        """ 根据schema序列化字段生成$project."""
+        projection = {'_id': 1}
+        if self.model._meta.get('allow_inheritance'):  # noqa
+            projection['_cls'] = 1
+        for db_field, _ in self._raw_fields:
+            projection[db_field] = 1
+        return projection
+
+    def _raw_to_dict(self, son: dict) -> dict:
+        """ 原始文档转换为以属性名为键的字典, 可直接由schema序列化."""
+        return {
+            attribute: son[db_field]
+            for db_field, attribute in self._raw_fields
+            if db_field in son
+        }
+
+    def _query_get_paginated_raw_items(self, query: BaseQuerySet, page: int,
+                                       page_size: int,
+                                       if_page: bool) -> Pagination:
+        """
+        pymongo原始文档分页.
+        按schema字段投影, 不解引用且不实例化Document.
+        """
+        raw_query = query.only(
+            *(attribute for _, attribute in self._raw_fields))
+        raw_query = raw_query.no_dereference().as_pymongo()
+        if if_page:
+            total = query.count()
+            raw_query = raw_query.skip((page - 1) * page_size).limit(page_size)
+        items = [self._raw_to_dict(son) for son in raw_query]
+        return Pagination(query=None,
+                          page=page,
+                          per_page=page_size,
+                          total=total if if_page else len(items),
+                          items=items)
+
+    def _query_get_paginated_items_by_facet(self, query: BaseQuerySet,
+                                            page: int,
+                                            page_size: int) -> Pagination:
+        """
+        $facet聚合分页.
+        过滤及排序条件由 `QuerySet.aggregate` 生成$match/$sort阶段.
+        """
+        facet = {
+            'items': [{
+                '$skip': (page - 1) * page_size
+            }, {
+                '$limit': page_size
+            }, {
+                '$project': self._projection()
+            }],
+            'total': [{
+                '$count': 'count'
+            }]
+        }
+        result = next(query.aggregate([{'$facet': facet}]))
+        if self.meta.get('as_pymongo'):
+            items = [self._raw_to_dict(son) for son in result['items']]
+        else:
+            items = [
+                self.model._from_son(son)  # noqa
+                for son in result['items']
+            ]
+        total = result['total'][0]['count'] if result['total'] else 0
+        return Pagination(query=None,
+                          page=page,
+                          per_page=page_size,
+                          total=total,
+                          items=items)
+
+    def indexes(self) -> t.List[t.Tuple[str, ...]]:
+        attributes = {
+            field.db_field: name
+            for name, field in self.model._fields.items()  # noqa
+        }
+        indexes = [('id',)]
+        for spec in self.model._meta.get('index_specs') or []:  # noqa
+            # 继承文档索引前缀的_cls由mongoengine自动附加到查询条件中
+            indexes.append(
+                tuple(
+                    attributes.get(key, key)
+                    for key, _ in spec['fields']
+                    if key != '_cls'))
+        return indexes
+
     def set_resource_name(self, resource: t.Type[ModelResource]):
         # 没有资源名称,则取模型对应的集合名称
         if not hasattr(resource.Meta, 'name'):
@@ -78,13 +235,50 @@ class MongoEngineService(QueryService):
         item.save()
         return item
 
+    def _read_many_or_raise(self, ids: t.List[t.Any]) -> t.List[Document]:
+        """ 单次查询获取多个文档, 按ids顺序返回, 任一不存在则抛异常."""
+        query = self._query_filter(self.query,
+                                   {f'{self.id_attribute}__in': ids})
+        items = {str(getattr(item, self.id_attribute)): item for item in query}
+        try:
+            return [items[str(id_)] for id_ in ids]
+        except KeyError:
+            raise ItemNotFound()
+
+    def update(self, properties: t.Union[dict, t.List[dict]]):
+        if isinstance(properties, dict):
+            return super().update(properties)
+
+        items = self._read_many_or_raise(
+            [p.get(self.id_attribute) for p in properties])
+        return self.update_many(items=items, changes=properties)
+
     def _update_many(self, items: t.List[Document],
                      changes: t.List[dict]) -> t.List[Document]:
-        updated_items = []
+        """
+        批量更新.
+        变更字段通过单次 `bulk_write` 写入, 不触发mongoengine的save信号.
+        """
+        operations = []
         for item, change in zip(items, changes):
-            updated_items.append(self._update_one(item, change))
+            self.schema.load(change, instance=item, partial=True)  # noqa
+            item.validate()
+            set_data, unset_data = item._delta()  # noqa
+            update = {}
+            if set_data:
+                update['$set'] = set_data
+            if unset_data:
+                update['$unset'] = unset_data
+            if update:
+                operations.append(UpdateOne({'_id': item.pk}, update))
 
-        return updated_items
+        if operations:
+            self.model._get_collection().bulk_write(  # noqa
+                operations,
+                ordered=self.meta.get('bulk_write_ordered', True))
+        for item in items:
+            item._clear_changed_fields()  # noqa
+        return items
 
     def _delete_one(self, id_: int):
         self._delete_many(ids=[id_])
@@ -38,3 +38,9 @@ class FilterInvalid(RestfulException):
 
 class FilterNotAllow(RestfulException):
     pass
+
+
+class QueryBudgetExceeded(RestfulException):
+
+    def __init__(self, code=None, msg='SQL查询次数超出预算'):
+        super().__init__(code, msg)
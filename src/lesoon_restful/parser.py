@@ -1,19 +1,168 @@
 import functools
 import json
 import typing as t
+from collections.abc import Mapping
 
 import marshmallow as ma
 from lesoon_common import RequestError
 from lesoon_common import ResponseCode
 from lesoon_common.schema import CamelSchema
 from lesoon_common.utils.str import camelcase
+from webargs.core import _ensure_list_of_callables
 from webargs.core import _UNKNOWN_DEFAULT_PARAM
 from webargs.core import ArgMap
+from webargs.core import Parser
 from webargs.core import Request
 from webargs.core import ValidateArg
 from webargs.flaskparser import FlaskParser
 
 from lesoon_restful.openapi.utils import merge_specs
+from lesoon_restful.utils.metrics import timed_phase
+
+# 快速解析字段: (数据键, 字段名, 结果键, 字段, 是否为多值字段)
+FastField = t.Tuple[str, str, str, ma.fields.Field, bool]
+
+
+class FastArgs:
+    """
+    扁平dict参数的快速解析.
+    直接读取请求数据并逐字段类型转换, 跳过MultiDictProxy及schema.load;
+    出现校验错误时返回None, 交由常规解析流程抛出相同的错误.
+
+    Attributes:
+        parser: 解析器
+        schema: 参数schema
+        location: 参数位置
+        fields: 快速解析字段
+        raise_unknown: 存在未定义字段时是否报错
+
+    """
+    # 位置 -> 读取请求数据的方法名
+    LOADERS = {
+        'query': '_load_args',
+        'querystring': '_load_args',
+        'form': '_load_form',
+        'headers': '_load_headers',
+        'cookies': '_load_cookies',
+        'view_args': '_load_view_args',
+        'json': '_load_json',
+        'list_json': '_load_list_json'
+    }
+    # 数据为MultiDict的位置
+    MULTIDICT_LOCATIONS = ('query', 'querystring', 'form', 'headers')
+
+    def __init__(self, parser: 'WebArgParser', schema: ma.Schema, location: str,
+                 fields: t.List[FastField], raise_unknown: bool):
+        self.parser = parser
+        self.schema = schema
+        self.location = location
+        self.fields = fields
+        self.raise_unknown = raise_unknown
+        self.keys = frozenset(key for key, *_ in fields)
+        self.load = getattr(self, self.LOADERS[location])
+
+    @classmethod
+    def compile(cls, parser: 'WebArgParser', schema: ma.Schema, location: str,
+                unknown: t.Optional[str]) -> t.Optional['FastArgs']:
+        """ 编译快速解析, 参数不满足扁平字段、单一位置等条件时返回None."""
+        if location not in cls.LOADERS or schema.many:
+            return None
+        # list_json仅允许定义一个字段, 否则由常规解析报错
+        if location == 'list_json' and len(schema.load_fields) != 1:
+            return None
+        # 自定义的数据读取、预处理及schema钩子需经完整解析流程
+        loader = parser.__location_map__.get(location)
+        if not isinstance(loader, str):
+            return None
+        if getattr(type(parser), loader) is not getattr(WebArgParser, loader):
+            return None
+        if type(parser).pre_load is not Parser.pre_load:
+            return None
+        if any(schema._hooks.values()):  # noqa
+            return None
+
+        unknown = unknown or schema.unknown
+        if unknown == ma.INCLUDE or (unknown == ma.RAISE and
+                                     location in cls.MULTIDICT_LOCATIONS):
+            return None
+
+        fields = []
+        for name, field in schema.load_fields.items():
+            if _is_nested(field):
+                return None
+            attribute = field.attribute or name
+            if '.' in attribute:
+                return None
+            key = field.data_key if field.data_key is not None else name
+            multiple = getattr(field, 'is_multiple', None)
+            if multiple is None:
+                multiple = isinstance(field, tuple(parser.KNOWN_MULTI_FIELDS))
+            fields.append((key, name, attribute, field, multiple))
+        return cls(parser, schema, location, fields, unknown == ma.RAISE)
+
+    def _load_args(self, req: Request) -> t.Mapping:
+        return req.args
+
+    def _load_form(self, req: Request) -> t.Mapping:
+        return req.form
+
+    def _load_headers(self, req: Request) -> t.Mapping:
+        return req.headers
+
+    def _load_cookies(self, req: Request) -> t.Mapping:
+        return req.cookies
+
+    def _load_view_args(self, req: Request) -> t.Mapping:
+        return req.view_args or {}
+
+    def _load_json(self, req: Request) -> t.Any:
+        data = self.parser.load_json(req, self.schema)
+        return {} if data is ma.missing else data
+
+    def _load_list_json(self, req: Request) -> t.Mapping:
+        data = req.get_json(silent=True)
+        return {self.fields[0][0]: data} if data else {}
+
+    def parse(self, req: Request,
+              validators: t.List[t.Callable]) -> t.Optional[dict]:
+        data = self.load(req)
+        if not isinstance(data, Mapping):
+            return None
+        if self.raise_unknown and not self.keys.issuperset(data):
+            return None
+
+        result = {}
+        try:
+            for key, name, attribute, field, multiple in self.fields:
+                value = data.get(key, ma.missing)
+                if multiple and value is not ma.missing:
+                    value = _getlist(data, key, value)
+                value = field.deserialize(value, name, data)
+                if value is not ma.missing:
+                    result[attribute] = value
+            self.parser._validate_arguments(result, validators)  # noqa
+        except ma.ValidationError:
+            return None
+        return result
+
+
+def _is_nested(field: ma.fields.Field) -> bool:
+    if isinstance(field, (ma.fields.Nested, ma.fields.Pluck)):
+        return True
+    inners = getattr(field, 'tuple_fields', None) or [
+        getattr(field, 'inner', None),
+        getattr(field, 'value_field', None)
+    ]
+    return any(inner is not None and _is_nested(inner) for inner in inners)
+
+
+def _getlist(data: t.Mapping, key: str, value: t.Any) -> t.Any:
+    """ 与MultiDictProxy一致的多值读取."""
+    if hasattr(data, 'getlist'):
+        return data.getlist(key)
+    if isinstance(value, (list, tuple)) or value is None:
+        return value
+    return [value]
 
 
 class WebArgParser(FlaskParser):
@@ -31,6 +180,17 @@ class WebArgParser(FlaskParser):
                                     cookies='cookies',
                                     files='files')
 
+    # dict参数是否使用快速解析
+    FAST_PARSE = True
+
+    def _unknown_for(self, location: str, unknown: t.Optional[str]):
+        """ 与 `parse` 一致的未定义字段处理方式."""
+        if unknown != _UNKNOWN_DEFAULT_PARAM:
+            return unknown
+        if self.unknown != _UNKNOWN_DEFAULT_PARAM:
+            return self.unknown
+        return self.DEFAULT_UNKNOWN_BY_LOCATION.get(location)
+
     def use_args(
         self,
         argmap: ArgMap,
@@ -73,11 +233,17 @@ class WebArgParser(FlaskParser):
         def decorator(func):
             req_ = request_obj
             argmap_ = argmap
+            fast_args = None
+            validators = _ensure_list_of_callables(validate)
             # Optimization: If argmap is passed as a dictionary, we only need
             # to generate a Schema once
             if isinstance(argmap_, t.Mapping):
                 name = f'{camelcase(func.__name__, upper=True)}Param'
                 argmap_ = self.schema_class.from_dict(argmap_, name=name)()
+                if self.FAST_PARSE:
+                    fast_args = FastArgs.compile(
+                        self, argmap_, location,
+                        self._unknown_for(location, unknown))
 
             # --- swagger ---
             func.specs_dict = getattr(func, 'specs_dict', {})
@@ -97,15 +263,21 @@ class WebArgParser(FlaskParser):
                         func, args, kwargs)
 
                 # NOTE: At this point, argmap may be a Schema, or a callable
-                parsed_args = self.parse(
-                    argmap_,
-                    req=req_obj,
-                    location=location,
-                    unknown=unknown,
-                    validate=validate,
-                    error_status_code=error_status_code,
-                    error_headers=error_headers,
-                )
+                with timed_phase('parse'):
+                    parsed_args = None
+                    if fast_args is not None:
+                        parsed_args = fast_args.parse(
+                            req_obj or self.get_default_request(), validators)
+                    if parsed_args is None:
+                        parsed_args = self.parse(
+                            argmap_,
+                            req=req_obj,
+                            location=location,
+                            unknown=unknown,
+                            validate=validate,
+                            error_status_code=error_status_code,
+                            error_headers=error_headers,
+                        )
                 args, kwargs = self._update_args_kwargs(args, kwargs,
                                                         parsed_args, as_kwargs)
                 return func(*args, **kwargs)
@@ -13,6 +13,7 @@ from lesoon_restful.parser import use_args
 from lesoon_restful.route import ItemRoute
 from lesoon_restful.route import Route
 from lesoon_restful.utils.base import AttributeDict
+from lesoon_restful.utils.metrics import timed_phase
 
 if t.TYPE_CHECKING:
     from lesoon_restful.api import Api
@@ -90,6 +91,8 @@ class Resource(metaclass=ResourceMeta):
         exclude_routes: t.Tuple[str, ...] = ()
         route_decorators: t.Dict[str, t.Union[t.Callable,
                                               t.List[t.Callable]]] = {}
+        # 单个请求SQL查询次数预算, 可按路由关系名配置: {'instances': 3}
+        query_budget: t.Union[int, t.Dict[str, int]] = None
 
 
 class ModelResourceMeta(ResourceMeta):
@@ -124,53 +127,55 @@ class ModelResource(Resource, metaclass=ModelResourceMeta):
         sortable: bool = True
         service: t.Type['Service'] = None
 
+    def dump(self, obj: t.Any, many: bool = None) -> t.Any:
+        """ 序列化, 开启路由指标时记录序列化耗时."""
+        with timed_phase('serialize'):
+            return self.schema.dump(obj, many=many)
+
     @Route.GET('', rel='instances')
     @cover_swag(description='获取分页对象')
     def instances(self):
         pagination = self.service.paginated_instances()
-        results = self.schema.dump(pagination.items, many=True)
+        results = self.dump(pagination.items, many=True)
         return self.response_cls.success(result=results, total=pagination.total)
 
     @ItemRoute.GET('', rel='instance')
     def read(self, item: object):
-        return self.response_cls.success(self.schema.dump(item))
+        return self.response_cls.success(self.dump(item))
 
     @Route.POST('', rel='create_entrance')
     @cover_swag(description='单条新增')
     @use_args(Include, location='json')
     def create(self, properties: dict):
         item = self.service.create(properties)
-        return self.response_cls.success(result=self.schema.dump(item),
-                                         msg='新建成功')
+        return self.response_cls.success(result=self.dump(item), msg='新建成功')
 
     @Route.POST('/batch', rel='create_many')
     @cover_swag(description='批量新增')
     @use_args(IncludeMany, location='json')
     def create_many(self, properties: t.List[dict]):
         item = self.service.create(properties)
-        return self.response_cls.success(result=self.schema.dump(item),
-                                         msg='新建成功')
+        return self.response_cls.success(result=self.dump(item), msg='新建成功')
 
     @Route.PUT('', rel='update_entrance')
     @cover_swag(description='单条更新')
     @use_args(Include, location='json')
     def update(self, properties: dict):
         item = self.service.update(properties)
-        return self.response_cls.success(self.schema.dump(item), msg='更新成功')
+        return self.response_cls.success(self.dump(item), msg='更新成功')
 
     @Route.PUT('/batch', rel='update_many')
     @cover_swag(description='批量更新')
     @use_args(IncludeMany, location='json')
     def update_many(self, properties: t.List[dict]):
         item = self.service.update(properties)
-        return self.response_cls.success(self.schema.dump(item), msg='更新成功')
+        return self.response_cls.success(self.dump(item), msg='更新成功')
 
     @ItemRoute.PUT('', rel='update_instance')
     @use_args(Include, location='json')
     def update_instance(self, item: object, properties: dict):
         item = self.service._update_one(item, properties)
-        return self.response_cls.success(result=self.schema.dump(item),
-                                         msg='更新成功')
+        return self.response_cls.success(result=self.dump(item), msg='更新成功')
 
     @Route.DELETE('', rel='delete_entrance')
     @cover_swag(description='批量删除')
@@ -189,3 +194,74 @@ class ModelResource(Resource, metaclass=ModelResourceMeta):
         id_ = getattr(item, self.service.id_attribute)
         self.service._delete_one(id_)
         return self.response_cls.success(msg='删除成功')
+
+
+class AsyncModelResource(ModelResource):
+    """
+    异步模型资源类.
+    配合 :class:`AsyncSQLAlchemyService` 使用, 路由以Flask2.0 async视图注册.
+    注意: 需安装 `flask[async]`.
+    """
+
+    @Route.GET('', rel='instances')
+    @cover_swag(description='获取分页对象')
+    async def instances(self):
+        pagination = await self.service.paginated_instances()
+        results = self.dump(pagination.items, many=True)
+        return self.response_cls.success(result=results, total=pagination.total)
+
+    @ItemRoute.GET('', rel='instance')
+    async def read(self, item: object):
+        return self.response_cls.success(self.dump(item))
+
+    @Route.POST('', rel='create_entrance')
+    @cover_swag(description='单条新增')
+    @use_args(Include, location='json')
+    async def create(self, properties: dict):
+        item = await self.service.create(properties)
+        return self.response_cls.success(result=self.dump(item), msg='新建成功')
+
+    @Route.POST('/batch', rel='create_many')
+    @cover_swag(description='批量新增')
+    @use_args(IncludeMany, location='json')
+    async def create_many(self, properties: t.List[dict]):
+        item = await self.service.create(properties)
+        return self.response_cls.success(result=self.dump(item), msg='新建成功')
+
+    @Route.PUT('', rel='update_entrance')
+    @cover_swag(description='单条更新')
+    @use_args(Include, location='json')
+    async def update(self, properties: dict):
+        item = await self.service.update(properties)
+        return self.response_cls.success(self.dump(item), msg='更新成功')
+
+    @Route.PUT('/batch', rel='update_many')
+    @cover_swag(description='批量更新')
+    @use_args(IncludeMany, location='json')
+    async def update_many(self, properties: t.List[dict]):
+        item = await self.service.update(properties)
+        return self.response_cls.success(self.dump(item), msg='更新成功')
+
+    @ItemRoute.PUT('', rel='update_instance')
+    @use_args(Include, location='json')
+    async def update_instance(self, item: object, properties: dict):
+        item = await self.service.update_one(item, properties)
+        return self.response_cls.success(result=self.dump(item), msg='更新成功')
+
+    @Route.DELETE('', rel='delete_entrance')
+    @cover_swag(description='批量删除')
+    @use_args({'ids': fields.DelimitedList(fields.Raw())},
+              as_kwargs=True,
+              location='query')
+    @use_args({'ids': fields.List(fields.Raw())},
+              as_kwargs=True,
+              location='list_json')
+    async def delete(self, ids: t.List[str]):
+        await self.service.delete(ids)
+        return self.response_cls.success(msg='删除成功')
+
+    @ItemRoute.DELETE('', rel='delete_instance')
+    async def delete_instance(self, item):
+        id_ = getattr(item, self.service.id_attribute)
+        await self.service.delete_many([id_])
+        return self.response_cls.success(msg='删除成功')
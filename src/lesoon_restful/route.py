@@ -1,3 +1,4 @@
+import inspect
 import typing as t
 from copy import deepcopy
 from functools import wraps
@@ -14,6 +15,11 @@ if t.TYPE_CHECKING:
 HTTP_METHODS = ('GET', 'PUT', 'POST', 'DELETE')
 
 
+def is_coroutine_view(fn: t.Callable) -> bool:
+    """ 判断视图函数(含被装饰器包裹的)是否为协程函数."""
+    return inspect.iscoroutinefunction(inspect.unwrap(fn))
+
+
 def _route_decorator(method: str):
     # 类路由方法设置
     def decorator(cls, *args, **kwargs):
@@ -156,6 +162,16 @@ class Route:
         """
 
         def make_func(fn):
+            if is_coroutine_view(fn):
+                # Flask2.0 async视图
+                @wraps(fn)
+                async def async_decorator(*args, **kwargs):
+                    rv = fn(resource(), *args, **kwargs)
+                    if inspect.isawaitable(rv):
+                        rv = await rv
+                    return rv
+
+                return async_decorator
 
             @wraps(fn)
             def decorator(*args, **kwargs):
@@ -203,10 +219,20 @@ class ItemRoute(Route):
     def view_factory(self, name: str, resource: t.Type['Resource']):
         original_view = super().view_factory(name, resource)
 
-        def view(*args, **kwargs):
-            id = kwargs.pop(resource.meta.id_attribute)
-            item = resource.service.read_or_raise(id)
-            return original_view(item, *args, **kwargs)
+        if inspect.iscoroutinefunction(original_view):
+
+            async def view(*args, **kwargs):
+                id = kwargs.pop(resource.meta.id_attribute)
+                item = resource.service.read_or_raise(id)
+                if inspect.isawaitable(item):
+                    item = await item
+                return await original_view(item, *args, **kwargs)
+        else:
+
+            def view(*args, **kwargs):
+                id = kwargs.pop(resource.meta.id_attribute)
+                item = resource.service.read_or_raise(id)
+                return original_view(item, *args, **kwargs)
 
         view.__resource__ = getattr(  # type:ignore
             original_view, '__resource__')
@@ -1,5 +1,8 @@
+import time
 import typing as t
 
+from flask import has_app_context
+from flask import has_request_context
 from lesoon_common import request as current_request
 from lesoon_common.dataclass.req import PageParam
 from lesoon_common.utils.str import udlcase
@@ -20,6 +23,8 @@ from lesoon_restful.resource import ModelResource
 from lesoon_restful.utils.base import AttributeDict
 from lesoon_restful.utils.filters import legitimize_sort
 from lesoon_restful.utils.filters import legitimize_where
+from lesoon_restful.utils.slow_query import get_slow_query_log
+from lesoon_restful.utils.slow_query import query_signature
 
 if t.TYPE_CHECKING:
     from lesoon_restful.filters import FN_TYPE
@@ -159,6 +164,13 @@ class Service(metaclass=ServiceMeta):
         """ 反向设置资源名称 """
         pass
 
+    def indexes(self) -> t.Optional[t.List[t.Tuple[str, ...]]]:
+        """
+        模型已建立的索引.
+        每个索引以属性名元组表示(按索引字段顺序), 不支持索引的服务返回None.
+        """
+        return None
+
     def parse_request(self,
                       request: LesoonRequest = current_request) -> PageParam:
         """
@@ -378,6 +390,10 @@ class Service(metaclass=ServiceMeta):
 
 class QueryService(Service):
 
+    class Meta:
+        # 慢查询阈值(秒), 分页查询耗时超过阈值时记录执行计划, None则不记录.
+        slow_query_threshold: t.Optional[float] = None
+
     def _or_expression(self, expressions: list):
         """ or条件合并."""
         raise NotImplementedError()
@@ -412,16 +428,54 @@ class QueryService(Service):
         """ query分页获取."""
         raise NotImplementedError()
 
+    def _explain(self, query, page_param: PageParam) -> t.Tuple[str, t.Any]:
+        """ 分页查询的执行计划, 返回(查询语句, 执行计划)."""
+        raise NotImplementedError()
+
+    def _capture_slow_query(self, query, page_param: PageParam, elapsed: float):
+        """
+        记录慢查询及其执行计划, 获取执行计划失败时记录错误信息.
+        慢查询记录保存在app中, 无app上下文(如命令行、后台任务)时不记录.
+        """
+        if not has_app_context():
+            return
+
+        try:
+            statement, plan = self._explain(query, page_param)
+        except Exception as e:
+            statement, plan = None, {'error': repr(e)}
+
+        get_slow_query_log().record(model=getattr(self.model, '__name__', None),
+                                    endpoint=current_request.endpoint
+                                    if has_request_context() else None,
+                                    signature=query_signature(
+                                        page_param.where, page_param.sort),
+                                    elapsed_ms=round(elapsed * 1000, 2),
+                                    statement=statement,
+                                    plan=plan)
+
+    def _paginate(self, query, page_param: PageParam):
+        started = time.perf_counter()
+        pagination = self._query_get_paginated_items(
+            query,
+            page=page_param.page,
+            page_size=page_param.page_size,
+            if_page=page_param.if_page)
+        elapsed = time.perf_counter() - started
+
+        threshold = self.meta.get('slow_query_threshold')
+        if threshold is not None and elapsed >= threshold:
+            self._capture_slow_query(query, page_param, elapsed)
+        return pagination
+
     def paginated_instances(self, page_param: PageParam = None):
         page_param = page_param or self.parse_request()
         instances = self.instances(where=page_param.where, sort=page_param.sort)
-        return self._query_get_paginated_items(instances,
-                                               page=page_param.page,
-                                               page_size=page_param.page_size,
-                                               if_page=page_param.if_page)
+        return self._paginate(instances, page_param)
 
     def instances(self, query=None, where=None, sort=None):
-        query = query or self._page_query()
+        # QuerySet等查询对象的布尔判断会触发查询
+        query = self._page_query() if query is None else query
 
         if where:
             expressions = [condition() for condition in where]
@@ -0,0 +1,228 @@
+""" 索引建议模块.
+检查资源声明的可过滤、可排序字段是否已建立索引;
+并可回放请求日志中的where/sort组合, 按"等值-排序-范围"顺序建议组合索引.
+"""
+import json
+import typing as t
+from collections import Counter
+from urllib.parse import parse_qs
+from urllib.parse import urlsplit
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from lesoon_common.utils.str import udlcase
+
+from lesoon_restful.utils.filters import legitimize_sort
+from lesoon_restful.utils.filters import legitimize_where
+
+if t.TYPE_CHECKING:
+    from lesoon_restful.api import Api
+    from lesoon_restful.resource import Resource
+    from lesoon_restful.service import Service
+
+# 资源名 -> 资源
+Resources = t.Dict[str, t.Type['Resource']]
+# 请求日志记录: (资源名, where, sort)
+Record = t.Tuple[str, dict, dict]
+
+# 注册在app.extensions中的Api列表
+EXTENSION_KEY = 'lesoon_restful_apis'
+# 可使用索引等值匹配的过滤操作
+EQUALITY_OPS = (None, 'eq', 'in')
+# 可使用索引范围扫描的过滤操作
+RANGE_OPS = ('lt', 'lte', 'gt', 'gte', 'between', 'startswith', 'prefixLike')
+
+
+class IndexAdvice:
+    """
+    索引建议.
+
+    Attributes:
+        resource: 资源名
+        fields: 建议建立索引的字段(按索引顺序)
+        reason: 原因, filter/sort/query
+        count: 回放日志中命中该组合的请求数
+
+    """
+
+    def __init__(self,
+                 resource: str,
+                 fields: t.Tuple[str, ...],
+                 reason: str,
+                 count: int = 0):
+        self.resource = resource
+        self.fields = fields
+        self.reason = reason
+        self.count = count
+
+    def to_dict(self) -> dict:
+        return {
+            'resource': self.resource,
+            'fields': list(self.fields),
+            'reason': self.reason,
+            'count': self.count
+        }
+
+    def __repr__(self):
+        return f'<IndexAdvice {self.resource}({", ".join(self.fields)})>'
+
+
+def is_covered(fields: t.Tuple[str, ...],
+               indexes: t.List[t.Tuple[str, ...]]) -> bool:
+    """ fields是否为某个已有索引的前缀."""
+    return any(index[:len(fields)] == fields for index in indexes)
+
+
+def _service(resource: t.Type['Resource']) -> t.Optional['Service']:
+    return getattr(resource, 'service', None)
+
+
+def _filter_attribute(service: 'Service', name: str) -> t.Optional[str]:
+    for filter_ in service.filters.get(name, {}).values():
+        if filter_ is not None:
+            return filter_.attribute
+    return None
+
+
+def check_declared(resources: t.Iterable) -> t.List[IndexAdvice]:
+    """ 检查资源声明的可过滤、可排序字段是否为某个索引的首字段."""
+    advices = []
+    for resource in resources:
+        service = _service(resource)
+        indexes = service.indexes() if service is not None else None
+        if indexes is None:
+            continue
+
+        checked = set()
+        declared = [(name, 'filter') for name in service.filters]
+        declared.extend((name, 'sort') for name in service._sort_fields)  # noqa
+        for name, reason in declared:
+            attribute = _filter_attribute(service, name)
+            if attribute is None or attribute in checked:
+                continue
+            # 内存服务无模型类, 以schema字段为准
+            if (service.model is not None and
+                    not hasattr(service.model, attribute)):
+                continue
+            checked.add(attribute)
+            if not is_covered((attribute,), indexes):
+                advices.append(
+                    IndexAdvice(resource.meta.name, (attribute,), reason))
+    return advices
+
+
+def parse_record(line: str, resources: Resources) -> t.Optional[Record]:
+    """
+    解析一条请求日志记录.
+
+    支持两种格式:
+        JSON: {"resource": "book", "where": {...}, "sort": {...}}
+        请求路径: /book?where={...}&sort={...}
+
+    Returns:
+        (资源名, where, sort), 无法解析时返回None
+
+    """
+    line = line.strip()
+    if not line:
+        return None
+
+    if line.startswith('{'):
+        record = json.loads(line)
+        where, sort = record.get('where') or {}, record.get('sort') or {}
+        return record.get('resource'), where, sort
+
+    url = urlsplit(line)
+    path = url.path.rstrip('/')
+    for name, resource in resources.items():
+        if resource.route_prefix and path == resource.route_prefix.rstrip('/'):
+            params = parse_qs(url.query)
+            where = json.loads(params['where'][0]) if 'where' in params else {}
+            sort = json.loads(params['sort'][0]) if 'sort' in params else {}
+            return name, where, sort
+    return None
+
+
+def query_fields(service: 'Service', where: dict,
+                 sort: t.Union[str, dict]) -> t.Tuple[str, ...]:
+    """
+    请求对应的候选组合索引字段.
+    等值条件字段(按名称排序)在前, 排序字段次之, 首个范围条件字段在后.
+    """
+    equality, ranges = set(), []
+    for name, value in legitimize_where(dict(where)).items():
+        attribute = _filter_attribute(service, udlcase(name))
+        if attribute is None:
+            continue
+        ops = [k[1:] for k in value] if isinstance(value, dict) else [None]
+        if all(op in EQUALITY_OPS for op in ops):
+            equality.add(attribute)
+        elif any(op in RANGE_OPS for op in ops):
+            ranges.append(attribute)
+
+    fields = sorted(equality)
+    for name in legitimize_sort(sort):
+        attribute = _filter_attribute(service, udlcase(name))
+        if attribute is not None and attribute not in fields:
+            fields.append(attribute)
+    fields.extend(
+        attribute for attribute in ranges[:1] if attribute not in fields)
+    return tuple(fields)
+
+
+def replay(resources: Resources, lines: t.Iterable[str]) -> t.List[IndexAdvice]:
+    """ 回放请求日志, 对未被已有索引覆盖的where/sort组合给出组合索引建议."""
+    counter: t.Counter[t.Tuple[str, t.Tuple[str, ...]]] = Counter()
+    for line in lines:
+        record = parse_record(line, resources)
+        if record is None or record[0] not in resources:
+            continue
+        name, where, sort = record
+        service = _service(resources[name])
+        if service is None:
+            continue
+        indexes = service.indexes()
+        fields = query_fields(service, where, sort)
+        if indexes is not None and fields and not is_covered(fields, indexes):
+            counter[(name, fields)] += 1
+
+    return [
+        IndexAdvice(name, fields, 'query', count)
+        for (name, fields), count in counter.most_common()
+    ]
+
+
+def register_api(app, api: 'Api'):
+    """ 记录app上注册的Api, 并注册 `flask index-advisor` 命令."""
+    apis = app.extensions.setdefault(EXTENSION_KEY, [])
+    if api not in apis:
+        apis.append(api)
+    if 'index-advisor' not in app.cli.commands:
+        app.cli.add_command(index_advisor_command)
+
+
+@click.command('index-advisor')
+@click.option('--queries', type=click.File(), help='请求日志文件, 每行为JSON记录或请求路径')
+@click.option('--json', 'as_json', is_flag=True, help='以JSON格式输出')
+@with_appcontext
+def index_advisor_command(queries, as_json):
+    """ 检查可过滤、可排序字段的索引情况并给出建议."""
+    resources: Resources = {}
+    for api in current_app.extensions.get(EXTENSION_KEY, []):
+        resources.update(api.resources)
+
+    advices = check_declared(resources.values())
+    if queries is not None:
+        advices.extend(replay(resources, queries))
+
+    if as_json:
+        click.echo(
+            json.dumps([advice.to_dict() for advice in advices],
+                       indent=2,
+                       ensure_ascii=False))
+        return
+    for advice in advices:
+        count = f' x{advice.count}' if advice.count else ''
+        click.echo(f'[{advice.reason}] {advice.resource}: '
+                   f'({", ".join(advice.fields)}){count}')
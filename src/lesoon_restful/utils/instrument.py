@@ -0,0 +1,231 @@
+""" SQL查询统计模块.
+监听SQLAlchemy引擎事件, 统计单个请求内执行的SQL语句, 用于发现N+1查询;
+以及各引擎编译语句缓存的命中情况.
+"""
+import contextlib
+import contextvars
+import inspect
+import re
+import threading
+import typing as t
+import weakref
+from collections import Counter
+from functools import wraps
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.engine import default
+from sqlalchemy.engine import Engine
+from werkzeug.wrappers import Response
+
+from lesoon_restful.exceptions import QueryBudgetExceeded
+from lesoon_restful.utils.base import unpack
+
+# 调试模式下返回查询次数的响应头
+QUERY_COUNT_HEADER = 'X-Query-Count'
+
+# 当前上下文中的查询统计
+_stats_var: contextvars.ContextVar = contextvars.ContextVar(
+    'lesoon_restful_query_stats', default=None)
+
+_IN_PARAMS = re.compile(r'\bIN \([^()]*\)', re.IGNORECASE)
+_WHITESPACE = re.compile(r'\s+')
+
+
+def statement_shape(statement: str) -> str:
+    """ 归一化SQL语句, 参数个数不同的IN列表视为同一语句."""
+    statement = _WHITESPACE.sub(' ', statement).strip()
+    return _IN_PARAMS.sub('IN (...)', statement)
+
+
+class QueryStats:
+    """
+    查询统计.
+
+    Attributes:
+        count: 执行的语句数
+        shapes: 各语句(归一化后)的执行次数
+
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.shapes: t.Counter[str] = Counter()
+
+    def record(self, statement: str):
+        self.count += 1
+        self.shapes[statement_shape(statement)] += 1
+
+    def repeated(self, min_count: int = 2) -> t.List[t.Tuple[str, int]]:
+        """ 重复执行的语句, 按次数降序."""
+        return [(shape, count)
+                for shape, count in self.shapes.most_common()
+                if count >= min_count]
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    stats = _stats_var.get()
+    if stats is not None:
+        stats.record(statement)
+
+
+def install():
+    """ 注册全局引擎事件, 多次调用只注册一次."""
+    if not event.contains(Engine, 'before_cursor_execute',
+                          _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+
+
+class StatementCacheStats:
+    """
+    编译语句缓存统计.
+
+    Attributes:
+        hits: 命中编译缓存的执行次数
+        misses: 未命中(需编译)的执行次数
+        uncached: 不可缓存(文本SQL、缓存关闭等)的执行次数
+
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.uncached = 0
+        self._lock = threading.Lock()
+
+    @property
+    def ratio(self) -> float:
+        """ 命中率, 不可缓存的执行不计入."""
+        total = self.hits + self.misses
+        return round(self.hits / total, 4) if total else 0.0
+
+    def record(self, cache_hit):
+        with self._lock:
+            if cache_hit is default.CACHE_HIT:
+                self.hits += 1
+            elif cache_hit is default.CACHE_MISS:
+                self.misses += 1
+            else:
+                self.uncached += 1
+
+    def to_dict(self) -> dict:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'uncached': self.uncached,
+            'ratio': self.ratio
+        }
+
+
+_cache_stats: 't.MutableMapping[Engine, StatementCacheStats]' = (
+    weakref.WeakKeyDictionary())
+_cache_stats_lock = threading.Lock()
+
+
+def statement_cache_stats(engine: Engine) -> StatementCacheStats:
+    """ 获取引擎的编译语句缓存统计."""
+    stats = _cache_stats.get(engine)
+    if stats is None:
+        with _cache_stats_lock:
+            stats = _cache_stats.setdefault(engine, StatementCacheStats())
+    return stats
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    if context is not None:
+        statement_cache_stats(conn.engine).record(context.cache_hit)
+
+
+def install_cache_stats():
+    """ 注册全局引擎事件统计编译缓存命中, 多次调用只注册一次."""
+    if not event.contains(Engine, 'after_cursor_execute',
+                          _after_cursor_execute):
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+
+@contextlib.contextmanager
+def collect_queries() -> t.Iterator[QueryStats]:
+    """
+    统计上下文内执行的SQL语句.
+    注意: 其他线程(如并发count查询线程池)中执行的语句不计入.
+    """
+    install()
+    stats = QueryStats()
+    token = _stats_var.set(stats)
+    try:
+        yield stats
+    finally:
+        _stats_var.reset(token)
+
+
+def _check_budget(stats: QueryStats, budget: t.Optional[int], endpoint: str):
+    if budget is None or stats.count <= budget:
+        return
+
+    repeated = '; '.join(
+        f'{count}x {shape}' for shape, count in stats.repeated()[:3])
+    msg = f'{endpoint} 执行SQL {stats.count}次, 超出预算{budget}次. 重复语句: {repeated}'
+    if current_app.config.get('RESTFUL_QUERY_BUDGET_RAISE', False):
+        raise QueryBudgetExceeded(msg=msg)
+    current_app.logger.warning(msg)
+
+
+def _set_header(resp, name: str, value: str):
+    if isinstance(resp, Response):
+        resp.headers[name] = value
+        return resp
+
+    data, code, headers = unpack(resp)
+    headers[name] = value
+    return data, code, headers
+
+
+def instrument_view(view: t.Callable,
+                    endpoint: str,
+                    budget: int = None) -> t.Callable:
+    """
+    视图查询统计装饰器.
+    配置 `RESTFUL_QUERY_INSTRUMENT` (默认同app.debug)开启时统计视图内执行的SQL,
+    超出预算时记录警告日志, 配置 `RESTFUL_QUERY_BUDGET_RAISE` 时抛出
+    :class:`QueryBudgetExceeded`; 调试模式下通过响应头返回查询次数.
+
+    Args:
+        view: 视图函数
+        endpoint: 端点
+        budget: 查询次数预算
+
+    """
+
+    def enabled() -> bool:
+        return current_app.config.get('RESTFUL_QUERY_INSTRUMENT',
+                                      current_app.debug)
+
+    def finish(stats: QueryStats, resp):
+        _check_budget(stats, budget, endpoint)
+        if current_app.debug:
+            resp = _set_header(resp, QUERY_COUNT_HEADER, str(stats.count))
+        return resp
+
+    if inspect.iscoroutinefunction(view):
+
+        @wraps(view)
+        async def async_wrapper(*args, **kwargs):
+            if not enabled():
+                return await view(*args, **kwargs)
+            with collect_queries() as stats:
+                resp = await view(*args, **kwargs)
+            return finish(stats, resp)
+
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not enabled():
+            return view(*args, **kwargs)
+        with collect_queries() as stats:
+            resp = view(*args, **kwargs)
+        return finish(stats, resp)
+
+    return wrapper
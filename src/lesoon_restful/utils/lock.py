@@ -0,0 +1,86 @@
+import contextlib
+import threading
+
+
+class RWLock:
+    """
+    读写锁.
+    允许多个读者并发, 写者独占, 等待中的写者优先于新读者.
+    读锁与写锁均可在同一线程内重入, 持有写锁的线程可直接读取.
+    注意: 不支持由读锁升级为写锁.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer = None
+        self._write_depth = 0
+        self._waiting_writers = 0
+        self._local = threading.local()
+
+    def acquire_read(self):
+        local = self._local
+        depth = getattr(local, 'depth', 0)
+        if depth:
+            local.depth = depth + 1
+            return
+
+        with self._cond:
+            if self._writer == threading.get_ident():
+                local.counted = False
+            else:
+                while self._writer is not None or self._waiting_writers:
+                    self._cond.wait()
+                self._readers += 1
+                local.counted = True
+        local.depth = 1
+
+    def release_read(self):
+        local = self._local
+        local.depth -= 1
+        if local.depth or not local.counted:
+            return
+
+        with self._cond:
+            self._readers -= 1
+            if not self._readers:
+                self._cond.notify_all()
+
+    def acquire_write(self):
+        ident = threading.get_ident()
+        with self._cond:
+            if self._writer == ident:
+                self._write_depth += 1
+                return
+
+            self._waiting_writers += 1
+            try:
+                while self._writer is not None or self._readers:
+                    self._cond.wait()
+            finally:
+                self._waiting_writers -= 1
+            self._writer = ident
+            self._write_depth = 1
+
+    def release_write(self):
+        with self._cond:
+            self._write_depth -= 1
+            if not self._write_depth:
+                self._writer = None
+                self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def read_lock(self):
+        self.acquire_read()
+        try:
+            yield
+        finally:
+            self.release_read()
+
+    @contextlib.contextmanager
+    def write_lock(self):
+        self.acquire_write()
+        try:
+            yield
+        finally:
+            self.release_write()
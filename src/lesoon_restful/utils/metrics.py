@@ -0,0 +1,352 @@
+""" 路由指标模块.
+按端点统计请求数与各阶段耗时直方图, 以Prometheus文本格式输出.
+阶段: parse(参数解析), db(SQL执行), serialize(序列化), response(响应构造), total(总耗时).
+会话生命周期: pool_wait(连接池取出连接等待), connection(连接占用), transaction(事务持续)耗时,
+以及各端点的flush/commit次数.
+"""
+import bisect
+import contextlib
+import contextvars
+import inspect
+import threading
+import time
+import typing as t
+from collections import Counter
+from functools import wraps
+
+from flask import current_app
+from flask import request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import Pool
+
+# 默认直方图分桶(秒), 与Prometheus客户端一致
+DEFAULT_BUCKETS = (.005, .01, .025, .05, .1, .25, .5, 1.0, 2.5, 5.0, 10.0)
+
+# 请求开始时设置的上下文变量: (阶段耗时, 会话生命周期)
+Tokens = t.Tuple[contextvars.Token, contextvars.Token]
+
+# 当前请求的阶段耗时
+_timings_var: contextvars.ContextVar = contextvars.ContextVar(
+    'lesoon_restful_timings', default=None)
+# 当前请求的会话生命周期统计
+_lifecycle_var: contextvars.ContextVar = contextvars.ContextVar(
+    'lesoon_restful_lifecycle', default=None)
+
+
+class Histogram:
+    """
+    直方图.
+    各分桶计数非累积存储, 输出时累加.
+    """
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: t.Sequence[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """
+    指标注册表.
+
+    Attributes:
+        prefix: 指标名前缀
+        buckets: 直方图分桶
+
+    """
+
+    def __init__(self,
+                 prefix: str = 'lesoon_restful',
+                 buckets: t.Sequence[float] = DEFAULT_BUCKETS):
+        self.prefix = prefix
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._requests: t.Counter[t.Tuple[str, str, int]] = Counter()
+        self._histograms: t.Dict[t.Tuple[str, str], Histogram] = {}
+        self._session_events: t.Counter[t.Tuple[str, str]] = Counter()
+
+    def observe(self,
+                endpoint: str,
+                method: str,
+                status: int,
+                timings: t.Dict[str, float],
+                events: t.Dict[str, int] = None):
+        with self._lock:
+            self._requests[(endpoint, method, status)] += 1
+            for name, count in (events or {}).items():
+                self._session_events[(endpoint, name)] += count
+            for phase, seconds in timings.items():
+                histogram = self._histograms.get((endpoint, phase))
+                if histogram is None:
+                    histogram = self._histograms[(endpoint, phase)] = Histogram(
+                        self.buckets)
+                histogram.observe(seconds)
+
+    def render(self) -> str:
+        """ 输出Prometheus文本格式."""
+        requests_name = f'{self.prefix}_requests_total'
+        duration_name = f'{self.prefix}_request_duration_seconds'
+        events_name = f'{self.prefix}_session_events_total'
+        lines = [
+            f'# HELP {requests_name} Total number of requests.',
+            f'# TYPE {requests_name} counter'
+        ]
+        with self._lock:
+            for (endpoint, method,
+                 status), count in sorted(self._requests.items()):
+                lines.append(f'{requests_name}{{endpoint="{endpoint}",'
+                             f'method="{method}",status="{status}"}} {count}')
+
+            lines.append(f'# HELP {duration_name} Request duration by phase.')
+            lines.append(f'# TYPE {duration_name} histogram')
+            for (endpoint,
+                 phase), histogram in sorted(self._histograms.items()):
+                labels = f'endpoint="{endpoint}",phase="{phase}"'
+                cumulative = 0
+                for le, count in zip(self.buckets + (float('inf'),),
+                                     histogram.counts):
+                    cumulative += count
+                    le_ = '+Inf' if le == float('inf') else repr(le)
+                    lines.append(f'{duration_name}_bucket{{{labels},'
+                                 f'le="{le_}"}} {cumulative}')
+                lines.append(f'{duration_name}_sum{{{labels}}} {histogram.sum}')
+                lines.append(
+                    f'{duration_name}_count{{{labels}}} {histogram.count}')
+
+            lines.append(f'# HELP {events_name} Session flushes and commits.')
+            lines.append(f'# TYPE {events_name} counter')
+            for (endpoint, name), count in sorted(self._session_events.items()):
+                lines.append(f'{events_name}{{endpoint="{endpoint}",'
+                             f'event="{name}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+@contextlib.contextmanager
+def timed_phase(phase: str):
+    """ 记录阶段耗时, 未开启指标统计时不做任何处理."""
+    timings = _timings_var.get()
+    if timings is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[phase] = timings.get(phase, 0.0) + time.perf_counter() - start
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    lifecycle = _lifecycle_var.get()
+    if lifecycle is not None:
+        # 语句开始执行, 会话已持有连接, 未经连接池取出的等待不再计入
+        lifecycle.acquiring = None
+    if _timings_var.get() is not None:
+        conn.info.setdefault('lesoon_restful_start',
+                             []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    timings = _timings_var.get()
+    starts = conn.info.get('lesoon_restful_start')
+    if timings is not None and starts:
+        elapsed = time.perf_counter() - starts.pop()
+        timings['db'] = timings.get('db', 0.0) + elapsed
+
+
+class SessionLifecycle:
+    """
+    单个请求的连接与会话生命周期统计.
+    连接及事务以对象id记录开始时间, 结束时累计耗时;
+    请求结束时仍未归还的连接、未结束的事务计至请求结束.
+
+    Attributes:
+        pool_wait: 连接池取出连接等待耗时, 自会话执行语句或flush需要连接起至连接池checkout完成,
+            会话已持有连接时不计入
+        connection: 连接占用耗时
+        transaction: 事务持续耗时
+        events: flush/commit次数
+
+    """
+
+    def __init__(self):
+        self.pool_wait = 0.0
+        self.connection = 0.0
+        self.transaction = 0.0
+        self.events: t.Counter[str] = Counter()
+        self.acquiring: t.Optional[float] = None
+        self.connections: t.Dict[int, float] = {}
+        self.transactions: t.Dict[int, float] = {}
+
+    def finish(self, timings: t.Dict[str, float]):
+        """ 结算未结束的连接与事务, 有连接活动时写入阶段耗时."""
+        now = time.perf_counter()
+        self.connection += sum(
+            now - start for start in self.connections.values())
+        self.transaction += sum(
+            now - start for start in self.transactions.values())
+        self.connections.clear()
+        self.transactions.clear()
+        if self.connection or self.transaction:
+            timings['pool_wait'] = self.pool_wait
+            timings['connection'] = self.connection
+            timings['transaction'] = self.transaction
+
+
+def _checkout(dbapi_connection, connection_record, connection_proxy):
+    lifecycle = _lifecycle_var.get()
+    if lifecycle is None:
+        return
+    now = time.perf_counter()
+    if lifecycle.acquiring is not None:
+        lifecycle.pool_wait += now - lifecycle.acquiring
+        lifecycle.acquiring = None
+    lifecycle.connections[id(connection_record)] = now
+
+
+def _checkin(dbapi_connection, connection_record):
+    lifecycle = _lifecycle_var.get()
+    if lifecycle is None:
+        return
+    start = lifecycle.connections.pop(id(connection_record), None)
+    if start is not None:
+        lifecycle.connection += time.perf_counter() - start
+
+
+def _acquire_start(*args):
+    lifecycle = _lifecycle_var.get()
+    if lifecycle is not None:
+        lifecycle.acquiring = time.perf_counter()
+
+
+def _after_begin(session, transaction, connection):
+    lifecycle = _lifecycle_var.get()
+    if lifecycle is not None:
+        lifecycle.transactions[id(transaction)] = time.perf_counter()
+
+
+def _after_transaction_end(session, transaction):
+    lifecycle = _lifecycle_var.get()
+    if lifecycle is None:
+        return
+    start = lifecycle.transactions.pop(id(transaction), None)
+    if start is not None:
+        lifecycle.transaction += time.perf_counter() - start
+
+
+def _session_event(name: str) -> t.Callable:
+
+    def listener(session, *args):
+        lifecycle = _lifecycle_var.get()
+        if lifecycle is not None:
+            lifecycle.events[name] += 1
+
+    return listener
+
+
+_after_flush = _session_event('flush')
+_after_commit = _session_event('commit')
+
+# 全局事件监听: (监听目标, 事件名, 监听函数)
+LISTENERS = (
+    (Engine, 'before_cursor_execute', _before_cursor_execute),
+    (Engine, 'after_cursor_execute', _after_cursor_execute),
+    (Pool, 'checkout', _checkout),
+    (Pool, 'checkin', _checkin),
+    (Session, 'do_orm_execute', _acquire_start),
+    (Session, 'before_flush', _acquire_start),
+    (Session, 'after_begin', _after_begin),
+    (Session, 'after_transaction_end', _after_transaction_end),
+    (Session, 'after_flush', _after_flush),
+    (Session, 'after_commit', _after_commit),
+)
+
+
+def install():
+    """ 注册全局引擎、连接池及会话事件以统计SQL耗时与会话生命周期, 多次调用只注册一次."""
+    for target, name, fn in LISTENERS:
+        if not event.contains(target, name, fn):
+            event.listen(target, name, fn)
+
+
+def metrics_view(view: t.Callable, endpoint: str, registry: MetricsRegistry,
+                 is_async: bool) -> t.Callable:
+    """
+    视图指标装饰器.
+    在视图内构造响应以统计响应阶段耗时, 请求结束后写入注册表.
+    视图抛出的异常在此交由应用的错误处理器生成响应, 按实际返回的状态码统计.
+
+    Args:
+        view: 视图函数
+        endpoint: 端点
+        registry: 指标注册表
+        is_async: 是否为async视图
+
+    """
+
+    def start() -> t.Tuple[Tokens, float]:
+        tokens = (_timings_var.set({}), _lifecycle_var.set(SessionLifecycle()))
+        return tokens, time.perf_counter()
+
+    def finish(tokens: Tokens, started: float, status: int):
+        timings, lifecycle = _timings_var.get(), _lifecycle_var.get()
+        _timings_var.reset(tokens[0])
+        _lifecycle_var.reset(tokens[1])
+        timings['total'] = time.perf_counter() - started
+        lifecycle.finish(timings)
+        registry.observe(endpoint, request.method, status, timings,
+                         lifecycle.events)
+
+    def make_response(rv):
+        with timed_phase('response'):
+            return current_app.make_response(rv)
+
+    def handle_error(tokens: Tokens, started: float, e: Exception):
+        # 交由应用的错误处理器生成响应, 统计实际返回的状态码; 未处理的异常计为500
+        try:
+            response = make_response(current_app.handle_user_exception(e))
+        except Exception:
+            finish(tokens, started, 500)
+            raise
+        finish(tokens, started, response.status_code)
+        return response
+
+    if is_async:
+
+        @wraps(view)
+        async def async_wrapper(*args, **kwargs):
+            tokens, started = start()
+            try:
+                rv = view(*args, **kwargs)
+                if inspect.isawaitable(rv):
+                    rv = await rv
+                response = make_response(rv)
+            except Exception as e:
+                return handle_error(tokens, started, e)
+            finish(tokens, started, response.status_code)
+            return response
+
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        tokens, started = start()
+        try:
+            response = make_response(view(*args, **kwargs))
+        except Exception as e:
+            return handle_error(tokens, started, e)
+        finish(tokens, started, response.status_code)
+        return response
+
+    return wrapper
@@ -0,0 +1,211 @@
+""" 采样分析模块.
+对抽样请求进行调用栈采样, 按端点聚合为火焰图(flamegraph.pl/speedscope)可用的折叠栈格式.
+"""
+import hashlib
+import hmac
+import inspect
+import itertools
+import os
+import sys
+import threading
+import time
+import typing as t
+from collections import Counter
+from collections import defaultdict
+from functools import wraps
+from types import FrameType
+
+from flask import request
+
+# 携带签名时强制分析当前请求的请求头, 值格式: "<timestamp>:<signature>"
+PROFILE_HEADER = 'X-Lesoon-Profile'
+# 签名有效期(秒)
+SIGNATURE_TTL = 300
+# 单个端点保留的不同调用栈上限, 超出部分计入该项
+OTHER_STACK = '[other]'
+
+
+class StackProfiler:
+    """
+    调用栈采样分析器.
+    单个后台线程按固定间隔采样正在被分析的请求线程的调用栈,
+    调用栈自视图包装函数开始记录.
+
+    Attributes:
+        sample_rate: 每N个请求分析1个, 0则仅分析携带签名请求头的请求
+        secret: 请求头签名密钥, 未提供则不接受请求头触发
+        interval: 采样间隔(秒)
+        max_depth: 调用栈最大深度
+        max_stacks: 单个端点保留的不同调用栈上限
+
+    """
+
+    def __init__(self,
+                 sample_rate: int = 0,
+                 secret: str = None,
+                 interval: float = 0.005,
+                 max_depth: int = 64,
+                 max_stacks: int = 10000):
+        self.sample_rate = sample_rate
+        self.secret = secret
+        self.interval = interval
+        self.max_depth = max_depth
+        self.max_stacks = max_stacks
+        self.stacks: t.Dict[str, t.Counter[str]] = defaultdict(Counter)
+        self._lock = threading.Lock()
+        self._targets: t.Dict[int, t.Tuple[str, FrameType]] = {}
+        self._requests = itertools.count(1)
+        self._wakeup = threading.Event()
+        self._thread: t.Optional[threading.Thread] = None
+
+    def sign(self, timestamp: int = None) -> str:
+        """ 生成请求头签名."""
+        timestamp = int(time.time()) if timestamp is None else timestamp
+        digest = hmac.new(self.secret.encode(),
+                          str(timestamp).encode(), hashlib.sha256).hexdigest()
+        return f'{timestamp}:{digest}'
+
+    def verify(self, value: str) -> bool:
+        if not self.secret:
+            return False
+        timestamp, _, _ = value.partition(':')
+        if not timestamp.isdigit():
+            return False
+        if abs(time.time() - int(timestamp)) > SIGNATURE_TTL:
+            return False
+        return hmac.compare_digest(value, self.sign(int(timestamp)))
+
+    def should_profile(self) -> bool:
+        value = request.headers.get(PROFILE_HEADER)
+        if value is not None:
+            return self.verify(value)
+        if not self.sample_rate:
+            return False
+        return next(self._requests) % self.sample_rate == 0
+
+    def start(self, endpoint: str, root: FrameType):
+        """ 开始采样当前线程, 调用栈记录至root帧为止."""
+        with self._lock:
+            self._targets[threading.get_ident()] = (endpoint, root)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run,
+                                                name='lesoon-restful-profiler',
+                                                daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def stop(self):
+        with self._lock:
+            self._targets.pop(threading.get_ident(), None)
+
+    def _collapse(self, frame: t.Optional[FrameType], root: FrameType) -> str:
+        names = []
+        while frame is not None and len(names) < self.max_depth:
+            code = frame.f_code
+            filename = os.path.basename(code.co_filename)
+            names.append(f'{code.co_name} ({filename}:{code.co_firstlineno})')
+            if frame is root:
+                break
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            with self._lock:
+                targets = list(self._targets.items())
+                if not targets:
+                    self._wakeup.clear()
+                    continue
+
+            frames = sys._current_frames()  # noqa
+            for thread_id, (endpoint, root) in targets:
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                stack = self._collapse(frame, root)
+                with self._lock:
+                    stacks = self.stacks[endpoint]
+                    if stack not in stacks and len(stacks) >= self.max_stacks:
+                        stack = OTHER_STACK
+                    stacks[stack] += 1
+            time.sleep(self.interval)
+
+    def collapsed(self, endpoint: str = None) -> str:
+        """
+        折叠栈格式输出, 每行: "端点;帧;帧 采样数".
+
+        Args:
+            endpoint: 端点, 未提供则输出全部端点
+
+        """
+        lines = []
+        with self._lock:
+            for endpoint_, stacks in sorted(self.stacks.items()):
+                if endpoint and endpoint != endpoint_:
+                    continue
+                for stack, count in stacks.most_common():
+                    lines.append(f'{endpoint_};{stack} {count}')
+        return '\n'.join(lines) + '\n' if lines else ''
+
+    def top_frames(self, endpoint: str, limit: int = 20) -> t.List[dict]:
+        """ 按自身采样数排序的热点帧."""
+        leaves: t.Counter[str] = Counter()
+        with self._lock:
+            stacks = dict(self.stacks.get(endpoint, {}))
+        for stack, count in stacks.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+
+        total = sum(leaves.values())
+        return [{
+            'frame': frame,
+            'samples': count,
+            'ratio': round(count / total, 4)
+        } for frame, count in leaves.most_common(limit)]
+
+    def clear(self):
+        with self._lock:
+            self.stacks.clear()
+
+
+def profile_view(view: t.Callable, endpoint: str, profiler: StackProfiler,
+                 is_async: bool) -> t.Callable:
+    """
+    视图采样分析装饰器.
+
+    Args:
+        view: 视图函数
+        endpoint: 端点
+        profiler: 采样分析器
+        is_async: 是否为async视图
+
+    """
+    if is_async:
+
+        @wraps(view)
+        async def async_wrapper(*args, **kwargs):
+            if not profiler.should_profile():
+                rv = view(*args, **kwargs)
+                return await rv if inspect.isawaitable(rv) else rv
+
+            profiler.start(endpoint, sys._getframe())  # noqa
+            try:
+                rv = view(*args, **kwargs)
+                return await rv if inspect.isawaitable(rv) else rv
+            finally:
+                profiler.stop()
+
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not profiler.should_profile():
+            return view(*args, **kwargs)
+
+        profiler.start(endpoint, sys._getframe())  # noqa
+        try:
+            return view(*args, **kwargs)
+        finally:
+            profiler.stop()
+
+    return wrapper
@@ -0,0 +1,81 @@
+""" 慢查询模块.
+记录超过耗时阈值的分页查询及其执行计划, 以过滤、排序结构(不含过滤值)归一化签名.
+"""
+import threading
+import time
+import typing as t
+from collections import deque
+
+from flask import current_app
+from flask import Flask
+
+from lesoon_restful.filters import Condition
+
+# 存放于app.extensions中的慢查询记录
+EXTENSION_KEY = 'lesoon_restful_slow_queries'
+
+
+class SlowQueryLog:
+    """
+    慢查询记录, 仅保留最近 `maxlen` 条.
+
+    Attributes:
+        maxlen: 最大记录数
+
+    """
+
+    def __init__(self, maxlen: int = 100):
+        self.maxlen = maxlen
+        self._records: t.Deque[dict] = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+
+    def record(self, **record):
+        record.setdefault('timestamp', time.time())
+        with self._lock:
+            self._records.append(record)
+
+    def recent(self, limit: int = None, model: str = None) -> t.List[dict]:
+        """
+        最近的慢查询, 按时间倒序.
+
+        Args:
+            limit: 返回条数
+            model: 仅返回该模型的慢查询
+
+        """
+        with self._lock:
+            records = list(reversed(self._records))
+        if model:
+            records = [r for r in records if r.get('model') == model]
+        return records[:limit] if limit else records
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+
+
+def get_slow_query_log(app: Flask = None) -> SlowQueryLog:
+    """ 获取app的慢查询记录, 容量由 `RESTFUL_SLOW_QUERY_LOG_SIZE` (默认100)配置."""
+    app = app or current_app
+    log = app.extensions.get(EXTENSION_KEY)
+    if log is None:
+        log = app.extensions.setdefault(
+            EXTENSION_KEY,
+            SlowQueryLog(app.config.get('RESTFUL_SLOW_QUERY_LOG_SIZE', 100)))
+    return log
+
+
+def query_signature(where: t.Optional[t.Iterable[Condition]],
+                    sort: t.Optional[t.Iterable[tuple]]) -> str:
+    """
+    查询签名, 过滤值不同但结构相同的查询签名一致.
+    e.g: "rating:gte,title:eq|-rating"
+    """
+    filters = sorted(
+        f'{condition.filter.attribute}:{condition.filter.name or "eq"}'
+        for condition in where or ())
+    sorts = [
+        f'{"-" if reverse else "+"}{attribute}'
+        for _, attribute, reverse in sort or ()
+    ]
+    return f'{",".join(filters)}|{",".join(sorts)}'
@@ -39,6 +39,12 @@ class Book(db.Model):
     create_time = db.Column(db.DateTime, default=datetime.now)
 
 
+# Book定义后再声明关系, 避免AuthorSchema初始化映射时无法解析Book
+Author.books = db.relationship(Book,
+                               primaryjoin=db.foreign(
+                                   Book.author_id) == Author.id)
+
+
 class BookSchema(SQLAlchemyAutoSchema):
 
     class Meta(SQLAlchemyAutoSchema.Meta):
@@ -0,0 +1,165 @@
+import asyncio
+
+import pytest
+from lesoon_common.extensions import db
+from lesoon_common.test import ft
+from tests.dbengine.alchemy.models import Book
+from tests.dbengine.alchemy.models import BookFactory
+from tests.dbengine.alchemy.models import BookSchema
+
+from lesoon_restful.api import Api
+from lesoon_restful.dbengine.alchemy import AsyncSQLAlchemyService
+from lesoon_restful.resource import AsyncModelResource
+
+pytest.importorskip('aiosqlite')
+
+
+class TestAsyncSQLAlchemyService:
+
+    @pytest.fixture(autouse=True)
+    def setup_method(self, app, tmp_path):
+        app.config['SQLALCHEMY_ASYNC_DATABASE_URI'] = (
+            f'sqlite+aiosqlite:///{tmp_path / "async.db"}')
+
+        class BookService(AsyncSQLAlchemyService):
+
+            class Meta:
+                model = Book
+                schema = BookSchema
+
+        self.service = BookService()
+        self.schema = BookSchema(many=True, exclude=('create_time',))
+
+        async def create_all():
+            async with self.service._get_engine().begin() as conn:
+                await conn.run_sync(db.metadata.create_all)
+
+        asyncio.run(create_all())
+        yield
+        app.extensions.pop(AsyncSQLAlchemyService.ENGINE_EXTENSION_KEY)
+
+    def test_create(self):
+        books = ft.build_batch(dict, size=5, FACTORY_CLASS=BookFactory)
+        asyncio.run(self.service.create(books))
+        items = asyncio.run(self.service.instances())
+        assert self.schema.dump(items) == books
+
+    def test_update(self):
+        books = ft.build_batch(dict, size=5, FACTORY_CLASS=BookFactory)
+        asyncio.run(self.service.create(books))
+        books[0]['rating'] = books[0]['rating'] + 1
+        books[1]['title'] = '单元测试'
+        asyncio.run(self.service.update(books[:2]))
+        items = asyncio.run(self.service.instances())
+        assert self.schema.dump(items) == books
+
+    def test_delete(self):
+        books = ft.build_batch(dict, size=5, FACTORY_CLASS=BookFactory)
+        asyncio.run(self.service.create(books))
+        book = books.pop()
+        asyncio.run(self.service.delete(ids=[book['id']]))
+        items = asyncio.run(self.service.instances())
+        assert self.schema.dump(items) == books
+
+    def test_read(self):
+        books = ft.build_batch(dict, size=2, FACTORY_CLASS=BookFactory)
+        asyncio.run(self.service.create(books))
+        item = asyncio.run(self.service.read(books[1]['id']))
+        assert item.title == books[1]['title']
+        assert asyncio.run(self.service.read(-1)) is None
+
+    def test_concurrent_count(self):
+
+        class BookService(AsyncSQLAlchemyService):
+
+            class Meta:
+                model = Book
+                schema = BookSchema
+                concurrent_count = True
+
+        service = BookService()
+        books = ft.build_batch(dict, size=7, FACTORY_CLASS=BookFactory)
+        asyncio.run(self.service.create(books))
+
+        query = service._page_query().order_by(Book.id)
+        for page in (1, 4, 5):
+            # count查询与分页查询并发执行, 结果与顺序执行一致
+            pagination = asyncio.run(
+                service._query_get_paginated_items(query,
+                                                   page=page,
+                                                   page_size=2,
+                                                   if_page=True))
+            expected = asyncio.run(
+                self.service._query_get_paginated_items(query,
+                                                        page=page,
+                                                        page_size=2,
+                                                        if_page=True))
+            assert pagination.total == expected.total == 7
+            assert self.schema.dump(pagination.items) == self.schema.dump(
+                expected.items) == books[(page - 1) * 2:page * 2]
+
+
+class TestAsyncModelResource:
+
+    @pytest.fixture(autouse=True)
+    def setup_method(self, app, test_client, tmp_path):
+        pytest.importorskip('asgiref')
+        app.config['SQLALCHEMY_ASYNC_DATABASE_URI'] = (
+            f'sqlite+aiosqlite:///{tmp_path / "async.db"}')
+
+        class BookService(AsyncSQLAlchemyService):
+
+            class Meta:
+                model = Book
+                schema = BookSchema
+
+        class BookResource(AsyncModelResource):
+
+            class Meta:
+                name = 'book'
+                model = Book
+                schema = BookSchema
+                service = BookService
+
+        Api(app).add_resource(BookResource)
+        self.resource = BookResource
+        self.client = test_client
+        self.schema = BookSchema(many=True, exclude=('create_time',))
+
+        async def create_all():
+            async with BookService._get_engine().begin() as conn:
+                await conn.run_sync(db.metadata.create_all)
+
+        asyncio.run(create_all())
+        yield
+        app.extensions.pop(AsyncSQLAlchemyService.ENGINE_EXTENSION_KEY)
+
+    def test_resource_curd(self):
+        books = ft.build_batch(dict, size=5, FACTORY_CLASS=BookFactory)
+        for book in books[:4]:
+            response = self.client.post('/book', json=book)
+            assert response.status_code == 200
+            assert response.get_json()['result']['title'] == book['title']
+        response = self.client.post('/book/batch', json=books[4:])
+        assert response.status_code == 200
+
+        # 列表分页经 paginated_instances 查询
+        response = self.client.get('/book',
+                                   query_string={
+                                       'page': 2,
+                                       'pageSize': 2
+                                   })
+        body = response.get_json()
+        assert body['total'] == 5
+        assert [item['id'] for item in body['result']] == [3, 4]
+
+        response = self.client.get('/book/3')
+        assert response.get_json()['result']['title'] == books[2]['title']
+
+        assert self.client.delete('/book/1').status_code == 200
+        response = self.client.delete('/book', query_string={'ids': '2,3'})
+        assert response.status_code == 200
+
+        pagination = asyncio.run(self.resource.service.paginated_instances())
+        assert pagination.total == 2
+        assert self.schema.dump(pagination.items) == books[3:]
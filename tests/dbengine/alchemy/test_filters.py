@@ -163,3 +163,16 @@ class TestFilters(UnittestBase):
         where = {'createTime': {'$between': [start_time, end_time]}}
         response = self.client.get(f'/book?where={json.dumps(where)}')
         assert response.result == self.schema.dump(self.books[1:3])
+
+    def test_contains_escape(self):
+        BookFactory(title='100% Python_3', year_published=6, rating=0)
+
+        where = {'title': {'$contains': '%'}}
+        response = self.client.get('/book',
+                                   query_string={'where': json.dumps(where)})
+        assert [b['title'] for b in response.result] == ['100% Python_3']
+
+        where = {'title': {'$icontains': 'n_3'}}
+        response = self.client.get('/book',
+                                   query_string={'where': json.dumps(where)})
+        assert [b['title'] for b in response.result] == ['100% Python_3']
@@ -0,0 +1,73 @@
+import time
+
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import Session
+
+from lesoon_restful.dbengine.alchemy.replica import _after_commit
+from lesoon_restful.dbengine.alchemy.replica import _after_flush
+from lesoon_restful.dbengine.alchemy.replica import get_replica_router
+from lesoon_restful.dbengine.alchemy.replica import STICKY_COOKIE
+from lesoon_restful.dbengine.alchemy.replica import use_primary
+
+
+def create_app(**config) -> Flask:
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI='sqlite://',
+                      SQLALCHEMY_TRACK_MODIFICATIONS=False,
+                      SQLALCHEMY_BINDS={
+                          'r1': 'sqlite://',
+                          'r2': 'sqlite://'
+                      },
+                      **config)
+    SQLAlchemy(app)
+    return app
+
+
+class TestReplica:
+
+    def test_router(self):
+        app = create_app()
+        with app.app_context():
+            assert get_replica_router() is None
+
+        app = create_app(SQLALCHEMY_REPLICA_BINDS=['r1', 'r2'])
+        with app.app_context():
+            router = get_replica_router()
+            assert get_replica_router() is router
+            # 轮询选择副本
+            engines = [router.next_engine() for _ in range(4)]
+            assert engines == router.engines * 2
+            # 同一应用上下文复用会话
+            assert router.session() is router.session()
+
+    def test_use_primary(self):
+        app = create_app()
+        session = Session()
+        with app.test_request_context('/book'):
+            assert not use_primary(session)
+        with app.test_request_context('/book', method='POST'):
+            assert use_primary(session)
+        with app.test_request_context(
+                '/book',
+                headers={'Cookie': f'{STICKY_COOKIE}={time.time() + 60}'}):
+            assert use_primary(session)
+        with app.test_request_context('/book'):
+            _after_flush(session, None)
+            assert use_primary(session)
+        with app.app_context():
+            assert use_primary(Session())
+
+    def test_sticky_cookie(self):
+        app = create_app(SQLALCHEMY_REPLICA_BINDS=['r1'],
+                         SQLALCHEMY_REPLICA_STICKY_SECONDS=5)
+
+        @app.route('/book', methods=['POST'])
+        def create():
+            session = Session()
+            _after_flush(session, None)
+            _after_commit(session)
+            return ''
+
+        response = app.test_client().post('/book')
+        assert STICKY_COOKIE in response.headers['Set-Cookie']
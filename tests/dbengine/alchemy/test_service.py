@@ -1,11 +1,26 @@
+import threading
+
 import pytest
+from flask import current_app
+from lesoon_common.dataclass.req import PageParam
+from lesoon_common.extensions import db
 from lesoon_common.test import ft
 from lesoon_common.test import UnittestBase
+from lesoon_common.wrappers import LesoonQuery
+from marshmallow import fields
+from sqlalchemy import create_engine
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from tests.dbengine.alchemy.models import Author
+from tests.dbengine.alchemy.models import AuthorSchema
 from tests.dbengine.alchemy.models import Book
 from tests.dbengine.alchemy.models import BookFactory
 from tests.dbengine.alchemy.models import BookSchema
 
 from lesoon_restful.dbengine.alchemy import SQLAlchemyService
+from lesoon_restful.exceptions import InvalidParam
+from lesoon_restful.utils.instrument import install_cache_stats
+from lesoon_restful.utils.slow_query import get_slow_query_log
 
 
 class TestSQLAlchemyService(UnittestBase):
@@ -46,3 +61,246 @@ class TestSQLAlchemyService(UnittestBase):
         book = books.pop()
         self.service.delete(ids=[book['id']])
         assert self.schema.dump(Book.query.all()) == books
+
+    def test_concurrent_count(self):
+
+        class BookService(SQLAlchemyService):
+
+            class Meta:
+                model = Book
+                schema = BookSchema
+                concurrent_count = True
+
+        service = BookService()
+        books = ft.build_batch(dict, size=5, FACTORY_CLASS=BookFactory)
+        service.create(books)
+
+        query = service._query().order_by(Book.id)
+        # sqlite内存库为单连接池, 回退为顺序查询
+        assert service._count_engine(query) is None
+        pagination = service._query_get_paginated_items(query,
+                                                        page=2,
+                                                        page_size=2,
+                                                        if_page=True)
+        assert pagination.total == 5
+        assert self.schema.dump(pagination.items) == books[2:4]
+
+    def test_concurrent_count_with_pool(self, tmp_path):
+
+        class BookService(SQLAlchemyService):
+
+            class Meta:
+                model = Book
+                schema = BookSchema
+                concurrent_count = True
+
+        # 文件库支持多连接, count查询在线程池中执行
+        engine = create_engine(f'sqlite:///{tmp_path / "books.db"}')
+        db.metadata.create_all(engine, tables=[Book.__table__])
+        session = Session(bind=engine, query_cls=LesoonQuery)
+        books = ft.build_batch(dict, size=7, FACTORY_CLASS=BookFactory)
+        session.add_all(Book(**book) for book in books)
+        session.commit()
+
+        count_threads = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            if statement.startswith('SELECT count(*)'):
+                count_threads.append(threading.get_ident())
+
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        service = BookService()
+        query = session.query(Book).order_by(Book.id)
+        assert service._count_engine(query) is engine
+        try:
+            for page in (1, 2, 4, 5):
+                count_threads.clear()
+                pagination = service._query_get_paginated_items(query,
+                                                                page=page,
+                                                                page_size=2,
+                                                                if_page=True)
+                assert count_threads
+                assert threading.get_ident() not in count_threads
+
+                expected = query.paginate(page=page, per_page=2, if_page=True)
+                assert pagination.total == expected.total == 7
+                assert pagination.items == expected.items
+                # 超出末页时返回空页
+                assert bool(pagination.items) == (page < 5)
+        finally:
+            event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+            session.close()
+            engine.dispose()
+
+    def test_eager_load(self):
+
+        class AuthorBooksSchema(AuthorSchema):
+            books = fields.List(
+                fields.Nested(BookSchema(exclude=('create_time',))))
+
+        class AuthorService(SQLAlchemyService):
+
+            class Meta:
+                model = Author
+                schema = AuthorBooksSchema
+                eager_load = 'selectin'
+
+        service = AuthorService()
+        assert service._schema_relations == [(Author.books,)]
+
+        for i in range(1, 6):
+            db.session.add(Author(id=i, name=str(i)))
+            db.session.add(Book(id=i, title=str(i), author_id=i))
+        db.session.commit()
+        db.session.expunge_all()
+
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            authors = AuthorBooksSchema(many=True).dump(
+                service.instances().all())
+        finally:
+            event.remove(db.engine, 'before_cursor_execute',
+                         before_cursor_execute)
+        assert [len(author['books']) for author in authors] == [1] * 5
+        # 作者查询 + books预加载查询
+        assert len(statements) == 2
+
+    def test_eager_load_include(self):
+
+        class BookService(SQLAlchemyService):
+
+            class Meta:
+                model = Book
+                schema = BookSchema
+                eager_load = 'selectin'
+
+        service = BookService()
+        books = ft.build_batch(dict, size=2, FACTORY_CLASS=BookFactory)
+        service.create(books)
+
+        with current_app.test_request_context('/?include=bogus'):
+            with pytest.raises(InvalidParam):
+                service.read(1)
+        # 写操作不读取include参数
+        with current_app.test_request_context('/?include=bogus', method='PUT'):
+            service.update({'id': 1, 'title': '单元测试'})
+        assert Book.query.get(1).title == '单元测试'
+        with current_app.test_request_context('/?include=bogus',
+                                              method='DELETE'):
+            service.delete(ids=[1, 2])
+        assert Book.query.count() == 0
+
+    def test_slow_query(self):
+
+        class BookService(SQLAlchemyService):
+
+            class Meta:
+                model = Book
+                schema = BookSchema
+                slow_query_threshold = 0
+
+        service = BookService()
+        books = ft.build_batch(dict, size=5, FACTORY_CLASS=BookFactory)
+        service.create(books)
+
+        log = get_slow_query_log()
+        log.clear()
+        where = tuple(service._convert_filters({'rating': {'$gte': 0}}))
+        sort = tuple(service._convert_sort({'id': True}))
+        pagination = service._paginate(
+            service.instances(where=where, sort=sort),
+            PageParam(page=2, page_size=2, where=where, sort=sort))
+        assert [book.id for book in pagination.items] == [3, 2]
+
+        [record] = log.recent()
+        assert record['model'] == 'Book'
+        assert record['signature'] == 'rating:gte|-id'
+        # 记录的语句保留参数占位符, 执行计划以内联参数执行
+        assert '?' in record['statement']
+        assert isinstance(record['plan'], list) and record['plan']
+
+    def test_statement_cache_stats(self):
+        install_cache_stats()
+        books = ft.build_batch(dict, size=3, FACTORY_CLASS=BookFactory)
+        self.service.create(books)
+
+        def instances(title: str, ids: list):
+            where = self.service._convert_filters({
+                'title': {
+                    '$contains': title
+                },
+                'id': {
+                    '$in': ids
+                }
+            })
+            return self.service.instances(where=where).all()
+
+        instances('a', [1])
+        stats = self.service.statement_cache_stats()
+        hits, misses = stats.hits, stats.misses
+        # 过滤值不同时语句结构一致, 命中编译缓存
+        for title, ids in (('b', [1, 2]), ('%', []), ('c_', [1, 2, 3])):
+            instances(title, ids)
+        assert stats.hits - hits == 3
+        assert stats.misses == misses
+
+    def test_unit_of_work(self):
+        books = ft.build_batch(dict, size=5, FACTORY_CLASS=BookFactory)
+        self.service.create(books)
+        flushes, commits = [], []
+
+        def after_flush(session, flush_context):
+            flushes.append(session)
+
+        def after_commit(session):
+            commits.append(session)
+
+        event.listen(db.session, 'after_flush', after_flush)
+        event.listen(db.session, 'after_commit', after_commit)
+        try:
+            for book in books:
+                book['rating'] = book['rating'] + 1
+            self.service.update(books)
+            # 逐条更新合并为一次flush
+            assert len(flushes) == 1
+            assert len(commits) == 1
+
+            flushes.clear()
+            commits.clear()
+            books[0]['title'] = '单元测试'
+            with self.service.unit_of_work():
+                item = self.service.read_or_raise(books[0]['id'])
+                self.service.update_one(item, books[0])
+                self.service.commit()
+                # 作用域内照常flush, 提交延迟至作用域结束
+                assert len(flushes) == 1
+                assert not commits
+            assert len(commits) == 1
+        finally:
+            event.remove(db.session, 'after_flush', after_flush)
+            event.remove(db.session, 'after_commit', after_commit)
+        assert self.schema.dump(Book.query.order_by(Book.id).all()) == books
+
+    def test_unit_of_work_hooks(self):
+        created_ids = []
+
+        class BookService(SQLAlchemyService):
+
+            class Meta:
+                model = Book
+                schema = BookSchema
+
+            def after_create(self, items):
+                created_ids.append(items.id)
+
+        service = BookService()
+        service.create({'title': '单元测试'})
+        with service.unit_of_work():
+            service.create_one(Book(title='单元测试'), commit=False)
+        # after_create执行前已flush, 可见自增主键
+        assert created_ids == [1, 2]
@@ -0,0 +1,165 @@
+import os
+import pickle
+import shutil
+
+import pytest
+from lesoon_common.test import ft
+from tests.dbengine.memory.test_service import FooFactory
+from tests.dbengine.memory.test_service import FooSchema
+
+from lesoon_restful.dbengine.memory import MemoryService
+from lesoon_restful.exceptions import ItemNotFound
+
+np = pytest.importorskip('numpy')
+
+from lesoon_restful.dbengine.memory.columnar import ColumnarMemoryService  # noqa
+
+
+class TestColumnarMemoryService:
+
+    @pytest.fixture(autouse=True)
+    def setup_method(self):
+
+        class FooService(MemoryService):
+
+            class Meta:
+                schema = FooSchema
+
+        class ColumnarFooService(ColumnarMemoryService):
+
+            class Meta:
+                schema = FooSchema
+
+        self.service = FooService()
+        self.columnar_service = ColumnarFooService()
+        for foo in ft.build_batch(dict, size=50, FACTORY_CLASS=FooFactory):
+            self.service.create(dict(foo))
+            self.columnar_service.create(dict(foo))
+
+    def _compare(self, where: dict = None, sort: dict = None):
+        where = tuple(self.service._convert_filters(where or {}))
+        sort = tuple(self.service._convert_sort(sort or {}))
+        expected = self.service.instances(where=where, sort=sort)
+        actual = self.columnar_service.instances(where=where, sort=sort)
+        assert list(actual) == list(expected)
+
+    def test_storage(self):
+        assert self.columnar_service._columns['age'].dtype == np.int64
+        assert self.columnar_service._columns['name'].dtype == object
+        assert self.columnar_service.items == self.service.items
+
+    def test_filter(self):
+        self._compare({'name': 'a'})
+        self._compare({'name': {'$ne': 'a'}})
+        self._compare({'name': {'$in': 'a,b'}, 'age': {'$gte': 20}})
+        self._compare({'age': {'$lt': 60}})
+        self._compare({'name': {'$startswith': 'b'}})
+
+    def test_sort(self):
+        self._compare(sort={'age': True})
+        self._compare(where={'age': {
+            '$gte': 20
+        }},
+                      sort={
+                          'name': False,
+                          'age': True
+                      })
+
+    def test_curd(self):
+        self.columnar_service.update({'id': 1, 'name': None})
+        assert self.columnar_service.read(1)['name'] is None
+        assert self.columnar_service._columns['name'].dtype == object
+
+        self.columnar_service.delete([1, 2])
+        assert self.columnar_service.read(1) is None
+        assert len(self.columnar_service.items) == 48
+
+        with pytest.raises(ItemNotFound):
+            self.columnar_service.first(
+                where=tuple(self.columnar_service._convert_filters({'id': 1})))
+
+    def test_create_many(self):
+        foos = ft.build_batch(dict, size=20, FACTORY_CLASS=FooFactory)
+        self.service.create([dict(foo) for foo in foos])
+        self.columnar_service.create([dict(foo) for foo in foos])
+        assert self.columnar_service.id_sequence == 70
+        assert self.columnar_service.items == self.service.items
+        self._compare({'age': {'$gte': 20}}, {'name': False, 'age': True})
+
+    def test_snapshot(self, tmp_path):
+        path = str(tmp_path / 'foo.snapshot')
+        self.columnar_service.delete(1)
+        self.columnar_service.save_snapshot(path)
+
+        restored = self.columnar_service.__class__()
+        restored.load_snapshot(path)
+        assert isinstance(restored._columns['age'], np.memmap)
+        assert restored.items == self.columnar_service.items
+
+        restored.update({'id': 2, 'age': 1000})
+        restored.create({'name': 'a', 'age': 1})
+        assert restored.read(2)['age'] == 1000
+        assert restored.read(51)['age'] == 1
+        assert np.load(f'{path}/age.npy')[0] != 1000
+
+    def test_snapshot_replace(self, tmp_path):
+        path = str(tmp_path / 'foo.snapshot')
+        self.columnar_service.save_snapshot(path)
+        self.columnar_service.delete(1)
+        self.columnar_service.save_snapshot(path)
+
+        restored = self.columnar_service.__class__()
+        restored.load_snapshot(path)
+        assert restored.items == self.columnar_service.items
+        # 快照路径为指向当前版本目录的链接, 上一版本已删除
+        assert os.path.islink(path)
+        assert sorted(os.listdir(tmp_path)) == [
+            'foo.snapshot',
+            os.path.basename(os.path.realpath(path))
+        ]
+
+    def test_concurrent_snapshot(self, tmp_path, monkeypatch):
+        path = str(tmp_path / 'foo.snapshot')
+        dump = pickle.dump
+
+        def concurrent_dump(obj, file, **kwargs):
+            # 写入期间另一保存过程完成
+            monkeypatch.setattr(pickle, 'dump', dump)
+            self.columnar_service.save_snapshot(path)
+            dump(obj, file, **kwargs)
+
+        monkeypatch.setattr(pickle, 'dump', concurrent_dump)
+        self.columnar_service.save_snapshot(path)
+
+        restored = self.columnar_service.__class__()
+        restored.load_snapshot(path)
+        assert restored.items == self.columnar_service.items
+        assert len(os.listdir(tmp_path)) == 2
+
+    def test_snapshot_legacy_directory(self, tmp_path):
+        path = str(tmp_path / 'foo.snapshot')
+        self.columnar_service.save_snapshot(path)
+        # 旧格式的快照为普通目录
+        legacy_path = str(tmp_path / 'legacy')
+        shutil.copytree(os.path.realpath(path), legacy_path)
+        shutil.rmtree(os.path.realpath(path))
+        os.unlink(path)
+        os.replace(legacy_path, path)
+
+        self.columnar_service.delete(1)
+        self.columnar_service.save_snapshot(path)
+        restored = self.columnar_service.__class__()
+        restored.load_snapshot(path)
+        assert restored.items == self.columnar_service.items
+        assert len(os.listdir(tmp_path)) == 2
+
+    def test_compact(self):
+        rows = self.columnar_service.instances()
+        expected = list(rows)
+
+        self.columnar_service.delete(list(range(1, 40)))
+        assert self.columnar_service._size == 11
+        assert len(self.columnar_service.items) == 11
+        assert self.columnar_service.read(40) == expected[39]
+        # 整理行号前返回的查询结果不受影响
+        assert list(rows) == expected
@@ -0,0 +1,360 @@
+import os
+import pickle
+import random
+import threading
+
+import marshmallow as ma
+import pytest
+from flask import Flask
+from lesoon_common.dataclass.req import PageParam
+from lesoon_common.test import ft
+
+from lesoon_restful.dbengine.memory import MemoryService
+from lesoon_restful.dbengine.memory.index import HashIndex
+from lesoon_restful.dbengine.memory.index import SortedIndex
+from lesoon_restful.exceptions import ItemNotFound
+from lesoon_restful.filters import EqualFilter
+from lesoon_restful.utils.slow_query import get_slow_query_log
+
+
+class FooSchema(ma.Schema):
+    id = ma.fields.Int()
+    name = ma.fields.Str()
+    age = ma.fields.Int()
+
+
+class FooFactory(ft.Factory):
+    name = ft.Faker('random_element', elements=('a', 'b', 'c'))
+    age = ft.Faker('pyint', max_value=100)
+
+
+class TestMemoryServiceIndex:
+
+    @pytest.fixture(autouse=True)
+    def setup_method(self):
+
+        class FooService(MemoryService):
+
+            class Meta:
+                schema = FooSchema
+
+        class IndexedFooService(MemoryService):
+
+            class Meta:
+                schema = FooSchema
+                hash_indexes = ('name',)
+                sorted_indexes = ('age',)
+
+        self.service = FooService()
+        self.indexed_service = IndexedFooService()
+        for foo in ft.build_batch(dict, size=50, FACTORY_CLASS=FooFactory):
+            self.service.create(dict(foo))
+            self.indexed_service.create(dict(foo))
+
+    def _compare(self, where: dict):
+        expected = self.service.instances(
+            where=tuple(self.service._convert_filters(where)))
+        actual = self.indexed_service.instances(
+            where=tuple(self.indexed_service._convert_filters(where)))
+        assert list(actual) == list(expected)
+
+    def test_init_indexes(self):
+        assert isinstance(self.indexed_service._indexes['name'][0], HashIndex)
+        assert isinstance(self.indexed_service._indexes['age'][0], SortedIndex)
+
+    def test_filter_by_index(self):
+        self._compare({'name': 'a'})
+        self._compare({'name': {'$in': 'a,b'}})
+        self._compare({'age': {'$gte': 20, '$lt': 60}})
+        self._compare({'name': 'b', 'age': {'$lte': 50}})
+
+    def test_index_maintain(self):
+        where = tuple(
+            self.indexed_service._convert_filters({'age': {
+                '$gt': 100
+            }}))
+        self.indexed_service.update({'id': 1, 'age': 200})
+        assert [i['id'] for i in self.indexed_service.instances(where=where)
+               ] == [1]
+
+        self.indexed_service.delete(1)
+        assert list(self.indexed_service.instances(where=where)) == []
+
+    def test_bulk_index(self):
+        foos = ft.build_batch(dict, size=200, FACTORY_CLASS=FooFactory)
+        # 乱序的显式id, 索引命中结果需与全量扫描保持写入顺序
+        ids = list(range(1000, 1200))
+        random.shuffle(ids)
+        for id_, foo in zip(ids, foos):
+            foo['id'] = id_
+        self.service.create([dict(foo) for foo in foos])
+        self.indexed_service.create([dict(foo) for foo in foos])
+
+        index = self.indexed_service._indexes['age'][0]
+        assert index._keys == sorted(index._keys)
+        assert len(index._keys) == 250
+        self._compare({'name': 'a'})
+        self._compare({'age': {'$gte': 20, '$lt': 60}})
+
+        self.indexed_service.update({'id': ids[0], 'age': 30})
+        self.service.update({'id': ids[0], 'age': 30})
+        self._compare({'age': 30})
+
+    def test_create_existing_id(self):
+        # 以已存在的id写入时覆盖原记录, 索引不再命中原记录的值
+        for service in (self.service, self.indexed_service):
+            service.create({'id': 1, 'name': 'a', 'age': 1})
+            service.create({'id': 1, 'name': 'b', 'age': 5})
+            service.create([{'id': 2, 'name': 'a', 'age': 2}])
+            service.create([{'id': 2, 'name': 'c', 'age': 6}])
+        self._compare({'name': 'a'})
+        self._compare({'name': {'$in': 'b,c'}})
+        self._compare({'age': {'$lt': 3}})
+        self._compare({'age': {'$gte': 5, '$lte': 6}})
+
+    def test_multi_key_sort(self):
+        sort = tuple(self.service._convert_sort({'name': False, 'age': True}))
+        items = list(self.service.instances(sort=sort))
+        assert items == sorted(sorted(self.service.items.values(),
+                                      key=lambda i: i['age'],
+                                      reverse=True),
+                               key=lambda i: i['name'])
+
+
+class TestMemoryQuery:
+
+    @pytest.fixture(autouse=True)
+    def setup_method(self):
+
+        class FooService(MemoryService):
+
+            class Meta:
+                schema = FooSchema
+
+        self.service = FooService()
+        for foo in ft.build_batch(dict, size=50, FACTORY_CLASS=FooFactory):
+            self.service.create(foo)
+
+    def test_paginate(self):
+        query = self.service.instances()
+        pagination = query.paginate(page=2, per_page=10, if_page=True)
+        assert pagination.total == 50
+        assert pagination.items == list(self.service.items.values())[10:20]
+
+    def test_evaluate_snapshot(self):
+        # 迭代过程中写入不影响已开始的查询
+        items = iter(self.service.instances())
+        next(items)
+        self.service.create({'name': 'a', 'age': 1})
+        self.service.delete(2)
+        assert len(list(items)) == 49
+
+        query = self.service.instances(
+            where=tuple(self.service._convert_filters({'age': {
+                '$gte': 0
+            }})))
+        self.service.create({'name': 'b', 'age': 2})
+        assert query.paginate(page=1, per_page=10, if_page=True).total == 51
+
+    def test_lookup_without_copy(self):
+        # 未命中索引时直接迭代字典视图, 不复制整个数据集
+        items, conditions = self.service._lookup_items(())
+        assert isinstance(items, type({}.values()))
+        assert conditions == []
+
+    def test_paginate_with_sort(self):
+        where = tuple(self.service._convert_filters({'age': {'$gte': 20}}))
+        sort = tuple(self.service._convert_sort({'name': False, 'age': True}))
+        expected = list(self.service.instances(where=where, sort=sort))
+
+        for page in (1, 2, 10):
+            pagination = self.service.instances(
+                where=where, sort=sort).paginate(page=page,
+                                                 per_page=7,
+                                                 if_page=True)
+            assert pagination.total == len(expected)
+            assert pagination.items == expected[(page - 1) * 7:page * 7]
+
+    def test_slow_query(self):
+        self.service.meta.slow_query_threshold = 0
+        page_param = PageParam(page=1, page_size=10)
+        with Flask(__name__).app_context():
+            pagination = self.service.paginated_instances(page_param)
+            [record] = get_slow_query_log().recent()
+        assert len(pagination.items) == 10
+        # 内存服务无模型, 不支持执行计划
+        assert record['model'] is None
+        assert 'NotImplementedError' in record['plan']['error']
+
+    def test_slow_query_without_app_context(self):
+        self.service.meta.slow_query_threshold = 0
+        # 无app上下文时不记录慢查询, 不影响分页查询
+        pagination = self.service.paginated_instances(
+            PageParam(page=1, page_size=10))
+        assert len(pagination.items) == 10
+
+    def test_first(self):
+        sort = tuple(self.service._convert_sort({'age': True}))
+        first = self.service.first(sort=sort)
+        assert first['age'] == max(
+            i['age'] for i in self.service.items.values())
+
+        with pytest.raises(ItemNotFound):
+            self.service.first(
+                where=tuple(self.service._convert_filters({'age': -1})))
+
+
+class TestMemoryServiceSnapshot:
+
+    def test_snapshot(self, tmp_path):
+
+        class FooService(MemoryService):
+
+            class Meta:
+                schema = FooSchema
+                hash_indexes = ('name',)
+
+        service = FooService()
+        for foo in ft.build_batch(dict, size=20, FACTORY_CLASS=FooFactory):
+            service.create(foo)
+
+        path = str(tmp_path / 'foo.snapshot')
+        service.save_snapshot(path)
+
+        FooService.meta.snapshot_path = path
+        restored = FooService()
+        assert restored.items == service.items
+        assert restored.id_sequence == service.id_sequence
+
+        where = tuple(restored._convert_filters({'name': 'a'}))
+        assert list(restored.instances(where=where)) == list(
+            service.instances(where=where))
+
+    def test_concurrent_snapshot(self, tmp_path, monkeypatch):
+
+        class FooService(MemoryService):
+
+            class Meta:
+                schema = FooSchema
+
+        service = FooService()
+        for foo in ft.build_batch(dict, size=20, FACTORY_CLASS=FooFactory):
+            service.create(foo)
+
+        path = str(tmp_path / 'foo.snapshot')
+        dump = pickle.dump
+
+        def concurrent_dump(obj, file, **kwargs):
+            # 写入期间另一保存过程完成
+            monkeypatch.setattr(pickle, 'dump', dump)
+            service.save_snapshot(path)
+            dump(obj, file, **kwargs)
+
+        monkeypatch.setattr(pickle, 'dump', concurrent_dump)
+        service.save_snapshot(path)
+
+        # 并发保存各自写入临时文件, 快照完整且无残留的临时文件
+        assert os.listdir(tmp_path) == ['foo.snapshot']
+        restored = FooService()
+        restored.load_snapshot(path)
+        assert restored.items == service.items
+
+
+class TestThreadSafeMemoryService:
+
+    def test_concurrent_read_write(self):
+
+        class FooService(MemoryService):
+
+            class Meta:
+                schema = FooSchema
+                hash_indexes = ('name',)
+                thread_safe = True
+
+        service = FooService()
+        for foo in ft.build_batch(dict, size=100, FACTORY_CLASS=FooFactory):
+            service.create(foo)
+
+        errors = []
+        where = tuple(service._convert_filters({'name': {'$in': 'a,b,c'}}))
+        sort = tuple(service._convert_sort({'age': True}))
+
+        def writer():
+            try:
+                for _ in range(200):
+                    item = service.create({'name': 'a', 'age': 1})
+                    service.update({'id': item['id'], 'age': 2})
+                    service.delete(item['id'])
+                    service.create({'name': 'b', 'age': 3})
+            except Exception as e:  # noqa
+                errors.append(e)
+
+        def reader():
+            try:
+                for _ in range(200):
+                    pagination = service.instances(
+                        where=where, sort=sort).paginate(page=1,
+                                                         per_page=10,
+                                                         if_page=True)
+                    assert pagination.total >= 100
+                    assert len(pagination.items) == 10
+            except Exception as e:  # noqa
+                errors.append(e)
+
+        threads = [threading.Thread(target=writer) for _ in range(4)]
+        threads += [threading.Thread(target=reader) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert not errors
+        assert len(service.items) == 100 + 4 * 200
+        assert service.id_sequence == 100 + 4 * 200 * 2
+        assert len(service._indexes['name'][0].lookup(
+            EqualFilter('eq', ma.fields.Str(), 'name'), 'b')) >= 4 * 200
+
+    def test_update_deleted(self):
+
+        class FooService(MemoryService):
+
+            class Meta:
+                schema = FooSchema
+                hash_indexes = ('name',)
+                thread_safe = True
+
+        service = FooService()
+        item = service.create({'name': 'a', 'age': 1})
+        # 读取后被其他线程删除
+        service.delete(item['id'])
+        with pytest.raises(ItemNotFound):
+            service._update_one(item, {'name': 'b'})
+        assert service.read(item['id']) is None
+        assert list(
+            service.instances(
+                where=tuple(service._convert_filters({'name': 'b'})))) == []
+
+    def test_evaluate_with_read_lock(self):
+
+        class FooService(MemoryService):
+
+            class Meta:
+                schema = FooSchema
+                thread_safe = True
+
+        service = FooService()
+        for foo in ft.build_batch(dict, size=10, FACTORY_CLASS=FooFactory):
+            service.create(foo)
+
+        query = service.instances()
+        evaluated = threading.Event()
+        with service._write_lock():
+            thread = threading.Thread(
+                target=lambda: evaluated.set() if list(query) else None)
+            thread.start()
+            # 求值需等待写锁释放
+            assert not evaluated.wait(0.1)
+            service.create({'name': 'a', 'age': 1})
+        thread.join()
+        assert evaluated.is_set()
+        assert len(list(query)) == 11
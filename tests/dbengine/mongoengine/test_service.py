@@ -0,0 +1,263 @@
+import mongoengine
+import pytest
+from bson import ObjectId
+from flask import Flask
+from lesoon_common.dataclass.req import PageParam
+from lesoon_common.extensions import mg
+from lesoon_common.model import MongoAutoSchema
+from pymongo.errors import BulkWriteError
+
+from lesoon_restful.dbengine.mongoengine import filters
+from lesoon_restful.dbengine.mongoengine.filters import compile_raw_query
+from lesoon_restful.dbengine.mongoengine.service import MongoEngineService
+from lesoon_restful.exceptions import ItemNotFound
+from lesoon_restful.utils.slow_query import get_slow_query_log
+
+mongomock = pytest.importorskip('mongomock')
+
+
+def validate_rating(value: int):
+    if not 0 <= value <= 5:
+        raise mongoengine.ValidationError('评分需在0-5之间')
+
+
+class MongoBook(mg.Document):
+    title = mongoengine.StringField(required=True, unique=True)
+    year_published = mongoengine.IntField(db_field='year')
+    rating = mongoengine.IntField(validation=validate_rating)
+
+
+class MongoBookSchema(MongoAutoSchema):
+
+    class Meta(MongoAutoSchema.Meta):
+        model = MongoBook
+
+
+class MongoBookService(MongoEngineService):
+
+    class Meta:
+        model = MongoBook
+        schema = MongoBookSchema
+
+
+@pytest.fixture(scope='module', autouse=True)
+def connection():
+    mongoengine.connect('lesoon_test',
+                        host='mongodb://localhost',
+                        mongo_client_class=mongomock.MongoClient)
+    yield
+    mongoengine.disconnect()
+
+
+class TestMongoEngineService:
+
+    @pytest.fixture(autouse=True)
+    def setup_method(self):
+        MongoBook.drop_collection()
+        self.service = MongoBookService()
+        self.books = [
+            MongoBook(title=f'book-{i}',
+                      year_published=2000 + i % 3,
+                      rating=i % 5).save() for i in range(10)
+        ]
+
+    def test_slow_query(self):
+
+        class SlowBookService(MongoBookService):
+
+            class Meta:
+                slow_query_threshold = 0
+
+        service = SlowBookService()
+        where = tuple(service._convert_filters({'rating': {'$gte': 1}}))
+        sort = tuple(service._convert_sort({'rating': True}))
+        with Flask(__name__).app_context():
+            pagination = service._paginate(
+                service.instances(where=where, sort=sort),
+                PageParam(page=1, page_size=3, where=where, sort=sort))
+            [record] = get_slow_query_log().recent()
+        assert [book.rating for book in pagination.items] == [4, 4, 3]
+        assert record['model'] == 'MongoBook'
+        assert record['signature'] == 'rating:gte|-rating'
+        # mongomock不支持explain, 获取执行计划失败时记录错误信息
+        if 'error' not in record['plan']:
+            assert record['statement']['filter'] == {'rating': {'$gte': 1}}
+
+    def test_as_pymongo(self):
+        schema = MongoBookSchema(many=True)
+        sort = tuple(self.service._convert_sort({'title': True}))
+
+        def paginate(service, page: int):
+            where = tuple(service._convert_filters({'rating': {'$gte': 1}}))
+            query = service.instances(where=where, sort=sort)
+            return service._query_get_paginated_items(query,
+                                                      page=page,
+                                                      page_size=3,
+                                                      if_page=True)
+
+        for facet in (False, True):
+
+            class RawBookService(MongoBookService):
+
+                class Meta:
+                    as_pymongo = True
+                    facet_paginate = facet
+
+            service = RawBookService()
+            for page in (1, 3):
+                expected = paginate(self.service, page)
+                pagination = paginate(service, page)
+                # 原始文档的db_field及_id转换为属性名
+                assert pagination.items[0].keys() == {
+                    'id', 'title', 'year_published', 'rating'
+                }
+                assert pagination.total == expected.total == 8
+                assert schema.dump(pagination.items) == schema.dump(
+                    expected.items)
+
+    def _compile(self, *wheres: dict):
+        conditions = tuple(
+            condition for where in wheres
+            for condition in self.service._convert_filters(where))
+        raw = compile_raw_query(conditions, MongoBook)
+        # 原生查询文档与关键字参数解析的Q查询结果一致
+        keyword_query = super(MongoEngineService,
+                              self.service).instances(where=conditions)
+        raw_ids = [book.id for book in self.service.instances(where=conditions)]
+        assert raw_ids == [book.id for book in keyword_query]
+        return raw, raw_ids
+
+    def test_compile_raw_query(self):
+        raw, ids = self._compile({'rating': {'$ne': 3, '$in': '1,2,3'}})
+        assert raw == {'rating': {'$ne': 3, '$in': [1, 2, 3]}}
+        assert ids == [book.id for book in self.books if book.rating in (1, 2)]
+
+        raw, ids = self._compile({'yearPublished': {'$gt': 2000, '$lte': 2001}})
+        assert raw == {'year': {'$gt': 2000, '$lte': 2001}}
+        assert len(ids) == 3
+
+        titles = {'title': {'$nin': 'book-1,book-2'}}
+        ratings = {'rating': {'$lt': 2, '$gte': 1}}
+        for where in ({'title': 'book-2'}, titles, ratings):
+            assert self._compile(where)[1]
+
+    def test_compile_raw_query_regex(self):
+        for name, value in (('contains', 'k-1'), ('icontains', 'K-1'),
+                            ('startswith', 'book-'), ('istartswith', 'BOOK-'),
+                            ('endswith', '-3'), ('iendswith', 'K-3')):
+            raw, ids = self._compile({'title': {f'${name}': value}})
+            assert list(raw['title']) == ['$regex']
+            assert ids
+
+    def test_compile_raw_query_duplicated(self):
+        # 重复的操作符以$and追加, 不相互覆盖
+        low, high = {'rating': {'$gte': 1}}, {'rating': {'$gte': 3}}
+        raw, ids = self._compile(low, high)
+        assert raw == {'rating': {'$gte': 1}, '$and': [{'rating': {'$gte': 3}}]}
+        assert ids == [book.id for book in self.books if book.rating >= 3]
+
+        # 同一字段的多个正则条件均编译为$regex
+        title = {'title': {'$startswith': 'book', '$endswith': '1'}}
+        raw, ids = self._compile(title)
+        assert len(raw['$and']) == 1
+        assert ids == [self.books[1].id]
+
+    def test_greater_than_filter(self):
+        field_filters = self.service.filters['rating']
+        assert isinstance(field_filters['gt'], filters.GreaterThanFilter)
+        assert isinstance(field_filters['gte'], filters.GreaterThanEqualFilter)
+        raw, ids = self._compile({'rating': {'$gt': 3}})
+        assert raw == {'rating': {'$gt': 3}}
+        assert ids == [book.id for book in self.books if book.rating > 3]
+
+    def _read(self, book: MongoBook) -> MongoBook:
+        return MongoBook.objects.get(id=book.id)
+
+    def test_update_many(self):
+        changes = [{'id': str(book.id), 'rating': 5} for book in self.books[:3]]
+        items = self.service.update(changes)
+        assert [item.id for item in items] == [b.id for b in self.books[:3]]
+        assert [self._read(book).rating for book in self.books[:3]] == [5] * 3
+        # 写入后清除变更记录, 再次保存不会重复写入
+        assert all(not item._changed_fields for item in items)  # noqa
+
+    def test_update_many_not_found(self):
+        book = self.books[0]
+        with pytest.raises(ItemNotFound):
+            self.service.update([{
+                'id': str(book.id),
+                'rating': 5
+            }, {
+                'id': str(ObjectId()),
+                'rating': 5
+            }])
+        assert self._read(book).rating == book.rating
+
+    def test_update_many_validation(self):
+        first, second = self.books[:2]
+        with pytest.raises(mongoengine.ValidationError):
+            self.service.update([{
+                'id': str(first.id),
+                'rating': 5
+            }, {
+                'id': str(second.id),
+                'rating': 10
+            }])
+        # 写入前完成校验, 任一文档校验失败时不写入
+        assert self._read(first).rating == first.rating
+        assert self._read(second).rating == second.rating
+
+    def test_update_many_bulk_write_error(self):
+        for ordered in (True, False):
+
+            class BookService(MongoBookService):
+
+                class Meta:
+                    bulk_write_ordered = ordered
+
+            first, second = self.books[:2]
+            title = f'ordered-{ordered}'
+            with pytest.raises(BulkWriteError):
+                # 首条更新违反唯一索引
+                BookService().update([{
+                    'id': str(first.id),
+                    'title': self.books[-1].title
+                }, {
+                    'id': str(second.id),
+                    'title': title
+                }])
+            assert self._read(first).title == first.title
+            # 有序执行在首个错误处停止, 无序执行继续其余更新
+            assert (self._read(second).title == title) is not ordered
+
+    def test_facet_paginate(self):
+
+        class FacetBookService(MongoBookService):
+
+            class Meta:
+                facet_paginate = True
+
+        facet_service = FacetBookService()
+        schema = MongoBookSchema(many=True)
+        order = {'rating': True, 'title': False}
+        sort = tuple(self.service._convert_sort(order))
+
+        def paginate(service, where: dict, page: int):
+            where = tuple(service._convert_filters(where))
+            query = service.instances(where=where, sort=sort)
+            return service._query_get_paginated_items(query,
+                                                      page=page,
+                                                      page_size=3,
+                                                      if_page=True)
+
+        rated, missing = {'rating': {'$gte': 1}}, {'title': 'none'}
+        for where, page in (({}, 1), (rated, 1), (rated, 3), (missing, 1)):
+            expected = paginate(self.service, where, page)
+            pagination = paginate(facet_service, where, page)
+            assert pagination.total == expected.total
+            assert schema.dump(pagination.items) == schema.dump(expected.items)
+
+        # 超出末页时返回空页及总数
+        pagination = paginate(facet_service, rated, 4)
+        assert pagination.total == 8
+        assert pagination.items == []
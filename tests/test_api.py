@@ -31,10 +31,30 @@ class BarResource(Resource):
         name = 'bar'
 
 
+class MissingError(Exception):
+    pass
+
+
+class ErrorResource(Resource):
+
+    @Route.GET
+    def missing(self):
+        raise MissingError()
+
+    @Route.GET
+    def broken(self):
+        raise RuntimeError()
+
+    class Meta:
+        name = 'error'
+
+
 class TestApi:
 
     def setup_method(self):
         FooResource.api = None
+        BarResource.api = None
+        ErrorResource.api = None
 
     def test_add_resource(self, app: LesoonFlask,
                           test_client: LesoonTestClient):
@@ -67,11 +87,56 @@ class TestApi:
 
         assert response.status_code == 418
 
+    def test_batch(self, app: LesoonFlask, test_client: LesoonTestClient):
+        api = Api(app, batch_rule='/batch')
+        api.add_resource(FooResource)
+        api.add_resource(BarResource)
+
+        response = test_client.post('/batch',
+                                    json=[{
+                                        'resource': 'foo',
+                                        'relation': 'foo'
+                                    }, {
+                                        'resource': 'bar',
+                                        'relation': 'foo'
+                                    }])
+        assert response.status_code == 200
+        assert response.get_json()['result'] == [{
+            'status': 200,
+            'body': 'foo'
+        }, {
+            'status': 200,
+            'body': 'bar'
+        }]
+
+    def test_metrics(self, app: LesoonFlask, test_client: LesoonTestClient):
+        app.register_error_handler(MissingError, lambda e: ('missing', 404))
+        api = Api(app, metrics_rule='/metrics')
+        api.add_resource(FooResource)
+        api.add_resource(ErrorResource)
+
+        assert test_client.get('/foo/foo').status_code == 200
+        assert test_client.get('/error/missing').status_code == 404
+        with pytest.raises(RuntimeError):
+            test_client.get('/error/broken')
+
+        lines = test_client.get('/metrics').get_data(as_text=True).splitlines()
+
+        def requests_total(endpoint: str, status: int) -> str:
+            return (f'lesoon_restful_requests_total{{endpoint="{endpoint}",'
+                    f'method="GET",status="{status}"}} 1')
+
+        assert requests_total('foo_foo', 200) in lines
+        # 错误处理器返回的状态码
+        assert requests_total('error_missing', 404) in lines
+        assert requests_total('error_broken', 500) in lines
+
 
 class TestApiWithBlueprint:
 
     def setup_method(self):
         FooResource.api = None
+        BarResource.api = None
 
     def test_api_blueprint(self, app: LesoonFlask,
                            test_client: LesoonTestClient):
@@ -0,0 +1,153 @@
+import json
+
+import marshmallow as ma
+import pytest
+from lesoon_common import RequestError
+from webargs import fields
+
+from lesoon_restful.parser import WebArgParser
+
+
+class CountingParser(WebArgParser):
+    """ 记录常规解析次数."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.parse_count = 0
+
+    def parse(self, *args, **kwargs):
+        self.parse_count += 1
+        return super().parse(*args, **kwargs)
+
+
+class FullParser(CountingParser):
+    FAST_PARSE = False
+
+
+class TestFastArgs:
+
+    @pytest.fixture(autouse=True)
+    def setup_method(self, app):
+        self.app = app
+        self.parser = CountingParser()
+        self.full_parser = FullParser()
+
+    def _parse(self,
+               parser: WebArgParser,
+               argmap: dict,
+               path: str = '/',
+               request: dict = None,
+               **kwargs):
+
+        @parser.use_args(argmap, **kwargs)
+        def view(args):
+            return args
+
+        parser.parse_count = 0
+        with self.app.test_request_context(path, **(request or {})):
+            return view()
+
+    def _compare(self,
+                 argmap: dict,
+                 path: str = '/',
+                 request: dict = None,
+                 **kwargs):
+        """ 快速解析与常规解析结果一致, 返回 (解析结果, 是否回退常规解析)."""
+        args = self._parse(self.parser, argmap, path, request, **kwargs)
+        expected = self._parse(self.full_parser, argmap, path, request,
+                               **kwargs)
+        assert args == expected
+        return args, self.parser.parse_count > 0
+
+    def _compare_error(self,
+                       argmap: dict,
+                       path: str = '/',
+                       request: dict = None,
+                       **kwargs):
+        """ 快速解析校验失败时回退常规解析, 抛出相同的错误."""
+        with pytest.raises(RequestError) as e:
+            self._parse(self.parser, argmap, path, request, **kwargs)
+        with pytest.raises(RequestError) as expected:
+            self._parse(self.full_parser, argmap, path, request, **kwargs)
+        assert e.value.msg == expected.value.msg
+        assert self.parser.parse_count == 1
+        return json.loads(e.value.msg)
+
+    def test_query_delimited_list(self):
+        argmap = {'ids': fields.DelimitedList(fields.Int())}
+        args, fallback = self._compare(argmap, '/?ids=1,2,3', location='query')
+        assert args == {'ids': [1, 2, 3]}
+        assert not fallback
+
+        args, fallback = self._compare(argmap, '/', location='query')
+        assert args == {}
+        assert not fallback
+
+    def test_list_json(self):
+        argmap = {'ids': fields.List(fields.Raw())}
+        request = {'method': 'DELETE', 'json': [1, 'a', 3]}
+        args, fallback = self._compare(argmap,
+                                       request=request,
+                                       location='list_json')
+        assert args == {'ids': [1, 'a', 3]}
+        assert not fallback
+
+        args, fallback = self._compare(argmap,
+                                       request={'method': 'DELETE'},
+                                       location='list_json')
+        assert args == {}
+
+    def test_json_unknown(self):
+        argmap = {'name': fields.Str()}
+        request = {'method': 'POST', 'json': {'name': 'a'}}
+        args, fallback = self._compare(argmap,
+                                       request=request,
+                                       location='json',
+                                       unknown=ma.RAISE)
+        assert args == {'name': 'a'}
+        assert not fallback
+
+        request = {'method': 'POST', 'json': {'name': 'a', 'age': 1}}
+        messages = self._compare_error(argmap,
+                                       request=request,
+                                       location='json',
+                                       unknown=ma.RAISE)
+        assert 'age' in messages['json']
+
+    def test_missing_required(self):
+        argmap = {'name': fields.Str(required=True), 'age': fields.Int()}
+        request = {'method': 'POST', 'json': {'age': 1}}
+        messages = self._compare_error(argmap, request=request, location='json')
+        assert 'name' in messages['json']
+
+    def test_validate(self):
+        argmap = {'age': fields.Int(validate=ma.validate.Range(min=0))}
+        args, fallback = self._compare(argmap, '/?age=1', location='query')
+        assert args == {'age': 1}
+        assert not fallback
+
+        messages = self._compare_error(argmap, '/?age=-1', location='query')
+        assert 'age' in messages['query']
+
+        # use_args的validate参数校验解析结果
+        messages = self._compare_error({'age': fields.Int()},
+                                       '/?age=0',
+                                       location='query',
+                                       validate=lambda args: args['age'] > 0)
+        assert messages
+
+    def test_data_key(self):
+        argmap = {
+            'page_size': fields.Int(data_key='pageSize'),
+            'name': fields.Str(attribute='title')
+        }
+        args, fallback = self._compare(argmap,
+                                       '/?pageSize=2&name=a',
+                                       location='query')
+        assert args == {'page_size': 2, 'title': 'a'}
+        assert not fallback
+
+    def test_fast_parse_disabled(self):
+        argmap = {'ids': fields.DelimitedList(fields.Int())}
+        self._parse(self.full_parser, argmap, '/?ids=1', location='query')
+        assert self.full_parser.parse_count == 1
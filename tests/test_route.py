@@ -1,3 +1,5 @@
+import asyncio
+import inspect
 import typing as t
 from functools import wraps
 from unittest import mock
@@ -50,6 +52,24 @@ class TestRoute:
             with app.test_request_context('/foo/1/'):
                 assert view(id=1) == {'resource': 'foo', 'item': 1}
 
+    def test_async_item_route(self, app: LesoonFlask,
+                              test_client: LesoonTestClient):
+
+        async def read(resource, item):
+            return {'resource': resource.meta.name, 'item': item}
+
+        async def read_or_raise(id_):
+            return id_
+
+        route = ItemRoute.GET('', rel='test')(read)
+
+        view = route.view_factory('', FooResource)
+        assert inspect.iscoroutinefunction(view)
+        with mock.patch.object(FooResource, 'service') as mock_service:
+            mock_service.read_or_raise = read_or_raise
+            with app.test_request_context('/foo/1/'):
+                assert asyncio.run(view(id=1)) == {'resource': 'foo', 'item': 1}
+
 
 class TestRouteWithResource:
 
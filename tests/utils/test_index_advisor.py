@@ -0,0 +1,110 @@
+import json
+
+import marshmallow as ma
+
+from lesoon_restful.dbengine.memory import MemoryService
+from lesoon_restful.utils.base import AttributeDict
+from lesoon_restful.utils.index_advisor import check_declared
+from lesoon_restful.utils.index_advisor import is_covered
+from lesoon_restful.utils.index_advisor import replay
+
+
+class Filter:
+
+    def __init__(self, attribute: str):
+        self.attribute = attribute
+
+
+class Book:
+    id = title = rating = year_published = None
+
+
+class BookService:
+    model = Book
+    filters = {
+        name: {
+            'eq': Filter(name)
+        } for name in ('id', 'title', 'rating', 'year_published')
+    }
+    _sort_fields = {'rating': None}
+
+    def indexes(self):
+        return [('id',), ('title', 'rating')]
+
+
+class BookResource:
+    meta = AttributeDict(name='book')
+    route_prefix = '/book'
+    service = BookService()
+
+
+class FooSchema(ma.Schema):
+    id = ma.fields.Int()
+    name = ma.fields.Str()
+    age = ma.fields.Int()
+
+
+class FooService(MemoryService):
+
+    class Meta:
+        schema = FooSchema
+        hash_indexes = ('id', 'name')
+
+
+class FooResource:
+    meta = AttributeDict(name='foo')
+    route_prefix = '/foo'
+    service = FooService()
+
+
+class TestIndexAdvisor:
+
+    def test_is_covered(self):
+        indexes = [('title', 'rating')]
+        assert is_covered(('title',), indexes)
+        assert is_covered(('title', 'rating'), indexes)
+        assert not is_covered(('rating',), indexes)
+
+    def test_check_declared(self):
+        advices = check_declared([BookResource])
+        assert [(a.fields, a.reason) for a in advices
+               ] == [(('rating',), 'filter'), (('year_published',), 'filter')]
+
+    def test_replay(self):
+        where = {'rating': 5, 'yearPublished': {'$gte': 2000}}
+        lines = [
+            json.dumps({
+                'resource': 'book',
+                'where': where,
+                'sort': {
+                    'title': True
+                }
+            }),
+            f'/book/?where={json.dumps(where)}&sort={json.dumps({"title": True})}',
+            '/book?where={"title": "foo"}&sort={"rating": false}',
+            '/author?where={"name": "foo"}',
+        ]
+        advices = replay({'book': BookResource}, lines)
+        assert [(a.fields, a.count) for a in advices
+               ] == [(('rating', 'title', 'year_published'), 2)]
+
+    def test_memory_service(self):
+        assert FooResource.service.indexes() == [('id',), ('name',)]
+        advices = check_declared([FooResource])
+        assert [(a.fields, a.reason) for a in advices] == [(('age',), 'filter')]
+
+        lines = [
+            json.dumps({
+                'resource': 'foo',
+                'where': {
+                    'age': {
+                        '$gte': 1
+                    }
+                },
+                'sort': {
+                    'name': True
+                }
+            })
+        ]
+        advices = replay({'foo': FooResource}, lines)
+        assert [(a.fields, a.count) for a in advices] == [(('name', 'age'), 1)]
@@ -0,0 +1,123 @@
+import logging
+
+import pytest
+from flask import Flask
+from sqlalchemy import create_engine
+from sqlalchemy import event
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from lesoon_restful.api import Api
+from lesoon_restful.exceptions import QueryBudgetExceeded
+from lesoon_restful.resource import Resource
+from lesoon_restful.route import Route
+from lesoon_restful.utils.instrument import _after_cursor_execute
+from lesoon_restful.utils.instrument import collect_queries
+from lesoon_restful.utils.instrument import QUERY_COUNT_HEADER
+from lesoon_restful.utils.instrument import statement_cache_stats
+from lesoon_restful.utils.instrument import statement_shape
+
+engine = create_engine('sqlite://')
+
+
+def execute(times: int) -> str:
+    with engine.connect() as conn:
+        for _ in range(times):
+            conn.execute(text('SELECT 1'))
+    return 'ok'
+
+
+class QueryResource(Resource):
+
+    @Route.GET
+    def once(self):
+        return execute(1)
+
+    @Route.GET
+    def many(self):
+        return execute(3)
+
+    class Meta:
+        name = 'query'
+        query_budget = {'many': 2}
+
+
+def create_app(**config) -> Flask:
+    app = Flask(__name__)
+    app.config.update(TESTING=True, **config)
+    QueryResource.api = None
+    Api(app).add_resource(QueryResource)
+    return app
+
+
+class TestInstrument:
+
+    def test_statement_shape(self):
+        shape = 'SELECT * FROM foo WHERE id IN (...)'
+        assert statement_shape(
+            'SELECT *\n  FROM foo WHERE id IN (?, ?)') == shape
+        assert statement_shape('SELECT * FROM foo WHERE id IN (?)') == shape
+
+    def test_collect_queries(self):
+        engine = create_engine('sqlite://')
+        with engine.connect() as conn:
+            conn.execute(text('SELECT 1'))
+
+            with collect_queries() as stats:
+                for i in range(1, 4):
+                    conn.execute(
+                        text('SELECT 1 WHERE 1 IN ({})'.format(', '.join(['1'] *
+                                                                         i))))
+                conn.execute(text('SELECT 2'))
+
+            conn.execute(text('SELECT 3'))
+
+        assert stats.count == 4
+        assert stats.repeated() == [('SELECT 1 WHERE 1 IN (...)', 3)]
+
+    def test_cache_stats_opt_in(self):
+        if event.contains(Engine, 'after_cursor_execute',
+                          _after_cursor_execute):
+            event.remove(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+        Api(Flask(__name__))
+        assert not event.contains(Engine, 'after_cursor_execute',
+                                  _after_cursor_execute)
+
+        Api(Flask(__name__), cache_stats=True)
+        engine = create_engine('sqlite://')
+        with engine.connect() as conn:
+            for _ in range(2):
+                conn.execute(text('SELECT 1'))
+        stats = statement_cache_stats(engine)
+        assert (stats.hits, stats.misses) == (1, 1)
+
+    def test_query_count_header(self):
+        client = create_app(DEBUG=True).test_client()
+        assert client.get('/query/once').headers[QUERY_COUNT_HEADER] == '1'
+        assert client.get('/query/many').headers[QUERY_COUNT_HEADER] == '3'
+
+        # 非调试模式下开启统计不返回响应头
+        client = create_app(RESTFUL_QUERY_INSTRUMENT=True).test_client()
+        assert QUERY_COUNT_HEADER not in client.get('/query/once').headers
+
+    def test_query_budget_warn(self, caplog):
+        app = create_app(RESTFUL_QUERY_INSTRUMENT=True)
+        client = app.test_client()
+        with caplog.at_level(logging.WARNING, logger=app.logger.name):
+            assert client.get('/query/once').status_code == 200
+            assert not caplog.records
+            assert client.get('/query/many').status_code == 200
+        [record] = caplog.records
+        assert 'query_many 执行SQL 3次, 超出预算2次' in record.getMessage()
+
+    def test_query_budget_raise(self):
+        client = create_app(RESTFUL_QUERY_INSTRUMENT=True,
+                            RESTFUL_QUERY_BUDGET_RAISE=True).test_client()
+        assert client.get('/query/once').status_code == 200
+        with pytest.raises(QueryBudgetExceeded):
+            client.get('/query/many')
+
+        # 未开启统计时不检查预算
+        client = create_app(RESTFUL_QUERY_BUDGET_RAISE=True).test_client()
+        assert client.get('/query/many').status_code == 200
@@ -0,0 +1,61 @@
+import threading
+import time
+
+from lesoon_restful.utils.lock import RWLock
+
+
+class TestRWLock:
+
+    def test_concurrent_readers(self):
+        lock = RWLock()
+        barrier = threading.Barrier(3, timeout=5)
+
+        def reader():
+            with lock.read_lock():
+                barrier.wait()
+
+        threads = [threading.Thread(target=reader) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert not barrier.broken
+
+    def test_exclusive_writer(self):
+        lock = RWLock()
+        events = []
+
+        def writer():
+            with lock.write_lock():
+                events.append('write_start')
+                time.sleep(0.05)
+                events.append('write_end')
+
+        def reader():
+            with lock.read_lock():
+                events.append('read')
+
+        lock.acquire_read()
+        w = threading.Thread(target=writer)
+        w.start()
+        time.sleep(0.02)
+        r = threading.Thread(target=reader)
+        r.start()
+        time.sleep(0.02)
+        # 读者等待写者, 写者等待当前读锁释放
+        assert events == []
+        lock.release_read()
+        w.join()
+        r.join()
+        assert events == ['write_start', 'write_end', 'read']
+
+    def test_reentrant(self):
+        lock = RWLock()
+        with lock.write_lock():
+            with lock.write_lock():
+                with lock.read_lock():
+                    pass
+        with lock.read_lock():
+            with lock.read_lock():
+                pass
+        assert lock._writer is None and lock._readers == 0
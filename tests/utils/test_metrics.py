@@ -0,0 +1,123 @@
+from lesoon_common.test import ft
+from sqlalchemy import create_engine
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from tests.dbengine.alchemy.models import Book
+from tests.dbengine.alchemy.models import BookFactory
+from tests.dbengine.alchemy.models import BookSchema
+
+from lesoon_restful.api import Api
+from lesoon_restful.resource import ModelResource
+from lesoon_restful.utils.metrics import _lifecycle_var
+from lesoon_restful.utils.metrics import _timings_var
+from lesoon_restful.utils.metrics import install
+from lesoon_restful.utils.metrics import MetricsRegistry
+from lesoon_restful.utils.metrics import SessionLifecycle
+from lesoon_restful.utils.metrics import timed_phase
+
+
+class TestMetrics:
+
+    def test_render(self):
+        registry = MetricsRegistry(buckets=(0.1, 1.0))
+        registry.observe('foo_instances', 'GET', 200, {'total': 0.05})
+        registry.observe('foo_instances', 'GET', 200, {'total': 0.5})
+        registry.observe('foo_instances', 'GET', 500, {'total': 5})
+
+        lines = registry.render().splitlines()
+        assert ('lesoon_restful_requests_total{endpoint="foo_instances",'
+                'method="GET",status="200"} 2') in lines
+        prefix = ('lesoon_restful_request_duration_seconds_bucket'
+                  '{endpoint="foo_instances",phase="total",')
+        assert f'{prefix}le="0.1"}} 1' in lines
+        assert f'{prefix}le="1.0"}} 2' in lines
+        assert f'{prefix}le="+Inf"}} 3' in lines
+        assert ('lesoon_restful_request_duration_seconds_count'
+                '{endpoint="foo_instances",phase="total"} 3') in lines
+
+    def test_timed_phase(self):
+        # 未开启统计时不记录
+        with timed_phase('parse'):
+            pass
+
+        timings: dict = {}
+        token = _timings_var.set(timings)
+        try:
+            with timed_phase('parse'):
+                pass
+            with timed_phase('parse'):
+                pass
+        finally:
+            _timings_var.reset(token)
+        assert list(timings) == ['parse']
+        assert timings['parse'] >= 0
+
+    def test_session_events(self):
+        registry = MetricsRegistry()
+        registry.observe('foo_create', 'POST', 200, {}, {'flush': 3})
+        registry.observe('foo_create', 'POST', 200, {}, {
+            'flush': 2,
+            'commit': 1
+        })
+
+        lines = registry.render().splitlines()
+        assert ('lesoon_restful_session_events_total{endpoint="foo_create",'
+                'event="flush"} 5') in lines
+        assert ('lesoon_restful_session_events_total{endpoint="foo_create",'
+                'event="commit"} 1') in lines
+
+    def test_session_lifecycle(self):
+        timings: dict = {}
+        # 无连接活动时不记录
+        SessionLifecycle().finish(timings)
+        assert timings == {}
+
+        lifecycle = SessionLifecycle()
+        lifecycle.pool_wait = 0.1
+        lifecycle.connection = 0.2
+        # 未归还的连接计至请求结束
+        lifecycle.connections[1] = 0.0
+        lifecycle.finish(timings)
+        assert timings['pool_wait'] == 0.1
+        assert timings['connection'] > 0.2
+        assert not lifecycle.connections
+
+    def test_sqlalchemy_request(self, app, db, test_client):
+
+        class BookResource(ModelResource):
+
+            class Meta:
+                name = 'book'
+                model = Book
+                schema = BookSchema
+
+        api = Api(app, metrics_rule='/metrics')
+        api.add_resource(BookResource)
+        books = ft.build_batch(dict, size=3, FACTORY_CLASS=BookFactory)
+        assert test_client.post('/book/batch', json=books).status_code == 200
+        assert test_client.get('/book').status_code == 200
+
+        lines = test_client.get('/metrics').get_data(as_text=True).splitlines()
+        for endpoint in ('book_create_many', 'book_instances'):
+            for phase in ('db', 'pool_wait', 'connection', 'transaction'):
+                assert (f'lesoon_restful_request_duration_seconds_count'
+                        f'{{endpoint="{endpoint}",phase="{phase}"}} 1') in lines
+        assert ('lesoon_restful_session_events_total'
+                '{endpoint="book_create_many",event="commit"} 1') in lines
+
+    def test_pool_wait(self):
+        engine = create_engine('sqlite://')
+        install()
+        lifecycle = SessionLifecycle()
+        token = _lifecycle_var.set(lifecycle)
+        try:
+            with Session(engine) as session:
+                session.execute(select(1))
+                pool_wait = lifecycle.pool_wait
+                assert pool_wait > 0
+                # 会话已持有连接, 后续语句不计入等待
+                session.execute(select(2))
+                assert lifecycle.acquiring is None
+                assert lifecycle.pool_wait == pool_wait
+        finally:
+            _lifecycle_var.reset(token)
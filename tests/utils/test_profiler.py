@@ -0,0 +1,38 @@
+import sys
+import time
+
+from lesoon_restful.utils.profiler import StackProfiler
+
+
+def busy(seconds: float):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+class TestStackProfiler:
+
+    def test_signature(self):
+        profiler = StackProfiler(secret='secret')
+        assert profiler.verify(profiler.sign())
+        assert not profiler.verify(profiler.sign(int(time.time()) - 3600))
+        assert not profiler.verify('1:invalid')
+        assert not StackProfiler().verify(profiler.sign())
+
+    def test_sampling(self):
+        profiler = StackProfiler(interval=0.001)
+        profiler.start('foo_slow', sys._getframe())  # noqa
+        try:
+            busy(0.1)
+        finally:
+            profiler.stop()
+
+        collapsed = profiler.collapsed('foo_slow').splitlines()
+        assert collapsed
+        assert all(
+            line.startswith('foo_slow;test_sampling ') for line in collapsed)
+        assert any(';busy ' in line for line in collapsed)
+
+        top = profiler.top_frames('foo_slow')
+        assert top[0]['frame'].startswith('busy ')
+        assert profiler.collapsed('bar') == ''
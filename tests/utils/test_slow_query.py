@@ -0,0 +1,51 @@
+from flask import Flask
+
+from lesoon_restful.filters import Condition
+from lesoon_restful.utils.slow_query import get_slow_query_log
+from lesoon_restful.utils.slow_query import query_signature
+from lesoon_restful.utils.slow_query import SlowQueryLog
+
+
+class Filter:
+
+    def __init__(self, attribute: str, name: str = None):
+        self.attribute = attribute
+        self.name = name
+
+
+class TestSlowQuery:
+
+    def test_signature(self):
+        where = [
+            Condition(Filter('title'), 'foo'),
+            Condition(Filter('rating', 'gte'), 3)
+        ]
+        sort = (('rating', 'rating', True),)
+        assert query_signature(where, sort) == 'rating:gte,title:eq|-rating'
+        # 过滤值不参与签名
+        where = [
+            Condition(Filter('rating', 'gte'), 1),
+            Condition(Filter('title'), 'bar')
+        ]
+        assert query_signature(where, sort) == 'rating:gte,title:eq|-rating'
+        assert query_signature(None, None) == '|'
+
+    def test_log(self):
+        log = SlowQueryLog(maxlen=2)
+        log.record(model='Book', elapsed_ms=1)
+        log.record(model='Author', elapsed_ms=2)
+        log.record(model='Book', elapsed_ms=3)
+
+        assert [r['elapsed_ms'] for r in log.recent()] == [3, 2]
+        assert [r['elapsed_ms'] for r in log.recent(model='Book')] == [3]
+        assert len(log.recent(limit=1)) == 1
+        log.clear()
+        assert log.recent() == []
+
+    def test_get_slow_query_log(self):
+        app = Flask(__name__)
+        app.config['RESTFUL_SLOW_QUERY_LOG_SIZE'] = 5
+        with app.app_context():
+            log = get_slow_query_log()
+            assert log.maxlen == 5
+            assert get_slow_query_log() is log